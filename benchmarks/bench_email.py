@@ -0,0 +1,84 @@
+"""Compares np.vectorize(check_email) with valid_email_mask
+
+Run from the repository root:
+    python benchmarks/bench_email.py --rows 1000000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import validation  # noqa: E402
+from validation import check_email, valid_email_mask  # noqa: E402
+
+
+def make_emails(rows: int, seed: int = 42) -> pd.Series:
+    """Builds a column of mostly valid emails with the usual dirt mixed in
+
+    Args:
+        rows (int): number of emails
+        seed (int, optional): random seed. Defaults to 42.
+
+    Returns:
+        pd.Series: email column
+    """
+    rng = np.random.default_rng(seed)
+    first = np.array(["john", "jane", "bob", "alice", "chris", "emily", "david", "sarah"])
+    last = np.array(["doe", "smith", "johnson", "lee", "davis", "green", "brown"])
+    domains = np.array(["example.com", "gmail.com", "corp-mail.co.uk", "webmail.org"])
+    valid = np.char.add(
+        np.char.add(
+            np.char.add(first[rng.integers(0, len(first), rows)], "."),
+            np.char.add(last[rng.integers(0, len(last), rows)], rng.integers(0, rows, rows).astype(str)),
+        ),
+        np.char.add("@", domains[rng.integers(0, len(domains), rows)]),
+    ).astype(object)
+    dirt = np.array(["", None, "invalid_email", "sarah.brown@webmail", "@gmail.com"], dtype=object)
+    dirty = rng.random(rows) < 0.1
+    valid[dirty] = dirt[rng.integers(0, len(dirt), dirty.sum())]
+    return pd.Series(valid)
+
+
+def timed(fn, emails: pd.Series, repeat: int) -> tuple[float, np.ndarray]:
+    """Best wall time of fn over a few runs
+
+    Args:
+        fn (callable): email validator
+        emails (pd.Series): email column
+        repeat (int): number of runs
+
+    Returns:
+        tuple[float, np.ndarray]: best time in seconds and the mask
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = fn(emails)
+        best = min(best, time.perf_counter() - start)
+    return best, np.asarray(out, dtype=bool)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    emails = make_emails(args.rows)
+    old_time, old = timed(np.vectorize(check_email), emails, args.repeat)
+    new_time, new = timed(valid_email_mask, emails, args.repeat)
+    assert (old == new).all(), "valid_email_mask does not match check_email"
+    print(f"rows                      {args.rows}")
+    print(f"np.vectorize(check_email) {args.rows / old_time:>14,.0f} rows/sec")
+    print(f"valid_email_mask          {args.rows / new_time:>14,.0f} rows/sec")
+    print(f"speedup                   {old_time / new_time:>14.2f}x")
+    if validation.pyarrow is not None:
+        arrow_time, arrow = timed(valid_email_mask, emails.astype("string[pyarrow]"), args.repeat)
+        assert (old == arrow).all(), "valid_email_mask does not match check_email"
+        print(f"valid_email_mask (arrow)  {args.rows / arrow_time:>14,.0f} rows/sec")
+        print(f"speedup                   {old_time / arrow_time:>14.2f}x")
@@ -0,0 +1,178 @@
+"""Times every ETLProcessor stage and the whole pipeline on generated data
+
+No database is needed: reads return the generated table and loads write the
+csv COPY would stream into memory. Throughput is compared with
+baseline.json and the run fails when a stage got slower than the tolerance.
+Baselines depend on the machine, so none is shipped: save one with
+--save-baseline on the machine the benchmark runs on before comparing.
+
+Run from the repository root:
+    python benchmarks/bench_pipeline.py
+    python benchmarks/bench_pipeline.py --rows 10000 10000000 --repeat 1
+    python benchmarks/bench_pipeline.py --save-baseline
+    python benchmarks/bench_pipeline.py --rows 1000000 --workers 1 2 4 8
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import time
+from unittest import mock
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from database_handler import COPY_NULL, copy_frame  # noqa: E402
+from etl_processor import ETLProcessor  # noqa: E402
+from generate import make_employees  # noqa: E402
+from validation import evaluate_rules_parallel, transform_pool  # noqa: E402
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+DEFAULT_ROWS = [10_000, 100_000, 1_000_000]
+
+
+def machine() -> dict:
+    """What a baseline is only valid on"""
+    return {"python": platform.python_version(), "processor": platform.machine(), "cpus": os.cpu_count()}
+
+
+class OfflineHandler:
+    """Stands in for DatabaseHandler without a database"""
+    frame = None
+
+    def __init__(self, engine=None):
+        pass
+
+    def query(self, query, params=None) -> pd.DataFrame:
+        return self.frame.copy()
+
+    def df_to_sql(self, data: pd.DataFrame, table_name: str, schema: str, method: str = "insert", key=None) -> bool:
+        copy_frame(data).to_csv(io.StringIO(), index=False, header=False, na_rep=COPY_NULL)
+        return True
+
+
+def _transformed(frame: pd.DataFrame) -> ETLProcessor:
+    e = ETLProcessor(frame)
+    e.transform_data()
+    return e
+
+
+def _pipeline(frame: pd.DataFrame):
+    e = ETLProcessor()
+    e.read_data()
+    e.transform_data()
+    e.load_all()
+
+
+# Stage name: (setup building the input out of the raw table, timed stage)
+STAGES = {
+    "read": (lambda frame: ETLProcessor(), lambda e: e.read_data()),
+    "remove_empty_name": (lambda frame: ETLProcessor(frame.copy()), lambda e: e.remove_empty_name()),
+    "remove_invalid_email": (lambda frame: ETLProcessor(frame.copy()), lambda e: e.remove_invalid_email()),
+    "remove_nega_sal": (lambda frame: ETLProcessor(frame.copy()), lambda e: e.remove_nega_sal()),
+    "remove_invalid_date": (lambda frame: ETLProcessor(frame.copy()), lambda e: e.remove_invalid_date()),
+    "transform": (lambda frame: ETLProcessor(frame.copy()), lambda e: e.transform_data()),
+    "load": (_transformed, lambda e: e.load_all()),
+    "pipeline": (lambda frame: frame, _pipeline),
+}
+
+
+def bench(rows: int, repeat: int, seed: int = 42, workers: list[int] | None = None) -> dict:
+    """Best throughput of every stage on a generated table
+
+    Args:
+        rows (int): rows of the table
+        repeat (int): runs of every stage, the fastest one counts
+        seed (int, optional): random seed of the table. Defaults to 42.
+        workers (list[int] | None, optional): also time the rules spread over
+            each of these numbers of processes, on a started pool. Defaults to None.
+
+    Returns:
+        dict: rows/sec of every stage
+    """
+    frame = make_employees(rows, seed)
+    OfflineHandler.frame = frame
+    results = {}
+    with mock.patch("etl_processor.DatabaseHandler", OfflineHandler), contextlib.redirect_stdout(io.StringIO()):
+        for name, (setup, stage) in STAGES.items():
+            best = float("inf")
+            for _ in range(repeat):
+                state = setup(frame)
+                start = time.perf_counter()
+                stage(state)
+                best = min(best, time.perf_counter() - start)
+            results[name] = rows / best
+    for count in workers or []:
+        with transform_pool(count) as pool:
+            list(pool.map(abs, range(count)))
+            best = float("inf")
+            for _ in range(repeat):
+                start = time.perf_counter()
+                evaluate_rules_parallel(frame, count, pool=pool)
+                best = min(best, time.perf_counter() - start)
+        results[f"rules_{count}_workers"] = rows / best
+    return results
+
+
+def regressions(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Stages slower than the baseline by more than the tolerance
+
+    Args:
+        results (dict): rows/sec of every stage per number of rows
+        baseline (dict): the same, saved earlier
+        tolerance (float): allowed slowdown, 0.25 for 25%
+
+    Returns:
+        list[str]: one message per regression
+    """
+    failed = []
+    for rows, stages in results.items():
+        for name, speed in stages.items():
+            expected = baseline.get(rows, {}).get(name)
+            if expected is not None and speed < expected * (1 - tolerance):
+                failed.append(f"{name} at {rows} rows: {speed:,.0f} rows/sec, baseline {expected:,.0f}")
+    return failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=DEFAULT_ROWS)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--workers", type=int, nargs="+", default=None)
+    args = parser.parse_args()
+
+    results = {}
+    for rows in args.rows:
+        results[str(rows)] = bench(rows, args.repeat, workers=args.workers)
+        print(f"rows {rows}")
+        for name, speed in results[str(rows)].items():
+            print(f"    {name:<22}{speed:>16,.0f} rows/sec")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump({
+                "machine": machine(),
+                "rows_per_sec": results,
+            }, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        sys.exit(0)
+    if not os.path.exists(args.baseline):
+        sys.exit(f"No baseline at {args.baseline}, save one on this machine with --save-baseline first")
+    with open(args.baseline) as f:
+        saved = json.load(f)
+    if saved["machine"] != machine():
+        sys.exit(f"Baseline at {args.baseline} was saved on {saved['machine']}, this is {machine()}, "
+                 "save one on this machine with --save-baseline")
+    failed = regressions(results, saved["rows_per_sec"], args.tolerance)
+    for message in failed:
+        print("Regression ---->", message)
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,99 @@
+"""Seeded employees_raw shaped data with the dirt of test.json
+
+Run from the repository root to write a sample:
+    python benchmarks/generate.py --rows 100000 --out employees_raw.json
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+FIRST = np.array(["John", "Jane", "Bob", "Alice", "Chris", "Emily", "David", "Sarah", "Mike", "Olivia",
+                  "Lisa", "Eva", "Michael", "Karen", "Brian", "Sofia", "Peter", "Laura"])
+LAST = np.array(["Doe", "Smith", "Johnson", "Lee", "Davis", "Green", "Brown", "Wilson", "Gonzalez",
+                 "White", "Black", "Hill", "Scott", "Clarke", "Adams"])
+DOMAINS = np.array(["example.com", "company.com", "domain.com", "webmail.org", "corp-mail.co.uk"])
+DEPARTMENTS = np.array(["HR", "Marketing", "IT", "Finance", "Administration", ""])
+BAD_EMAILS = np.array(["invalid_email", "", None, "sarah.brown@webmail", "olivia.gonzalez@company",
+                       "michael.brown@site", "@gmail.com"], dtype=object)
+BAD_SALARIES = np.array(["abc123", "25000USD", "sixty thousand", "", None, "-55000", "-20000"], dtype=object)
+BAD_DATES = np.array(["2022-02-29", "2022-15-01", "20220510", "", None], dtype=object)
+
+# Share of the rows carrying each kind of dirt, close to the mix of test.json
+# scaled down to production like rates
+DIRT = {
+    "empty_name": 0.05,
+    "bad_email": 0.05,
+    "duplicate_email": 0.03,
+    "bad_salary": 0.05,
+    "bad_date": 0.02,
+}
+
+
+def _pick(rng: np.random.Generator, values: np.ndarray, rows: int) -> np.ndarray:
+    return values[rng.integers(0, len(values), rows)]
+
+
+def _dates(rng: np.random.Generator, rows: int) -> np.ndarray:
+    """Valid join dates written in the separators and orders of test.json"""
+    days = pd.date_range("2018-01-01", periods=5 * 365, freq="D")
+    formats = ["%Y-%m-%d", "%Y/%m/%d", "%Y.%m.%d", "%d-%m-%Y", "%m-%d-%Y"]
+    # Every day in every format, rows only pick from the table
+    table = np.concatenate([days.strftime(fmt).to_numpy(dtype=object) for fmt in formats])
+    # Most dates are clean, the rest is spread over the other formats
+    chosen = rng.choice(len(formats), rows, p=[0.8, 0.05, 0.05, 0.05, 0.05])
+    return table[chosen * len(days) + rng.integers(0, len(days), rows)]
+
+
+def make_employees(rows: int, seed: int = 42) -> pd.DataFrame:
+    """Builds a raw employees table with empty names, bad and duplicated
+    emails, dirty or negative salaries and mixed format dates
+
+    Args:
+        rows (int): number of rows
+        seed (int, optional): random seed, the same seed gives the same table. Defaults to 42.
+
+    Returns:
+        pd.DataFrame: table shaped like tmp.employees_raw
+    """
+    rng = np.random.default_rng(seed)
+    people = rng.integers(0, len(FIRST) * len(LAST), rows)
+    names = np.array([f + " " + l for f in FIRST for l in LAST], dtype=object)
+    locals_ = np.array([f.lower() + "." + l.lower() for f in FIRST for l in LAST], dtype=object)
+    name = names[people]
+    # Row numbers keep the emails unique before the duplicates are mixed in
+    email = locals_[people] + np.arange(rows).astype(str).astype(object) + ("@" + _pick(rng, DOMAINS, rows).astype(object))
+    salary = (rng.integers(20, 150, rows) * 1000).astype(str).astype(object)
+    join_date = _dates(rng, rows)
+
+    def dirty(kind: str) -> np.ndarray:
+        return rng.random(rows) < DIRT[kind]
+
+    rows_of = dirty("empty_name")
+    name[rows_of] = np.where(rng.random(rows_of.sum()) < 0.5, "", None)
+    rows_of = dirty("bad_email")
+    email[rows_of] = _pick(rng, BAD_EMAILS, rows_of.sum())
+    rows_of = np.flatnonzero(dirty("duplicate_email"))
+    email[rows_of] = email[rng.integers(0, rows, len(rows_of))]
+    rows_of = dirty("bad_salary")
+    salary[rows_of] = _pick(rng, BAD_SALARIES, rows_of.sum())
+    rows_of = dirty("bad_date")
+    join_date[rows_of] = _pick(rng, BAD_DATES, rows_of.sum())
+
+    return pd.DataFrame({
+        "id": np.arange(1, rows + 1, dtype=np.int64),
+        "name": name,
+        "email": email,
+        "salary": salary,
+        "department": _pick(rng, DEPARTMENTS, rows).astype(object),
+        "join_date": join_date,
+    })
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", default="employees_raw.json")
+    args = parser.parse_args()
+    make_employees(args.rows, args.seed).to_json(args.out, orient="records", indent=4)
@@ -0,0 +1,222 @@
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from dtype_plan import has_pyarrow
+
+# Pointer to the state saved last, whatever its stage
+LAST = "_last"
+
+
+def frame_key(df: pd.DataFrame) -> str:
+    """Hash of the values, index, columns and dtypes of a frame
+
+    Args:
+        df (pd.DataFrame): frame to be hashed
+
+    Returns:
+        str: hex digest
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(json.dumps([[str(name), type(dtype).__name__, str(dtype)] for name, dtype in df.dtypes.items()]).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def stage_key(input_key: str, stage: str, *version) -> str:
+    """Key of the output of a stage, chained from the key of its input
+
+    Args:
+        input_key (str): key of the state the stage runs on
+        stage (str): stage name
+        *version: anything else the output depends on, such as the rule version
+
+    Returns:
+        str: hex digest
+    """
+    return hashlib.blake2b(json.dumps([input_key, stage, *map(str, version)]).encode(), digest_size=16).hexdigest()
+
+
+def _write_frame(df: pd.DataFrame, path: str) -> dict:
+    """Writes a frame in parquet, or pickle without pyarrow or for columns
+    parquet can't type, such as mixed objects
+
+    Returns:
+        dict: file name and the Arrow string columns, which parquet reads back
+            as the pyarrow StringDtype
+    """
+    if has_pyarrow():
+        import pyarrow
+        try:
+            df.to_parquet(path + ".parquet")
+            strings = {
+                name: str(dtype.pyarrow_dtype) for name, dtype in df.dtypes.items()
+                if isinstance(dtype, pd.ArrowDtype)
+                and (pyarrow.types.is_string(dtype.pyarrow_dtype) or pyarrow.types.is_large_string(dtype.pyarrow_dtype))
+            }
+            return {"file": os.path.basename(path) + ".parquet", "arrow_strings": strings}
+        except (pyarrow.ArrowException, TypeError, ValueError):
+            pass
+    df.to_pickle(path + ".pkl")
+    return {"file": os.path.basename(path) + ".pkl"}
+
+
+def _read_frame(dirname: str, entry: dict) -> pd.DataFrame:
+    path = os.path.join(dirname, entry["file"])
+    if path.endswith(".pkl"):
+        return pd.read_pickle(path)
+    df = pd.read_parquet(path)
+    import pyarrow
+    strings = {name: pd.ArrowDtype(pyarrow.type_for_alias(alias)) for name, alias in entry["arrow_strings"].items()}
+    return df.astype(strings) if strings else df
+
+
+class CheckpointStore:
+    """Output of every pipeline stage on disk, so a stage can run from the
+    output of the one before it in another process, and unchanged stages
+    are skipped on rerun
+
+    A state is the working frame, the rejection log and the scalars of an
+    ETLProcessor, saved under the key of the stage which produced it. The
+    raw frame the log points into is saved once per content. The latest
+    state of every stage, and the last one saved, are kept as pointers.
+
+    Layout:
+        raw/<frame key>.{json,parquet}
+        states/<state key>/{meta.json, df.parquet, log.npz, scalars.pkl}
+        latest/<stage>
+    """
+    def __init__(self, dirname: str):
+        """Opens the store, creating the directory when missing
+
+        Args:
+            dirname (str): directory of the checkpoints
+        """
+        self.dirname = dirname
+        for sub in ("raw", "states", "latest"):
+            os.makedirs(os.path.join(dirname, sub), exist_ok=True)
+
+    def _state_dir(self, key: str) -> str:
+        return os.path.join(self.dirname, "states", key)
+
+    def _point(self, name: str, key: str):
+        path = os.path.join(self.dirname, "latest", name)
+        with open(path + ".tmp", "w") as f:
+            f.write(key)
+        os.replace(path + ".tmp", path)
+
+    def latest(self, stage: str = LAST) -> str | None:
+        """Key of the latest state of a stage
+
+        Args:
+            stage (str, optional): stage name. Defaults to LAST, any stage.
+
+        Returns:
+            str | None: key, None if the stage never ran
+        """
+        try:
+            with open(os.path.join(self.dirname, "latest", stage)) as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return None
+
+    def has(self, key: str) -> bool:
+        """True if a state was saved under the key"""
+        return os.path.exists(os.path.join(self._state_dir(key), "meta.json"))
+
+    def save_raw(self, df: pd.DataFrame) -> str:
+        """Saves a raw frame, once per content
+
+        Args:
+            df (pd.DataFrame): frame read from the source
+
+        Returns:
+            str: its frame key
+        """
+        key = frame_key(df)
+        meta_path = os.path.join(self.dirname, "raw", key + ".json")
+        if not os.path.exists(meta_path):
+            entry = _write_frame(df, os.path.join(self.dirname, "raw", key))
+            with open(meta_path + ".tmp", "w") as f:
+                json.dump(entry, f)
+            os.replace(meta_path + ".tmp", meta_path)
+        return key
+
+    def load_raw(self, key: str) -> pd.DataFrame:
+        """Raw frame saved under its frame key"""
+        with open(os.path.join(self.dirname, "raw", key + ".json")) as f:
+            return _read_frame(os.path.join(self.dirname, "raw"), json.load(f))
+
+    def save(self, key: str, stage: str, raw_key: str, df: pd.DataFrame | None, arrays: dict[str, np.ndarray | None],
+             scalars: dict):
+        """Saves a state and points the stage at it
+
+        The state is written in a temporary directory moved in place at the
+        end, so a crashed run never leaves a half written state.
+
+        Args:
+            key (str): state key, see stage_key
+            stage (str): stage which produced the state
+            raw_key (str): frame key of the raw frame
+            df (pd.DataFrame | None): working frame, None when it is the raw frame
+            arrays (dict[str, np.ndarray | None]): rejection log and other arrays
+            scalars (dict): picklable values, such as counters and the high-water mark
+        """
+        if not self.has(key):
+            tmp = tempfile.mkdtemp(dir=os.path.join(self.dirname, "states"), prefix=".tmp_")
+            try:
+                meta = {"stage": stage, "raw": raw_key, "df": None if df is None else _write_frame(df, os.path.join(tmp, "df"))}
+                np.savez(os.path.join(tmp, "log.npz"), **{name: value for name, value in arrays.items() if value is not None})
+                with open(os.path.join(tmp, "scalars.pkl"), "wb") as f:
+                    pickle.dump(scalars, f)
+                with open(os.path.join(tmp, "meta.json"), "w") as f:
+                    json.dump(meta, f)
+                shutil.rmtree(self._state_dir(key), ignore_errors=True)
+                os.replace(tmp, self._state_dir(key))
+            finally:
+                shutil.rmtree(tmp, ignore_errors=True)
+        self.point(stage, key)
+
+    def point(self, stage: str, key: str):
+        """Makes a saved state the latest of its stage and the last one
+
+        Args:
+            stage (str): stage name
+            key (str): state key
+        """
+        self._point(stage, key)
+        self._point(LAST, key)
+
+    def load(self, key: str) -> dict | None:
+        """State saved under the key
+
+        Args:
+            key (str): state key
+
+        Returns:
+            dict | None: key, stage, raw_key, df, arrays and scalars, None if missing.
+                df is None when it is the raw frame, see load_raw.
+        """
+        dirname = self._state_dir(key)
+        if not self.has(key):
+            return None
+        with open(os.path.join(dirname, "meta.json")) as f:
+            meta = json.load(f)
+        with np.load(os.path.join(dirname, "log.npz")) as log:
+            arrays = {name: log[name] for name in log.files}
+        with open(os.path.join(dirname, "scalars.pkl"), "rb") as f:
+            scalars = pickle.load(f)
+        return {
+            "key": key,
+            "stage": meta["stage"],
+            "raw_key": meta["raw"],
+            "df": None if meta["df"] is None else _read_frame(dirname, meta["df"]),
+            "arrays": arrays,
+            "scalars": scalars,
+        }
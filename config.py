@@ -0,0 +1,53 @@
+import functools
+import os
+from typing import NamedTuple
+
+
+class DatabaseConfig(NamedTuple):
+    """Connection settings of the database
+
+    Read from the environment variables DATABASE, USER, HOST, PASSWORD,
+    PORT and POOL_SIZE, see from_env.
+    """
+    database: str | None = None
+    user: str | None = None
+    host: str | None = None
+    password: str | None = None
+    port: str | None = None
+    pool_size: int = 5
+
+    @classmethod
+    def from_env(cls, env_file: str | None = None) -> "DatabaseConfig":
+        """Settings from the environment, the ones it lacks are taken from a
+        .env file. The environment is left untouched.
+
+        Args:
+            env_file (str | None, optional): .env file. Defaults to None, the first
+                .env found from this directory up.
+
+        Returns:
+            DatabaseConfig: settings
+        """
+        # python-dotenv is only imported by the processes which connect
+        from dotenv import dotenv_values, find_dotenv
+
+        values = dict(dotenv_values(env_file if env_file is not None else find_dotenv()))
+        values.update(os.environ)
+        return cls(
+            database=values.get("DATABASE"),
+            user=values.get("USER"),
+            host=values.get("HOST"),
+            password=values.get("PASSWORD"),
+            port=values.get("PORT"),
+            pool_size=int(values.get("POOL_SIZE") or 5),
+        )
+
+
+@functools.lru_cache(maxsize=None)
+def load_config() -> DatabaseConfig:
+    """Settings of the process, read once on first use
+
+    Returns:
+        DatabaseConfig: settings from the environment and .env
+    """
+    return DatabaseConfig.from_env()
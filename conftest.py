@@ -0,0 +1,9 @@
+import os
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def repo_dir(monkeypatch):
+    """Runs every test from this directory, where test.json is, wherever pytest is started from"""
+    monkeypatch.chdir(os.path.dirname(os.path.abspath(__file__)))
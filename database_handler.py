@@ -1,82 +1,696 @@
+from config import DatabaseConfig, load_config
+from dtype_plan import has_pyarrow, plain_frame
 import urllib.parse
 import pandas as pd
 import psycopg2
-import os
-from dotenv import load_dotenv
+from psycopg2 import sql
+import io
 import urllib
-import sqlalchemy 
+import contextlib
+import threading
+from typing import TYPE_CHECKING, Iterator
 
+if TYPE_CHECKING:  # pragma: no cover
+    # Imported where an engine is created and on the Arrow COPY path, each
+    # one doubles the import time of the module
+    import pyarrow
+    import sqlalchemy
 
-abspath = os.path.abspath(__file__)
-dname = os.path.dirname(abspath)
-os.chdir(dname)
-load_dotenv()
+# Marks NULL in the csv streamed to COPY, so that empty strings stay empty strings
+COPY_NULL = "\\N"
 
-DATABASE=os.getenv("DATABASE")
-USER=os.getenv("USER")
-HOST=os.getenv("HOST")
-PASSWORD=os.getenv("PASSWORD")
-PORT=os.getenv("PORT")
+# High-water mark of every incremental source, the value is kept as text so
+# that it compares against an id as well as an updated-at column. tie is the
+# value of the tie column of the last loaded row when the mark column has
+# duplicates, the table is then read past (value, tie).
+WATERMARK_DDL = """
+create table if not exists tmp.etl_watermarks (
+    source text not null,
+    column_name text not null,
+    value text not null,
+    tie text,
+    updated_at timestamptz not null default now(),
+    primary key (source, column_name)
+)
+"""
+
+# Committed progress of every chunked run, so a restarted run goes on after
+# its last loaded chunk. value is the offset column value of the last loaded
+# row, NULL once the run reads the rows without one, and tie its key, the
+# table is then read past (value, tie). rows are the rows loaded so far.
+OFFSETS_DDL = """
+create table if not exists tmp.etl_chunk_offsets (
+    run_id text not null,
+    source text not null,
+    column_name text,
+    value text,
+    tie text,
+    chunks bigint not null default 0,
+    rows bigint not null default 0,
+    completed boolean not null default false,
+    updated_at timestamptz not null default now(),
+    primary key (run_id, source)
+)
+"""
+
+def copy_frame(data: pd.DataFrame) -> pd.DataFrame:
+    """Maps the frame dtypes to values COPY parses into the table types
+
+    Compact dtypes are mapped back first, see plain_frame. Float columns
+    holding only whole numbers (integers which got a NaN) go back to
+    integers, and datetime columns holding only midnights are written as
+    dates.
+
+    Args:
+        data (pd.DataFrame): frame which needs to be pushed
+
+    Returns:
+        pd.DataFrame: frame ready to be written as csv
+    """
+    data = plain_frame(data)
+    columns = {}
+    for name, column in data.items():
+        if pd.api.types.is_float_dtype(column) and (column.dropna() % 1 == 0).all():
+            columns[name] = column.astype("Int64")
+        elif pd.api.types.is_datetime64_dtype(column) and (column.dropna() == column.dropna().dt.normalize()).all():
+            columns[name] = column.dt.strftime("%Y-%m-%d")
+        elif pd.api.types.is_object_dtype(column) and (column == COPY_NULL).any():
+            raise ValueError(f"Column {name} holds the COPY null marker {COPY_NULL}")
+    return data.assign(**columns) if columns else data
+
+def arrow_table(data: pd.DataFrame) -> "pyarrow.Table":
+    """Arrow table of the frame with the types COPY parses
+
+    Arrow backed columns are taken as they are, without a copy. Dictionary
+    columns (categoricals) are decoded to their values, timestamps holding
+    only midnights are written as dates and floats holding only whole
+    numbers as integers.
+
+    Args:
+        data (pd.DataFrame): frame which needs to be pushed
+
+    Returns:
+        pyarrow.Table: table ready to be written as csv
+    """
+    import pyarrow
+    import pyarrow.compute
+    table = pyarrow.Table.from_pandas(data, preserve_index=False)
+    for i, column in enumerate(table.columns):
+        kind = column.type
+        if pyarrow.types.is_dictionary(kind):
+            column = column.cast(kind.value_type)
+        elif pyarrow.types.is_timestamp(kind) and kind.tz is None:
+            midnight = pyarrow.compute.all(pyarrow.compute.equal(pyarrow.compute.floor_temporal(column, unit="day"), column))
+            if midnight.as_py() is not False:
+                column = column.cast(pyarrow.date32())
+        elif pyarrow.types.is_floating(kind):
+            whole = pyarrow.compute.all(pyarrow.compute.equal(pyarrow.compute.floor(column), column))
+            if whole.as_py() is not False:
+                column = column.cast(pyarrow.int64())
+        else:
+            continue
+        table = table.set_column(i, table.field(i).name, column)
+    return table
+
+def is_arrow_frame(data: pd.DataFrame) -> bool:
+    """Whether the frame has Arrow backed columns to be loaded through Arrow
+
+    Args:
+        data (pd.DataFrame): frame which needs to be pushed
+
+    Returns:
+        bool: true if pyarrow is there and a column is Arrow backed
+    """
+    return has_pyarrow() and any(isinstance(dtype, pd.ArrowDtype) for dtype in data.dtypes)
+
+def db_string(config: DatabaseConfig | None = None) -> str:
+    """SQLAlchemy url of the database
+
+    Args:
+        config (DatabaseConfig | None, optional): settings. Defaults to None, load_config().
+
+    Returns:
+        str: url built from the settings
+    """
+    config = load_config() if config is None else config
+    return "postgresql+psycopg2://%s:%s@%s:%s/%s" % (
+        config.user,
+        urllib.parse.quote_plus(config.password),
+        config.host,
+        config.port,
+        config.database,
+    )
 
 class DatabaseHandler:
+    """Reads and writes the database
+
+    DatabaseHandler() opens its own connection and engine and closes them
+    after a single call. DatabaseHandler(engine) borrows connections from the
+    engine pool for every call instead and can be reused, see shared_engine.
+    """
+    __pooled = False
+    __shared_engine = None
+    __shared_lock = threading.Lock()
+    # (ddl, dsn) of the bookkeeping tables already created by this process
+    __created = set()
+
+    def __init__(self, engine: "sqlalchemy.Engine | None" = None, config: DatabaseConfig | None = None):
+        """Connects, or borrows from the engine
+
+        Args:
+            engine (sqlalchemy.Engine | None, optional): pooled engine. Defaults to None, a connection of its own.
+            config (DatabaseConfig | None, optional): settings of the connection. Defaults to None, load_config().
+        """
+        if engine is not None:
+            self.__pooled = True
+            self.__conn = None
+            self.__db_engine = engine
+            return
+        import sqlalchemy
 
-    def __init__(self):
+        config = load_config() if config is None else config
         self.__conn = psycopg2.connect(
-            database=DATABASE,
-            user=USER,
-            host=HOST,
-            password=PASSWORD,
-            port=PORT,
+            database=config.database,
+            user=config.user,
+            host=config.host,
+            password=config.password,
+            port=config.port,
         )
-        db_string = "postgresql+psycopg2://%s:%s@%s:%s/%s" % (
-            USER,
-            urllib.parse.quote_plus(PASSWORD),
-            HOST,
-            PORT,
-            DATABASE,
-        )
-        self.__db_engine = sqlalchemy.create_engine(db_string)
+        self.__db_engine = sqlalchemy.create_engine(db_string(config))
+
+    @classmethod
+    def shared_engine(cls) -> "sqlalchemy.Engine":
+        """Process wide pooled engine, created on first use
+
+        Returns:
+            sqlalchemy.Engine: engine with a pool of DatabaseConfig.pool_size connections
+        """
+        import sqlalchemy
+
+        with cls.__shared_lock:
+            if cls.__shared_engine is None:
+                config = load_config()
+                cls.__shared_engine = sqlalchemy.create_engine(
+                    db_string(config),
+                    pool_size=config.pool_size,
+                    pool_pre_ping=True,
+                )
+            return cls.__shared_engine
+
+    @classmethod
+    def pooled(cls) -> "DatabaseHandler":
+        """Handler on the process wide pooled engine
+
+        Returns:
+            DatabaseHandler: reusable handler
+        """
+        return cls(cls.shared_engine())
+
+    def __enter__(self) -> "DatabaseHandler":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Closes the connection and engine of a non pooled handler, pooled
+        connections are already back in the pool after every call
+        """
+        if not self.__pooled:
+            self.__conn.close()
+            self.__db_engine.dispose()
+
+    @contextlib.contextmanager
+    def session(self) -> Iterator[psycopg2.extensions.connection]:
+        """psycopg2 connection in a transaction, committed when the block
+        succeeds and rolled back when it raises
+
+        Yields:
+            psycopg2.extensions.connection: the handler connection, or a
+                connection borrowed from the pool
+        """
+        pooled = self.__db_engine.raw_connection() if self.__pooled else None
+        conn = pooled.dbapi_connection if pooled is not None else self.__conn
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            if pooled is not None:
+                pooled.close()
     
-    def query(self, query: str) -> list:
+    def __create_table(self, conn, ddl: str):
+        """Creates a bookkeeping table on its first use in the process, in a
+        transaction of its own so no load holds the lock of the DDL
+
+        Args:
+            conn: psycopg2 connection, with no transaction open
+            ddl (str): create table if not exists statement
+        """
+        key = (ddl, conn.dsn)
+        if key in self.__created:
+            return
+        with conn.cursor() as cursor:
+            cursor.execute(ddl)
+        conn.commit()
+        self.__created.add(key)
+
+    def query(self, query: str | sql.Composable, params: tuple | None = None, dtype_backend: str | None = None) -> list:
         """Quering data
 
         Args:
-            query (str): select query expected
+            query (str | sql.Composable): select query expected
+            params (tuple | None, optional): query parameters. Defaults to None.
+            dtype_backend (str | None, optional): "pyarrow" for Arrow backed
+                columns, see pd.read_sql. Defaults to None.
 
         Returns:
             list: json data output
         """
         try:
-            data = pd.read_sql(query, self.__conn)
-            self.__conn.close()
-            self.__db_engine.dispose()
+            with self.session() as conn:
+                if isinstance(query, sql.Composable):
+                    query = query.as_string(conn)
+                options = {}
+                if params is not None:
+                    options["params"] = params
+                if dtype_backend is not None:
+                    options["dtype_backend"] = dtype_backend
+                data = pd.read_sql(query, conn, **options)
+            self.close()
             return data
         except Exception as e:
             print("Exception --->", e)
 
-    def df_to_sql(self, data: pd.DataFrame, table_name: str, schema: str) -> bool:
+    def query_chunks(self, query: str | sql.Composable, chunksize: int, params: tuple | None = None,
+                     dtype_backend: str | None = None) -> Iterator[pd.DataFrame]:
+        """Streams a select query through a server-side (named) cursor
+
+        Args:
+            query (str | sql.Composable): select query expected
+            chunksize (int): number of rows fetched per round trip
+            params (tuple | None, optional): query parameters. Defaults to None.
+            dtype_backend (str | None, optional): "pyarrow" for Arrow backed
+                columns. Defaults to None.
+
+        Yields:
+            pd.DataFrame: chunk of at most chunksize rows
+        """
+        try:
+            with self.session() as conn, conn.cursor(name="etl_stream") as cursor:
+                cursor.itersize = chunksize
+                if params is None:
+                    cursor.execute(query)
+                else:
+                    cursor.execute(query, params)
+                while True:
+                    rows = cursor.fetchmany(chunksize)
+                    if not rows:
+                        break
+                    columns = [column[0] for column in cursor.description]
+                    chunk = pd.DataFrame.from_records(rows, columns=columns)
+                    if dtype_backend is not None:
+                        chunk = chunk.convert_dtypes(dtype_backend=dtype_backend)
+                    yield chunk
+        finally:
+            self.close()
+
+    def table_columns(self, schema: str, table_name: str) -> list[str]:
+        """Columns of a table
+
+        Args:
+            schema (str): schema of the table
+            table_name (str): table name
+
+        Returns:
+            list[str]: column names in table order, empty if the table is missing
+        """
+        with self.session() as conn, conn.cursor() as cursor:
+            cursor.execute(
+                "select column_name from information_schema.columns "
+                "where table_schema = %s and table_name = %s order by ordinal_position",
+                (schema, table_name),
+            )
+            rows = cursor.fetchall()
+        self.close()
+        return [row[0] for row in rows]
+
+    def execute(self, statements: list[tuple[str | sql.Composable, dict | tuple | None]]) -> list[tuple]:
+        """Runs statements in one transaction
+
+        Args:
+            statements (list[tuple[str | sql.Composable, dict | tuple | None]]): statements with their parameters
+
+        Returns:
+            list[tuple]: rows returned by the last statement, empty if it returns none
+        """
+        with self.session() as conn, conn.cursor() as cursor:
+            for statement, params in statements:
+                if isinstance(statement, sql.Composable):
+                    statement = statement.as_string(conn)
+                cursor.execute(statement, params)
+            rows = cursor.fetchall() if cursor.description is not None else []
+        self.close()
+        return rows
+
+    def copy_to_sql(self, conn, data: pd.DataFrame, table_name: str, schema: str):
+        """Streams the frame into COPY ... FROM STDIN as csv from an in-memory buffer
+
+        Frames with Arrow backed columns are written by the Arrow csv writer
+        straight from their buffers. It quotes every string and leaves NULLs
+        unquoted and empty, which is what COPY reads as NULL in csv.
+
+        Args:
+            conn: psycopg2 connection, not committed
+            data (pd.DataFrame): dataframe which need to be pushed
+            table_name (str): table where it needs to be pushed
+            schema (str): schema where it needs to be pushed
+        """
+        if is_arrow_frame(data):
+            import pyarrow.csv
+            buffer = io.BytesIO()
+            pyarrow.csv.write_csv(arrow_table(data), buffer, pyarrow.csv.WriteOptions(include_header=False))
+            options = sql.SQL("FORMAT csv")
+        else:
+            buffer = io.StringIO()
+            copy_frame(data).to_csv(buffer, index=False, header=False, na_rep=COPY_NULL)
+            options = sql.SQL("FORMAT csv, NULL {}").format(sql.Literal(COPY_NULL))
+        buffer.seek(0)
+        statement = sql.SQL("COPY {}.{} ({}) FROM STDIN WITH ({})").format(
+            sql.Identifier(schema),
+            sql.Identifier(table_name),
+            sql.SQL(", ").join(sql.Identifier(column) for column in data.columns),
+            options,
+        )
+        with conn.cursor() as cursor:
+            cursor.copy_expert(statement.as_string(conn), buffer)
+
+    def upsert_to_sql(self, conn, data: pd.DataFrame, table_name: str, schema: str, key: tuple[str, ...]):
+        """Merges the frame into the table on the key through a staging table
+
+        The frame is copied into a temporary table shaped like the target,
+        dropped on commit, and merged with INSERT ... ON CONFLICT. The key
+        needs a unique constraint on the target. When the batch holds the
+        same key more than once its last row wins.
+
+        Args:
+            conn: psycopg2 connection, not committed
+            data (pd.DataFrame): dataframe which need to be pushed
+            table_name (str): table where it needs to be pushed
+            schema (str): schema where it needs to be pushed
+            key (tuple[str, ...]): columns of the unique key
+        """
+        stage = f"{table_name}_stage"
+        columns = sql.SQL(", ").join(sql.Identifier(column) for column in data.columns)
+        keys = sql.SQL(", ").join(sql.Identifier(column) for column in key)
+        updates = [column for column in data.columns if column not in key]
+        if updates:
+            action = sql.SQL("do update set {}").format(sql.SQL(", ").join(
+                sql.SQL("{0} = excluded.{0}").format(sql.Identifier(column)) for column in updates
+            ))
+        else:
+            action = sql.SQL("do nothing")
+        with conn.cursor() as cursor:
+            cursor.execute(sql.SQL(
+                "create temp table {} (like {}.{} including defaults, etl_row bigserial) on commit drop"
+            ).format(sql.Identifier(stage), sql.Identifier(schema), sql.Identifier(table_name)).as_string(conn))
+        self.copy_to_sql(conn, data, stage, "pg_temp")
+        with conn.cursor() as cursor:
+            cursor.execute(sql.SQL(
+                "insert into {}.{} ({}) select distinct on ({}) {} from pg_temp.{} "
+                "order by {}, etl_row desc on conflict ({}) {}"
+            ).format(
+                sql.Identifier(schema),
+                sql.Identifier(table_name),
+                columns,
+                keys,
+                columns,
+                sql.Identifier(stage),
+                keys,
+                keys,
+                action,
+            ).as_string(conn))
+
+    def __try_copy(self, data: pd.DataFrame, table_name: str, schema: str) -> bool:
+        """Bulk loads the frame with COPY, the transaction is rolled back if it fails
+
+        Args:
+            data (pd.DataFrame): dataframe which need to be pushed
+            table_name (str): table where it needs to be pushed
+            schema (str): schema where it needs to be pushed
+
+        Returns:
+            bool: true if loaded, false if the caller needs to fall back
+        """
+        try:
+            with self.session() as conn:
+                self.copy_to_sql(conn, data, table_name, schema)
+            return True
+        except Exception as e:
+            print("Exception ----> COPY failed, falling back to insert:", e)
+            return False
+
+    def df_to_sql(self, data: pd.DataFrame, table_name: str, schema: str, method: str = "insert",
+                  key: tuple[str, ...] | None = None) -> bool:
         """Inserts data while also comparing for duplicacy
 
         Args:
             data (pd.DataFrame): dataframe which need to be pushed
             table_name (str): table where it needs to be pushed
             schema (str): schema where it needs to be pushed
+            method (str, optional): "insert" for batched INSERTs through
+                SQLAlchemy, "copy" to bulk load with COPY into an existing
+                table, falling back to "insert" if COPY fails, "upsert" to merge
+                on the key, see upsert_to_sql. Defaults to "insert".
+            key (tuple[str, ...] | None, optional): unique key of the upsert. Defaults to None.
 
         Returns:
             bool: true if success else false
         """
         try:
-            # To make sure we are not pushing with same email again
-            data.to_sql(
-                table_name,
-                self.__db_engine,
-                schema=schema,
-                if_exists="append",
-                index=False,
+            if method == "upsert":
+                # To make sure we are not pushing with same email again
+                if not key:
+                    raise ValueError(f"Upsert into {table_name} needs a key")
+                with self.session() as conn:
+                    self.upsert_to_sql(conn, data, table_name, schema, tuple(key))
+            elif method != "copy" or not self.__try_copy(data, table_name, schema):
+                plain_frame(data).to_sql(
+                    table_name,
+                    self.__db_engine,
+                    schema=schema,
+                    if_exists="append",
+                    index=False,
+                )
+            self.close()
+            return True
+        except Exception as e:
+            print("Exception ---->", e)
+            return False
+
+    def get_watermark(self, source: str, column: str) -> str | None:
+        """Reads the high-water mark of an incremental source
+
+        Args:
+            source (str): name of the source
+            column (str): column the mark is taken on
+
+        Returns:
+            str | None: the mark, or None if the source was never loaded
+        """
+        with self.session() as conn:
+            self.__create_table(conn, WATERMARK_DDL)
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "select value from tmp.etl_watermarks where source = %s and column_name = %s",
+                    (source, column),
+                )
+                row = cursor.fetchone()
+        self.close()
+        return row[0] if row else None
+
+    def get_watermark_keyset(self, source: str, column: str) -> tuple[str, str | None] | None:
+        """Reads the high-water mark of an incremental source with the tie
+        value of the last loaded row
+
+        Args:
+            source (str): name of the source
+            column (str): column the mark is taken on
+
+        Returns:
+            tuple[str, str | None] | None: the mark and its tie value, or None if the source was never loaded
+        """
+        with self.session() as conn:
+            self.__create_table(conn, WATERMARK_DDL)
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "select value, tie from tmp.etl_watermarks where source = %s and column_name = %s",
+                    (source, column),
+                )
+                row = cursor.fetchone()
+        self.close()
+        return (row[0], row[1]) if row else None
+
+    def set_watermark(self, conn, source: str, column: str, value: str, tie: str | None = None):
+        """Moves the high-water mark of an incremental source, its table
+        already created
+
+        Args:
+            conn: psycopg2 connection, not committed
+            source (str): name of the source
+            column (str): column the mark is taken on
+            value (str): new mark
+            tie (str | None, optional): tie value of the last loaded row, for a mark
+                column with duplicates. Defaults to None.
+        """
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "insert into tmp.etl_watermarks (source, column_name, value, tie) values (%s, %s, %s, %s) "
+                "on conflict (source, column_name) do update set value = excluded.value, tie = excluded.tie, updated_at = now()",
+                (source, column, value, tie),
             )
-            self.__conn.close()
-            self.__db_engine.dispose()
+
+    def load_with_watermark(self, frames: list[tuple[pd.DataFrame, str]], schema: str, source: str, column: str, value: str,
+                            keys: dict[str, tuple[str, ...]] | None = None, tie: str | None = None) -> bool:
+        """Loads the frames with COPY and moves the high-water mark in one
+        transaction, so the mark never gets ahead of or behind the loaded rows
+
+        Args:
+            frames (list[tuple[pd.DataFrame, str]]): frames with the table they need to be pushed to
+            schema (str): schema where they need to be pushed
+            source (str): name of the source
+            column (str): column the mark is taken on
+            value (str): new mark
+            keys (dict[str, tuple[str, ...]] | None, optional): unique key of the tables to be
+                upserted instead of appended. Defaults to None.
+            tie (str | None, optional): tie value of the last loaded row, see set_watermark.
+                Defaults to None.
+
+        Returns:
+            bool: true if success else false
+        """
+        try:
+            with self.session() as conn:
+                self.__create_table(conn, WATERMARK_DDL)
+                self.__load_frames(conn, frames, schema, keys)
+                self.set_watermark(conn, source, column, value, tie)
+            self.close()
+            return True
+        except Exception as e:
+            print("Exception ---->", e)
+            return False
+
+    def __load_frames(self, conn, frames: list[tuple[pd.DataFrame, str]], schema: str,
+                      keys: dict[str, tuple[str, ...]] | None):
+        """Loads the frames on a connection, without committing"""
+        for data, table_name in frames:
+            if keys and table_name in keys:
+                self.upsert_to_sql(conn, data, table_name, schema, keys[table_name])
+            else:
+                self.copy_to_sql(conn, data, table_name, schema)
+
+    def get_chunk_offset(self, run_id: str, source: str) -> dict | None:
+        """Reads the committed progress of a chunked run
+
+        Args:
+            run_id (str): name of the run
+            source (str): what the run reads
+
+        Returns:
+            dict | None: value, tie, chunks, rows and completed, or None if the run never loaded a chunk
+        """
+        with self.session() as conn:
+            self.__create_table(conn, OFFSETS_DDL)
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "select value, tie, chunks, rows, completed from tmp.etl_chunk_offsets where run_id = %s and source = %s",
+                    (run_id, source),
+                )
+                row = cursor.fetchone()
+        self.close()
+        if row is None:
+            return None
+        return dict(zip(("value", "tie", "chunks", "rows", "completed"), row))
+
+    def set_chunk_offset(self, conn, run_id: str, source: str, column: str | None, value: str | None, rows: int,
+                         tie: str | None = None):
+        """Records one more loaded chunk of a run, its table already created
+
+        Args:
+            conn: psycopg2 connection, not committed
+            run_id (str): name of the run
+            source (str): what the run reads
+            column (str | None): column the offset is taken on, None for files
+            value (str | None): value of the column in the last row of the chunk
+            rows (int): rows of the chunk
+            tie (str | None, optional): key of the last row of the chunk, for an offset
+                column with duplicates or NULLs. Defaults to None.
+        """
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "insert into tmp.etl_chunk_offsets as o (run_id, source, column_name, value, chunks, rows, tie) "
+                "values (%s, %s, %s, %s, 1, %s, %s) "
+                "on conflict (run_id, source) do update set value = excluded.value, tie = excluded.tie, "
+                "chunks = o.chunks + 1, rows = o.rows + excluded.rows, updated_at = now()",
+                (run_id, source, column, value, rows, tie),
+            )
+
+    def complete_chunk_offset(self, run_id: str, source: str) -> bool:
+        """Marks a run as completed, a rerun with its id has nothing left to do
+
+        Args:
+            run_id (str): name of the run
+            source (str): what the run reads
+
+        Returns:
+            bool: true if success else false
+        """
+        try:
+            with self.session() as conn:
+                self.__create_table(conn, OFFSETS_DDL)
+                with conn.cursor() as cursor:
+                    cursor.execute(
+                        "insert into tmp.etl_chunk_offsets as o (run_id, source, completed) values (%s, %s, true) "
+                        "on conflict (run_id, source) do update set completed = true, updated_at = now()",
+                        (run_id, source),
+                    )
+            self.close()
+            return True
+        except Exception as e:
+            print("Exception ---->", e)
+            return False
+
+    def load_with_offset(self, frames: list[tuple[pd.DataFrame, str]], schema: str, run_id: str, source: str,
+                         column: str | None, value: str | None, rows: int,
+                         keys: dict[str, tuple[str, ...]] | None = None, tie: str | None = None) -> bool:
+        """Loads the frames of a chunk and records its offset in one
+        transaction, so a restarted run neither loses nor repeats a chunk
+
+        Args:
+            frames (list[tuple[pd.DataFrame, str]]): frames with the table they need to be pushed to
+            schema (str): schema where they need to be pushed
+            run_id (str): name of the run
+            source (str): what the run reads
+            column (str | None): column the offset is taken on, None for files
+            value (str | None): value of the column in the last row of the chunk
+            rows (int): rows of the chunk
+            keys (dict[str, tuple[str, ...]] | None, optional): unique key of the tables to be
+                upserted instead of appended. Defaults to None.
+            tie (str | None, optional): key of the last row of the chunk, see set_chunk_offset.
+                Defaults to None.
+
+        Returns:
+            bool: true if success else false
+        """
+        try:
+            with self.session() as conn:
+                self.__create_table(conn, OFFSETS_DDL)
+                self.__load_frames(conn, frames, schema, keys)
+                self.set_chunk_offset(conn, run_id, source, column, value, rows, tie)
+            self.close()
             return True
         except Exception as e:
             print("Exception ---->", e)
-            return False
\ No newline at end of file
+            return False
@@ -0,0 +1,135 @@
+import pandas as pd
+import numpy as np
+import functools
+import importlib.util
+from typing import Callable
+
+# Nullable integer dtypes from the smallest one
+_INT_DTYPES = ("Int8", "Int16", "Int32", "Int64")
+
+
+@functools.cache
+def has_pyarrow() -> bool:
+    """Whether pyarrow is installed, looked up without importing it as the
+    import takes longer than the rest of the pipeline. The Arrow paths import
+    it where they use it.
+
+    Returns:
+        bool: true if pyarrow can be imported
+    """
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def compact_int(values: pd.Series) -> pd.Series:
+    """Casts whole numbers to the smallest nullable integer dtype holding them
+
+    Args:
+        values (pd.Series): column to be cast
+
+    Returns:
+        pd.Series: cast column, or the column as it is if it doesn't hold whole numbers
+    """
+    if values.empty or not (pd.api.types.is_integer_dtype(values) or pd.api.types.is_float_dtype(values)):
+        return values
+    present = values.dropna()
+    if present.empty:
+        return values.astype(_INT_DTYPES[0])
+    if pd.api.types.is_float_dtype(values) and not (present % 1 == 0).all():
+        return values
+    lo, hi = present.min(), present.max()
+    for dtype in _INT_DTYPES:
+        info = np.iinfo(dtype.lower())
+        if info.min <= lo and hi <= info.max:
+            return values.astype(dtype)
+    return values
+
+
+def as_category(values: pd.Series) -> pd.Series:
+    """Dictionary encodes a column of repeated strings
+
+    Args:
+        values (pd.Series): column to be encoded
+
+    Returns:
+        pd.Series: categorical column
+    """
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values
+    return values.astype("category")
+
+
+# Dtype of the raw columns at extraction. Salary and join_date are dirty
+# text until their rules clean them, into compact ints and datetimes.
+DTYPE_PLAN: dict[str, Callable[[pd.Series], pd.Series]] = {
+    "id": compact_int,
+    "department": as_category,
+}
+
+
+def apply_dtype_plan(df: pd.DataFrame, plan: dict[str, Callable[[pd.Series], pd.Series]] = DTYPE_PLAN) -> pd.DataFrame:
+    """Casts the columns of the plan found in the frame
+
+    Args:
+        df (pd.DataFrame): raw frame
+        plan (dict[str, Callable[[pd.Series], pd.Series]], optional): cast of every column. Defaults to DTYPE_PLAN.
+
+    Returns:
+        pd.DataFrame: compact frame
+    """
+    return df.assign(**{column: cast(df[column]) for column, cast in plan.items() if column in df})
+
+
+def reason_column(codes: np.ndarray, reasons: np.ndarray) -> pd.Categorical:
+    """Reasons of the rule codes, dictionary encoded without a string per row
+
+    Args:
+        codes (np.ndarray): per row the code of the first failed rule or 0
+        reasons (np.ndarray): reason of every code, see validation.REASONS
+
+    Returns:
+        pd.Categorical: reason per row
+    """
+    return pd.Categorical.from_codes(codes.astype(np.int8), categories=pd.Index(reasons, dtype=object))
+
+
+def plain_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Maps the compact dtypes back to the ones the database drivers write
+
+    Categorical columns go back to their values, with None where missing.
+    Nullable integers and datetimes are written as they are.
+
+    Args:
+        df (pd.DataFrame): frame which needs to be pushed
+
+    Returns:
+        pd.DataFrame: frame with plain dtypes
+    """
+    columns = {}
+    for name, column in df.items():
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            values = column.astype(object)
+            columns[name] = values.where(values.notna(), None)
+    return df.assign(**columns) if columns else df
+
+
+def arrow_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Converts the columns which are not Arrow backed yet to Arrow dtypes
+
+    Strings become Arrow strings, numbers and datetimes their Arrow types,
+    categorical columns are kept.
+
+    Args:
+        df (pd.DataFrame): frame to be converted
+
+    Returns:
+        pd.DataFrame: Arrow backed frame
+    """
+    if not has_pyarrow():
+        raise ImportError("Arrow mode needs pyarrow")
+    columns = [
+        name for name, dtype in df.dtypes.items()
+        if not isinstance(dtype, (pd.ArrowDtype, pd.CategoricalDtype))
+    ]
+    if not columns:
+        return df
+    return df.assign(**df[columns].convert_dtypes(dtype_backend="pyarrow"))
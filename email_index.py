@@ -0,0 +1,226 @@
+import os
+import sqlite3
+import tempfile
+import threading
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+
+# Key of the hash the Bloom filter positions are derived from
+_HASH_KEY = "etl-email-bloom1"
+# Values per lookup on the sqlite file
+_LOOKUP_BATCH = 900
+
+
+def _as_values(values: Iterable) -> np.ndarray:
+    """Emails as an object array of str, whatever the column dtype"""
+    if isinstance(values, (pd.Series, pd.Index)):
+        return values.to_numpy(dtype=object)
+    return np.asarray(values, dtype=object)
+
+
+class BloomFilter:
+    """Bit array telling for sure that a value was never added
+
+    Sized for the expected number of values and false positive rate, the
+    positions of a value are taken from the two halves of one pandas hash.
+    """
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        """Sets an empty filter
+
+        Args:
+            capacity (int): expected number of values
+            error_rate (float, optional): false positive rate at capacity. Defaults to 0.01.
+        """
+        self.bits = int(np.ceil(-max(capacity, 1) * np.log(error_rate) / np.log(2) ** 2))
+        self.hashes = max(1, int(round(self.bits / max(capacity, 1) * np.log(2))))
+        self.array = np.zeros((self.bits + 7) // 8, dtype=np.uint8)
+
+    def _positions(self, values: np.ndarray) -> np.ndarray:
+        hashed = pd.util.hash_array(values, hash_key=_HASH_KEY, categorize=False)
+        h1, h2 = hashed & np.uint64(0xFFFFFFFF), (hashed >> np.uint64(32)) | np.uint64(1)
+        rounds = np.arange(self.hashes, dtype=np.uint64)
+        return (h1[:, None] + rounds * h2[:, None]) % np.uint64(self.bits)
+
+    def add(self, values: np.ndarray):
+        """Adds the values
+
+        Args:
+            values (np.ndarray): values to be added
+        """
+        if len(values) == 0:
+            return
+        positions = self._positions(values).ravel()
+        np.bitwise_or.at(self.array, positions >> np.uint64(3), np.left_shift(1, positions & np.uint64(7)).astype(np.uint8))
+
+    def might_contain(self, values: np.ndarray) -> np.ndarray:
+        """Mask of the values which may have been added, False is always right
+
+        Args:
+            values (np.ndarray): values to be looked up
+
+        Returns:
+            np.ndarray: mask per value
+        """
+        if len(values) == 0:
+            return np.zeros(0, dtype=bool)
+        positions = self._positions(values)
+        bits = (self.array[positions >> np.uint64(3)] >> (positions & np.uint64(7)).astype(np.uint8)) & 1
+        return bits.all(axis=1)
+
+
+class EmailIndex:
+    """Emails already kept by the pipeline, across chunks and runs
+
+    The emails live in a hash set until it holds more than memory_limit
+    emails, it's then spilled to a sqlite file and emptied, so memory stays
+    bounded whatever the table size. Lookups go to the set and to the file
+    only once it has been spilled to. An optional Bloom filter in front
+    answers most of the new emails without touching the file.
+
+    Emails are only written to the file by commit, so a failed load can be
+    retried without its emails being taken for duplicates.
+    """
+    def __init__(self, path: str | None = None, memory_limit: int = 1_000_000, bloom_capacity: int | None = None):
+        """Opens the index, creating it when missing
+
+        Args:
+            path (str | None, optional): sqlite file kept between runs. Defaults to None,
+                a temporary file removed by close.
+            memory_limit (int, optional): emails held in memory before spilling. Defaults to 1_000_000.
+            bloom_capacity (int | None, optional): expected number of emails, turns the
+                Bloom filter on. Defaults to None, no filter.
+        """
+        self.temporary = path is None
+        if path is None:
+            fd, path = tempfile.mkstemp(prefix="etl_emails_", suffix=".sqlite")
+            os.close(fd)
+        self.path = path
+        self.memory_limit = memory_limit
+        self.bloom = BloomFilter(bloom_capacity) if bloom_capacity else None
+        self.__conn = sqlite3.connect(path, check_same_thread=False)
+        # A lost commit only costs re-adding the emails of the last frame
+        self.__conn.execute("pragma journal_mode=wal")
+        self.__conn.execute("pragma synchronous=normal")
+        self.__conn.execute("create table if not exists emails (email text primary key) without rowid")
+        self.__lock = threading.Lock()
+        self._memory = set()
+        self._unsaved = []
+        self._spilled = False
+        self.__load()
+
+    def __load(self):
+        """Reads the emails of the earlier runs into memory and the filter, the
+        file is left to the lookups when they don't fit"""
+        cursor = self.__conn.execute("select email from emails")
+        while True:
+            rows = cursor.fetchmany(100_000)
+            if not rows:
+                break
+            values = np.array([row[0] for row in rows], dtype=object)
+            if self.bloom is not None:
+                self.bloom.add(values)
+            if not self._spilled:
+                self._memory.update(values)
+                if len(self._memory) > self.memory_limit:
+                    self._memory.clear()
+                    self._spilled = True
+                    if self.bloom is None:
+                        break
+
+    def __len__(self) -> int:
+        with self.__lock:
+            if not self._spilled:
+                return len(self._memory)
+            stored = self.__conn.execute("select count(*) from emails").fetchone()[0]
+            return stored + len(set(self._unsaved))
+
+    def __contains__(self, email: str) -> bool:
+        return bool(self.contains([email])[0])
+
+    def __in_file(self, values: np.ndarray) -> np.ndarray:
+        found = set()
+        for start in range(0, len(values), _LOOKUP_BATCH):
+            batch = values[start:start + _LOOKUP_BATCH].tolist()
+            query = "select email from emails where email in (%s)" % ",".join("?" * len(batch))
+            found.update(row[0] for row in self.__conn.execute(query, batch))
+        return np.fromiter((value in found for value in values), dtype=bool, count=len(values))
+
+    def contains(self, values: Iterable) -> np.ndarray:
+        """Mask of the emails already in the index
+
+        Args:
+            values (Iterable): emails to be looked up
+
+        Returns:
+            np.ndarray: mask per email
+        """
+        values = _as_values(values)
+        with self.__lock:
+            if self.bloom is not None:
+                maybe = self.bloom.might_contain(values)
+            else:
+                maybe = np.ones(len(values), dtype=bool)
+            found = np.zeros(len(values), dtype=bool)
+            rows = np.flatnonzero(maybe)
+            memory = self._memory
+            found[rows] = np.fromiter((value in memory for value in values[rows]), dtype=bool, count=len(rows))
+            if self._spilled:
+                rows = rows[~found[rows]]
+                found[rows] = self.__in_file(values[rows])
+            return found
+
+    def add(self, values: Iterable):
+        """Adds emails, kept by the next commit
+
+        Args:
+            values (Iterable): emails not in the index yet
+        """
+        values = _as_values(values)
+        with self.__lock:
+            if self.bloom is not None:
+                self.bloom.add(values)
+            self._memory.update(values)
+            self._unsaved.extend(values.tolist())
+            if len(self._memory) > self.memory_limit:
+                self.__flush()
+                self._memory.clear()
+                self._spilled = True
+
+    def __flush(self):
+        # In key order the inserts append to the pages of the b-tree instead of splitting them
+        self._unsaved.sort()
+        self.__conn.executemany("insert or ignore into emails values (?)", ((value,) for value in self._unsaved))
+        self.__conn.commit()
+        self._unsaved = []
+
+    def commit(self):
+        """Writes the added emails to the file"""
+        with self.__lock:
+            self.__flush()
+
+    def seed(self, chunks: Iterable[pd.DataFrame | pd.Series]):
+        """Adds the emails of already loaded data and commits them
+
+        Args:
+            chunks (Iterable[pd.DataFrame | pd.Series]): emails, or frames with an email column
+        """
+        for chunk in chunks:
+            emails = chunk["email"] if isinstance(chunk, pd.DataFrame) else chunk
+            emails = emails.dropna().drop_duplicates()
+            self.add(emails[~self.contains(emails)])
+        self.commit()
+
+    def close(self):
+        """Commits and closes the file, removed if temporary"""
+        self.commit()
+        self.__conn.close()
+        if self.temporary:
+            os.remove(self.path)
+
+    def __enter__(self) -> "EmailIndex":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -1,210 +1,1191 @@
 from database_handler import DatabaseHandler
+from checkpoint import LAST, CheckpointStore, stage_key
+from dtype_plan import apply_dtype_plan, arrow_frame, compact_int, reason_column
+from email_index import EmailIndex
+from file_sources import file_chunks
+from metrics import Metrics
+from pipeline import Pipeline
+from pushdown import RECTIFY_DATE_DDL, pushdown_statement
+from validation import (DATE_RULE, EMAIL_RULE, NAME_RULE, REASONS, RULE_VERSION, RULES, SALARY_RULE, Rule,
+                        evaluate_rules, evaluate_rules_parallel, transform_pool, usable_workers)
 import pandas as pd
 import numpy as np
+from psycopg2 import sql
 import json
 import os
-import re
-import datetime
+import collections
+import contextlib
+import copy
+import itertools
+import threading
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator
+
+if TYPE_CHECKING:  # pragma: no cover
+    import sqlalchemy
+
+RAW_QUERY = "select * from tmp.employees_raw"
+# Name of the raw table in the watermark table
+RAW_SOURCE = "employees_raw"
+# Unique, not null key of the raw table, breaks the ties on the offset column of a named run
+RAW_KEY = "id"
+# Unique key of every target table in the "upsert" load method
+UPSERT_KEYS = {
+    "employees_processed": ("email",),
+    "employees_unprocessed": ("id",),
+}
+DEFAULT_CHUNKSIZE = 100_000
+# Emails a new email index is seeded with: the processed ones and the ones
+# of the rows rejected by a rule after the email rule, which took the email
+SEED_EMAILS_QUERY = (
+    "select email from tmp.employees_processed "
+    "union all select email from tmp.employees_unprocessed where reason = any(%s)"
+)
+
+class Records(Sequence):
+    """Table data in json, only serialized from the frame when it is first read
+
+    Stage methods return it so that runs which never look at the records
+    don't pay for a json encode and decode of the whole frame.
+    """
+    def __init__(self, df: pd.DataFrame):
+        """Keeps the frame to be serialized
+
+        Args:
+            df (pd.DataFrame): Table data
+        """
+        self._df = df
+        self._records = None
+
+    def materialize(self) -> list:
+        """Serializes the frame once, the frame is released afterwards
+
+        Returns:
+            list: Table data in json
+        """
+        if self._records is None:
+            self._records = json.loads(self._df.to_json(orient="records"))
+            self._df = None
+        return self._records
+
+    def __getitem__(self, index):
+        return self.materialize()[index]
+
+    def __len__(self) -> int:
+        if self._records is None:
+            return len(self._df)
+        return len(self._records)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, Records):
+            other = other.materialize()
+        return self.materialize() == other
+
+    def __repr__(self) -> str:
+        return repr(self.materialize())
+
+def _mark_text(value) -> str:
+    """Watermark or offset value as it is kept in its text column"""
+    return value.isoformat() if isinstance(value, pd.Timestamp) else str(value)
+
+
+def _skip_rows(chunks: Iterable[pd.DataFrame], rows: int) -> Iterator[pd.DataFrame]:
+    """Drops the first rows of a stream of chunks
+
+    Args:
+        chunks (Iterable[pd.DataFrame]): chunks
+        rows (int): rows to be dropped
+
+    Yields:
+        pd.DataFrame: the chunks after them, the first one cut
+    """
+    for chunk in chunks:
+        if rows >= len(chunk):
+            rows -= len(chunk)
+            continue
+        yield chunk.iloc[rows:].reset_index(drop=True) if rows else chunk
+        rows = 0
+
+
+class _PendingEmails:
+    """Email index of a pipelined run, which also holds the emails of the
+    chunks transformed but not loaded yet, so the next chunk can't take them
+    """
+    def __init__(self, index: EmailIndex):
+        self.index = index
+        self.pending = {}
+        self.__lock = threading.Lock()
+
+    def hold(self, key, emails: pd.Series | None):
+        with self.__lock:
+            self.pending[key] = set() if emails is None else set(emails)
+
+    def release(self, key):
+        with self.__lock:
+            self.pending.pop(key, None)
+
+    def contains(self, values) -> np.ndarray:
+        # Held emails are in the index before they are released, so the
+        # index read after the snapshot has every email which left it
+        with self.__lock:
+            held = [emails for emails in self.pending.values() if emails]
+        found = self.index.contains(values)
+        if held:
+            found |= np.fromiter((any(value in emails for emails in held) for value in values), dtype=bool, count=len(values))
+        return found
+
+    def add(self, values):
+        self.index.add(values)
+
+    def commit(self):
+        self.index.commit()
 
-abspath = os.path.abspath(__file__)
-dname = os.path.dirname(abspath)
-os.chdir(dname)
 
 class ETLProcessor:
     """Etl job to extract, transform and load a set of data from one table in postgres to another
     """
-    def __init__(self, data: list|pd.DataFrame|None=None):
+    def __init__(self, data: list|pd.DataFrame|None=None, load_method: str = "copy", engine: "sqlalchemy.Engine | None" = None,
+                 watermark_column: str | None = None, upsert_keys: dict[str, tuple[str, ...]] | None = None,
+                 transform_workers: int | None = None, read_connections: int | None = None,
+                 partition_column: str = "id", metrics: Metrics | None = None, compact: bool = False,
+                 arrow: bool = False, email_index: EmailIndex | None = None,
+                 checkpoints: CheckpointStore | None = None, run_id: str | None = None):
         """Sets enviroment variables
 
         Args:
             data (list | None, optional): Pandas dataframe object. Defaults to None.
+            load_method (str, optional): "copy", "insert" or "upsert", see DatabaseHandler.df_to_sql. Defaults to "copy".
+            engine (sqlalchemy.Engine | None, optional): Pooled engine shared by every stage and chunk,
+                see DatabaseHandler.shared_engine. Defaults to None, a connection per stage.
+            watermark_column (str | None, optional): Increasing column, such as id or an updated-at
+                column, to only extract the rows past the mark of the last run. Ties on it are broken
+                by partition_column, which must then be unique and not null. Defaults to None, the
+                whole table.
+            upsert_keys (dict[str, tuple[str, ...]] | None, optional): Unique key of every target
+                table in the "upsert" load method. Defaults to UPSERT_KEYS.
+            transform_workers (int | None, optional): Processes the transform is spread over, see
+                evaluate_rules_parallel. A chunked run starts them once for all its chunks.
+                Defaults to None, in process.
+            read_connections (int | None, optional): Connections the raw table is read over, in
+                ranges of partition_column. Defaults to None, a single select.
+            partition_column (str, optional): Indexed column the ranges are taken on. Defaults to "id".
+            metrics (Metrics | None, optional): Where every stage is measured. Defaults to a new Metrics.
+            compact (bool, optional): Cast the extracted frames with the dtype plan, see
+                dtype_plan.DTYPE_PLAN, clean integers to compact ones and encode the reasons.
+                Defaults to False.
+            arrow (bool, optional): Keep the frames Arrow backed from the read or the given data to
+                the load, the rules run on Arrow compute and COPY is written from the Arrow buffers.
+                Needs pyarrow. Defaults to False.
+            email_index (EmailIndex | None, optional): Emails kept by earlier chunks and runs,
+                which makes the email rule reject duplicates across them. Emails are added once
+                their frame is loaded. Defaults to None, unique inside each frame.
+            checkpoints (CheckpointStore | None, optional): Where the output of read and of every
+                rule stage is saved, a stage whose output is saved for the same input and rules is
+                restored instead of run. Stages are not cached with an email index, their output
+                depends on it. Defaults to None.
+            run_id (str | None, optional): Name of a chunked run, every chunk is loaded in one
+                transaction with the offset of the run: for the raw table the partition_column
+                value and the id of the last row, the table being read in that order with the
+                NULLs of partition_column last, the rows for a file. A rerun with the same name
+                goes on after the last loaded chunk. Defaults to None.
         """
+        self.load_method = load_method
+        self.engine = engine
+        self.watermark_column = watermark_column
+        self.upsert_keys = UPSERT_KEYS if upsert_keys is None else upsert_keys
+        self.transform_workers = transform_workers
+        self.read_connections = read_connections
+        self.partition_column = partition_column
+        self.metrics = Metrics() if metrics is None else metrics
+        self.compact = compact
+        self.arrow = arrow
+        self.email_index = email_index
+        self.new_emails = None
+        self.checkpoints = checkpoints
+        self.run_id = run_id
+        self.run_source = RAW_SOURCE
+        self.run_offset = None
+        self.raw_key = None
+        self.state_key = None
+        self.high_water = None
+        self.high_water_tie = None
+        self.__pool = None
         self.df = None
         if isinstance(data,list):
             self.df = pd.json_normalize(data)
         if isinstance(data, pd.DataFrame):
             self.df = data
-        self.copy_df = None
+        if self.df is not None and self.arrow:
+            self.df = arrow_frame(self.df)
+        self.raw = None
+        self.rejected_positions = np.zeros(0, dtype=np.int64)
+        self.rejected_codes = np.zeros(0, dtype=np.uint8)
+        self._kept = None
+        self.invalid_dates = 0
+        self.reason_codes = None
         if self.df is not None:
-            self.copy_df = self.df.copy()
-            self.copy_df["reason"] = ""
+            self._set_frame(self.df)
 
-    def read_data(self) -> list | None:
-        """Read SQL data to Dataframe
+    def _set_frame(self, df: pd.DataFrame):
+        """Sets the working dataframe and resets the rejection log
+
+        The frame is kept as it is in raw, never modified, the outliers are
+        built from it and the log when they are loaded.
+
+        Args:
+            df (pd.DataFrame): frame to be processed
+        """
+        self.raw = df
+        self.df = df
+        self.rejected_positions = np.zeros(0, dtype=np.int64)
+        self.rejected_codes = np.zeros(0, dtype=np.uint8)
+        self._kept = None
+        self.new_emails = None
+        self.raw_key = None
+        self.state_key = None
+        if self.watermark_column in df and df[self.watermark_column].notna().any():
+            self.high_water = df[self.watermark_column].max()
+            tie = self._tie_column()
+            if tie is not None and tie in df:
+                # Last row in the (watermark_column, tie) order the table is read in
+                self.high_water_tie = df.loc[df[self.watermark_column] == self.high_water, tie].max()
+
+    def _reject(self, rejected: np.ndarray, codes: int | np.ndarray):
+        """Adds rows of the working frame to the rejection log
+
+        Args:
+            rejected (np.ndarray): mask of the rejected rows of df
+            codes (int | np.ndarray): rule code of those rows, see validation.REASONS
+        """
+        kept = np.arange(len(self.raw)) if self._kept is None else self._kept
+        positions = kept[rejected]
+        codes = np.broadcast_to(np.asarray(codes, dtype=np.uint8), positions.shape)
+        self.rejected_positions = np.concatenate([self.rejected_positions, positions])
+        self.rejected_codes = np.concatenate([self.rejected_codes, codes])
+        self._kept = kept[~rejected]
+
+    def _reasons(self, codes: np.ndarray) -> pd.Categorical | np.ndarray:
+        """Reason of every rule code
+
+        Args:
+            codes (np.ndarray): rule codes, 0 for the kept rows
+
+        Returns:
+            pd.Categorical | np.ndarray: reasons, encoded in compact mode
+        """
+        return reason_column(codes, REASONS) if self.compact else REASONS[codes]
+
+    def outliers(self) -> pd.DataFrame:
+        """Rejected rows of the original frame with their reason, in the
+        order of the frame, built from the rejection log
+
+        Returns:
+            pd.DataFrame: outlier data
+        """
+        order = np.argsort(self.rejected_positions, kind="stable")
+        data = self.raw.iloc[self.rejected_positions[order]]
+        return data.assign(reason=self._reasons(self.rejected_codes[order]))
+
+    @property
+    def copy_df(self) -> pd.DataFrame | None:
+        """Original frame with the reason of every row, "" for the kept
+        ones. Built from the rejection log on every access.
+
+        Returns:
+            pd.DataFrame | None: frame with a reason column
+        """
+        if self.raw is None:
+            return None
+        codes = np.zeros(len(self.raw), dtype=np.uint8)
+        codes[self.rejected_positions] = self.rejected_codes
+        return self.raw.assign(reason=self._reasons(codes))
+
+    def _current_key(self) -> str:
+        """Key of the current state, the raw frame is saved when it has none yet"""
+        if self.state_key is None:
+            self.raw_key = self.checkpoints.save_raw(self.raw)
+            self.state_key = self.raw_key
+        return self.state_key
+
+    def _save_state(self, key: str, stage: str):
+        """Saves the current state as the output of a stage"""
+        self.checkpoints.save(
+            key,
+            stage,
+            self.raw_key,
+            None if self.df is self.raw else self.df,
+            {
+                "rejected_positions": self.rejected_positions,
+                "rejected_codes": self.rejected_codes,
+                "kept": self._kept,
+                "reason_codes": self.reason_codes,
+            },
+            {"invalid_dates": self.invalid_dates, "high_water": self.high_water, "high_water_tie": self.high_water_tie},
+        )
+        self.state_key = key
+
+    def _restore_state(self, state: dict):
+        """Sets the processor to a state loaded from the checkpoints"""
+        if state["raw_key"] != self.raw_key or self.raw is None:
+            self.raw = self.checkpoints.load_raw(state["raw_key"])
+        self.raw_key = state["raw_key"]
+        self.df = self.raw if state["df"] is None else state["df"]
+        arrays = state["arrays"]
+        self.rejected_positions = arrays["rejected_positions"]
+        self.rejected_codes = arrays["rejected_codes"]
+        self._kept = arrays.get("kept")
+        self.reason_codes = arrays.get("reason_codes")
+        self.invalid_dates = state["scalars"]["invalid_dates"]
+        self.high_water = state["scalars"]["high_water"]
+        self.high_water_tie = state["scalars"].get("high_water_tie")
+        self.new_emails = None
+        self.state_key = state["key"]
+
+    def _staged(self, stage: str, run: Callable[[], None]):
+        """Runs a stage, or restores its output when it is checkpointed for
+        the current state, the rules and the dtype modes
+
+        Args:
+            stage (str): stage name
+            run (Callable[[], None]): the stage, raising on failure
+        """
+        if self.checkpoints is None or self.email_index is not None:
+            run()
+            return
+        key = stage_key(self._current_key(), stage, RULE_VERSION, self.compact, self.arrow)
+        state = self.checkpoints.load(key)
+        if state is None:
+            run()
+            self._save_state(key, stage)
+            return
+        self._restore_state(state)
+        self.checkpoints.point(stage, key)
+        print(f"# {stage} restored from checkpoint")
+
+    def restore_checkpoint(self, stage: str = LAST) -> bool:
+        """Sets the processor to the latest saved output of a stage, so the
+        next stage runs on its own in this process
+
+        Args:
+            stage (str, optional): "read", "transform" or "rule:<name>". Defaults to the
+                state saved last, whatever its stage.
 
         Returns:
-            list | None: Table data in json or None if error
+            bool: true if success, else false
         """
         try:
-            db = DatabaseHandler()
-            self.df = db.query("select * from tmp.employees_raw")
-            self.copy_df = self.df.copy()
-            self.copy_df["reason"] = ""
-            if self.df.empty:
-                raise Exception("Empty table")
-            return json.loads(self.df.to_json(orient="records"))
+            key = self.checkpoints.latest(stage)
+            state = None if key is None else self.checkpoints.load(key)
+            if state is None:
+                raise Exception(f"No checkpoint of {stage}")
+            self._restore_state(state)
+            print(f"# Restored {state['stage']} checkpoint {key}")
+            return True
         except Exception as e:
             print("Exception ---->", e)
+            return False
+
+    def _read_options(self) -> dict:
+        """Options of the queries reading the raw table
+
+        Returns:
+            dict: Arrow backed columns in arrow mode
+        """
+        return {"dtype_backend": "pyarrow"} if self.arrow else {}
+
+    def _extracted(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Applies the dtype plan to an extracted frame in compact mode, and
+        makes sure it is Arrow backed in arrow mode
+
+        Args:
+            df (pd.DataFrame): raw frame
+
+        Returns:
+            pd.DataFrame: frame to be processed
+        """
+        if self.compact:
+            df = apply_dtype_plan(df)
+        return arrow_frame(df) if self.arrow else df
+
+    def _cast_cleaned(self, df: pd.DataFrame, columns) -> pd.DataFrame:
+        """Casts the columns cleaned by the rules, integers to compact ones in
+        compact mode and every one to its Arrow type in arrow mode
+
+        Args:
+            df (pd.DataFrame): cleaned frame
+            columns: names of the cleaned columns
+
+        Returns:
+            pd.DataFrame: frame with the cast columns
+        """
+        columns = [column for column in columns if column in df]
+        if self.compact:
+            ints = [column for column in columns if pd.api.types.is_integer_dtype(df[column])]
+            if ints:
+                df = df.assign(**{column: compact_int(df[column]) for column in ints})
+        if self.arrow and columns:
+            df = df.assign(**arrow_frame(df[columns]))
+        return df
+
+    def _handler(self) -> DatabaseHandler:
+        """Handler on the shared engine if there's one, else on its own connection
+
+        Returns:
+            DatabaseHandler: database handler
+        """
+        if self.engine is not None:
+            return DatabaseHandler(self.engine)
+        return DatabaseHandler()
+
+    def _tie_column(self) -> str | None:
+        """Column breaking the ties on the watermark column, None if it is the partition column"""
+        if self.watermark_column in (None, self.partition_column):
             return None
+        return self.partition_column
 
-    def remove_empty_name(self) -> list | None:
-        """Removes empty name
+    def _offset_tie_column(self) -> str | None:
+        """Column breaking the ties on the offset column of a named run, None if it is the key"""
+        return None if self.partition_column == RAW_KEY else RAW_KEY
+
+    def _order_columns(self) -> list[str]:
+        """Columns the raw table is read in the order of, to keep the mark or the offset right
+
+        NULLs come last in ascending order, after every value.
+        """
+        if self.watermark_column is not None:
+            tie = self._tie_column()
+            return [self.watermark_column] if tie is None else [self.watermark_column, tie]
+        if self.run_id is None:
+            return []
+        tie = self._offset_tie_column()
+        return [self.partition_column] if tie is None else [self.partition_column, tie]
+
+    def _watermark_filter(self) -> tuple[list, list]:
+        """Condition on the rows past the mark in incremental mode, or past
+        the offset of a resumed run
+
+        Raises:
+            ValueError: if a run is named in incremental mode, which resumes from the mark
 
         Returns:
-            list | None: Table data in json or None if error
+            tuple[list, list]: where conditions and their parameters
         """
-        try:
-            self.df = self.df[self.df.name != ""]
-            self.df = self.df.dropna(subset=["name"])
+        if self.run_id is not None:
+            if self.watermark_column is not None:
+                raise ValueError("Incremental runs resume from their watermark, not from a run id")
+            return self._offset_filter()
+        if self.watermark_column is None:
+            return [], []
+        column = sql.Identifier(self.watermark_column)
+        tie = self._tie_column()
+        if tie is None:
+            mark = self._handler().get_watermark(RAW_SOURCE, self.watermark_column)
+            if mark is None:
+                return [], []
+            return [sql.SQL("{} > %s").format(column)], [mark]
+        # A chunk may end in the middle of rows sharing the mark, the rest of
+        # them are after the last loaded row in (mark, tie) order
+        keyset = self._handler().get_watermark_keyset(RAW_SOURCE, self.watermark_column)
+        if keyset is None:
+            return [], []
+        mark, tie_value = keyset
+        if tie_value is None:
+            return [sql.SQL("{} > %s").format(column)], [mark]
+        return [sql.SQL("({}, {}) > (%s, %s)").format(column, sql.Identifier(tie))], [mark, tie_value]
 
-            # Capturing the exception cases with reason
-            mask = (~self.copy_df["id"].isin(self.df["id"])) & (self.copy_df['reason'] == "")
-            self.copy_df.loc[mask, "reason"] += self.copy_df.loc[mask, "reason"].astype(str) + "Empty Name"
-            return json.loads(self.df.to_json(orient="records"))
+    def _offset_filter(self) -> tuple[list, list]:
+        """Condition on the rows after the last loaded one of a resumed run,
+        in the (partition_column, id) order the raw table is read in
+
+        Returns:
+            tuple[list, list]: where conditions and their parameters
+        """
+        offset = self.run_offset
+        if offset is None or (offset["value"] is None and offset.get("tie") is None):
+            return [], []
+        column = sql.Identifier(self.partition_column)
+        value, tie = offset["value"], offset.get("tie")
+        if value is None:
+            # The run stopped in the NULLs, which come after every value
+            return [sql.SQL("{} is null and {} > %s").format(column, sql.Identifier(RAW_KEY))], [tie]
+        if tie is None:
+            return [sql.SQL("({0} > %s or {0} is null)").format(column)], [value]
+        # A chunk may end in the middle of rows sharing the value, the rest of
+        # them are after the last loaded row in (value, id) order
+        return [sql.SQL("(({0}, {1}) > (%s, %s) or {0} is null)").format(column, sql.Identifier(RAW_KEY))], [value, tie]
+
+    def _where(self, query: sql.Composable, conditions: list) -> sql.Composable:
+        """Query with its where conditions, if any"""
+        if not conditions:
+            return query
+        return sql.SQL("{} where {}").format(query, sql.SQL(" and ").join(conditions))
+
+    def _select(self, conditions: list, params: list) -> tuple:
+        """Query of the raw table, ordered by the watermark column in incremental
+        mode or the offset column in a named run
+
+        Args:
+            conditions (list): where conditions
+            params (list): their parameters
+
+        Returns:
+            tuple: query and its parameters if any
+        """
+        order = self._order_columns()
+        if not conditions and not order:
+            return (RAW_QUERY,)
+        query = self._where(sql.SQL(RAW_QUERY), conditions)
+        if order:
+            query = sql.SQL("{} order by {}").format(query, sql.SQL(", ").join(sql.Identifier(column) for column in order))
+        return (query, tuple(params)) if params else (query,)
+
+    def _extract_query(self) -> tuple:
+        """Query of the raw table, only the rows past the mark in incremental mode
+
+        Returns:
+            tuple: query and its parameters if any
+        """
+        return self._select(*self._watermark_filter())
+
+    def _partition_cuts(self, conditions: list, params: list, partitions: int) -> list:
+        """Values of partition_column splitting its rows in partitions ranges of
+        about the same number of rows
+
+        The cuts are quantiles taken by PostgreSQL, so they are exact values
+        of the column whatever its type or how sparse it is, at the cost of
+        sorting the column once.
+
+        Args:
+            conditions (list): where conditions of the read
+            params (list): their parameters
+            partitions (int): number of ranges
+
+        Raises:
+            Exception: if the cuts could not be read
+
+        Returns:
+            list: increasing cut points, at most partitions - 1 of them
+        """
+        if partitions < 2:
+            return []
+        column = sql.Identifier(self.partition_column)
+        query = sql.SQL(
+            "select percentile_disc(%s::float8[]) within group (order by {0}) as cuts from tmp.employees_raw"
+        ).format(column)
+        query = self._where(query, [*conditions, sql.SQL("{} is not null").format(column)])
+        fractions = [i / partitions for i in range(1, partitions)]
+        cuts = self._handler().query(query, (fractions, *params))
+        if cuts is None:
+            raise Exception("Partition cuts could not be read")
+        cuts = cuts["cuts"][0]
+        # No row has a value, or several quantiles fall on the same one
+        return [] if cuts is None else [cut for cut, _ in itertools.groupby(cuts) if cut is not None]
+
+    def _partition_queries(self, rows_per_partition: int | None = None) -> Iterator[tuple]:
+        """Splits the extraction in ranges of partition_column
+
+        The ranges hold about the same number of rows, see _partition_cuts:
+        one per connection or, given rows_per_partition, enough of them to
+        hold about that many rows each. The first range is open and the last
+        one also holds the NULLs, so every row is read once, in the order of
+        _order_columns across the ranges.
+
+        Args:
+            rows_per_partition (int | None, optional): Rows wanted per range. Defaults to None.
+
+        Raises:
+            Exception: if the row count could not be read
+
+        Yields:
+            tuple: query and its parameters of every range, in order
+        """
+        conditions, params = self._watermark_filter()
+        column = sql.Identifier(self.partition_column)
+        partitions = self.read_connections
+        if rows_per_partition:
+            count_query = self._where(sql.SQL("select count({}) as partition_rows from tmp.employees_raw").format(column), conditions)
+            count = self._handler().query(count_query, tuple(params) if params else None)
+            if count is None:
+                raise Exception("Partition row count could not be read")
+            partitions = max(partitions, -(-int(count["partition_rows"][0]) // rows_per_partition))
+        cuts = self._partition_cuts(conditions, params, partitions)
+        for start, stop in zip([None, *cuts], [*cuts, None]):
+            if start is None and stop is None:
+                yield self._select(conditions, params)
+            elif start is None:
+                yield self._select([*conditions, sql.SQL("{} < %s").format(column)], [*params, stop])
+            elif stop is None:
+                yield self._select([*conditions, sql.SQL("({0} >= %s or {0} is null)").format(column)], [*params, start])
+            else:
+                yield self._select([*conditions, sql.SQL("{0} >= %s and {0} < %s").format(column)], [*params, start, stop])
+
+    def _read_partition(self, query: tuple) -> pd.DataFrame:
+        """Reads one range on its own handler
+
+        Args:
+            query (tuple): query and its parameters
+
+        Returns:
+            pd.DataFrame: Raw rows of the range
+        """
+        frame = self._handler().query(*query, **self._read_options())
+        if frame is None:
+            raise Exception("Partition could not be read")
+        return frame
+
+    def read_partitions(self, rows_per_partition: int | None = None) -> Iterator[pd.DataFrame]:
+        """Reads the ranges of partition_column over read_connections connections at once
+
+        Ranges are yielded in order as soon as they are read, with at most
+        read_connections of them read ahead, empty ones are skipped.
+
+        Args:
+            rows_per_partition (int | None, optional): see _partition_queries. Defaults to None.
+
+        Yields:
+            pd.DataFrame: Raw rows of a range
+        """
+        queries = self._partition_queries(rows_per_partition)
+        with ThreadPoolExecutor(max_workers=self.read_connections, thread_name_prefix="etl_read") as pool:
+            pending = collections.deque(
+                pool.submit(self._read_partition, query)
+                for query in itertools.islice(queries, self.read_connections)
+            )
+            while pending:
+                frame = pending.popleft().result()
+                query = next(queries, None)
+                if query is not None:
+                    pending.append(pool.submit(self._read_partition, query))
+                if not frame.empty:
+                    yield frame
+
+    def _parallel_read(self) -> bool:
+        """Whether the raw table is read over several connections
+
+        Returns:
+            bool: true if read_connections is more than one
+        """
+        return bool(self.read_connections) and self.read_connections > 1
+
+    def read_data(self) -> Records | None:
+        """Read SQL data to Dataframe
+
+        Returns:
+            Records | None: Table data in json or None if error
+        """
+        try:
+            with self.metrics.stage("read") as stage:
+                if self._parallel_read():
+                    frames = list(self.read_partitions())
+                    self._set_frame(self._extracted(pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()))
+                else:
+                    db = self._handler()
+                    self._set_frame(self._extracted(db.query(*self._extract_query(), **self._read_options())))
+                stage["rows_out"] = len(self.df)
+                if self.df.empty:
+                    if self.watermark_column is None:
+                        raise Exception("Empty table")
+                    print(f"# Nothing new past the {self.watermark_column} watermark")
+            if self.checkpoints is not None:
+                self._save_state(self._current_key(), "read")
+            return Records(self.df)
         except Exception as e:
             print("Exception ---->", e)
             return None
 
-    def remove_invalid_email(self) -> list | None:
-        """Remove invalid email and duplicate emails
+    def read_data_chunks(self, chunksize: int = DEFAULT_CHUNKSIZE) -> Iterator[pd.DataFrame]:
+        """Streams the raw table through a server-side cursor, or in ranges
+        of about chunksize rows over several connections
+
+        Args:
+            chunksize (int, optional): Rows per chunk. Defaults to DEFAULT_CHUNKSIZE.
+
+        Yields:
+            pd.DataFrame: Raw table chunk of at most chunksize rows, or a range
+        """
+        if self._parallel_read():
+            if self.watermark_column not in (None, self.partition_column):
+                raise ValueError("Incremental chunks must be partitioned on the watermark column")
+            yield from self.read_partitions(chunksize)
+            return
+        query, *params = self._extract_query()
+        db = self._handler()
+        yield from db.query_chunks(query, chunksize, *params, **self._read_options())
+
+    def read_file_chunks(self, path: str, chunksize: int = DEFAULT_CHUNKSIZE) -> Iterator[pd.DataFrame]:
+        """Streams a dump file shaped like the raw table, see file_sources.file_chunks
+
+        Args:
+            path (str): .json, .ndjson, .jsonl or .csv file
+            chunksize (int, optional): Rows per chunk. Defaults to DEFAULT_CHUNKSIZE.
+
+        Yields:
+            pd.DataFrame: Chunk of at most chunksize rows
+        """
+        if self.watermark_column is not None:
+            raise ValueError("The watermark only applies to the raw table, not to files")
+        chunks = file_chunks(path, chunksize)
+        if self.run_offset is not None:
+            chunks = _skip_rows(chunks, self.run_offset["rows"])
+        yield from chunks
+
+    def _timed_reads(self, chunks: Iterable[pd.DataFrame]) -> Iterator[pd.DataFrame]:
+        """Records a read stage for every chunk taken from the source"""
+        chunks = iter(chunks)
+        try:
+            while True:
+                with self.metrics.stage("read") as stage:
+                    chunk = next(chunks, None)
+                    stage["rows_out"] = 0 if chunk is None else len(chunk)
+                if chunk is None:
+                    return
+                yield chunk
+        finally:
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                close()
+
+    def _finish_chunks(self, count: int):
+        """Checks a chunked run found rows and marks a named run completed"""
+        if count == 0 and self.watermark_column is not None:
+            print(f"# Nothing new past the {self.watermark_column} watermark")
+        elif count == 0 and self.run_offset is None:
+            raise Exception("Empty table")
+        if self.run_id is not None and not self._handler().complete_chunk_offset(self.run_id, self.run_source):
+            raise Exception(f"Run {self.run_id} could not be marked completed")
+
+    def _worker(self, chunk: pd.DataFrame, email_index: _PendingEmails | None) -> "ETLProcessor":
+        """Processor of one chunk of a pipelined run, sharing the settings,
+        metrics and connections of this one
+
+        Args:
+            chunk (pd.DataFrame): raw chunk
+            email_index (_PendingEmails | None): index shared by the chunks of the run
 
         Returns:
-            list | None: Table data in json or None if error
+            ETLProcessor: processor holding the chunk
+        """
+        worker = copy.copy(self)
+        worker.email_index = email_index
+        worker.reason_codes = None
+        worker.invalid_dates = 0
+        worker._set_frame(worker._extracted(chunk))
+        return worker
+
+    @contextlib.contextmanager
+    def _shared_pool(self):
+        """Starts the transform workers once for every chunk of a run, before
+        the threads of a pipelined run
         """
-        regex = r"\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,7}\b"
-        def check_email(x: str) -> bool:
-            """Checks a string if it is passing email logic using regex
+        workers = usable_workers(self.transform_workers or 0)
+        if workers < 2 or self.__pool is not None:
+            yield
+            return
+        self.__pool = transform_pool(workers)
+        try:
+            yield
+        finally:
+            self.__pool.shutdown()
+            self.__pool = None
+
+    def process_chunks_pipelined(self, chunks: Iterable[pd.DataFrame], queue_size: int = 2) -> bool:
+        """Same as process_chunks with the stages overlapped: chunk N+1 is
+        read while chunk N is transformed and chunk N-1 is loaded, each in
+        its own thread, see pipeline.Pipeline
+
+        The queues between the threads hold queue_size chunks, so a slow
+        load holds the read back and at most 2 * queue_size + 3 chunks are
+        in memory. Chunks are loaded in order, so the watermark and the run
+        offset only move forward. The first failure stops the run, the
+        chunks before it stay loaded.
 
-            Args:
-                x (str): Email to be tested
+        Args:
+            chunks (Iterable[pd.DataFrame]): Raw frames to be processed
+            queue_size (int, optional): Chunks waiting between two stages. Defaults to 2.
+
+        Returns:
+            bool: true if every chunk was loaded, else false
+        """
+        try:
+            emails = None if self.email_index is None else _PendingEmails(self.email_index)
 
-            Returns:
-                bool: True if email, else False
-            """
-            if x:
-                return re.fullmatch(regex, x) is not None
+            def transform(chunk: pd.DataFrame) -> ETLProcessor:
+                worker = self._worker(chunk, emails)
+                worker._staged("transform", worker._run_transform)
+                if emails is not None:
+                    emails.hold(worker, worker.new_emails)
+                return worker
+
+            def load(worker: ETLProcessor):
+                if not worker.load_all():
+                    raise Exception("Chunk was not loaded successfully.")
+                if emails is not None:
+                    emails.release(worker)
+                self.high_water = worker.high_water
+                self.high_water_tie = worker.high_water_tie
+                print(f"# Chunk processed ({len(worker.raw)} rows)")
+
+            with self._shared_pool():
+                count = Pipeline([("transform", transform), ("load", load)], queue_size).run(self._timed_reads(chunks))
+            self._finish_chunks(count)
+            return True
+        except Exception as e:
+            print("Exception ---->", e)
             return False
+
+    def process_chunks(self, chunks: Iterable[pd.DataFrame]) -> bool:
+        """Runs transform and both loaders on every chunk, so that peak memory
+        depends on the chunk size and not on the table size.
+
+        Email uniqueness is only enforced inside each chunk, across chunks
+        with an email index. In incremental mode the mark moves with every
+        chunk.
+
+        Args:
+            chunks (Iterable[pd.DataFrame]): Raw frames to be processed
+
+        Returns:
+            bool: true if every chunk was loaded, else false
+        """
         try:
-            check_email_vectorize = np.vectorize(check_email)
-            self.df = self.df[
-                check_email_vectorize(self.df.email)
-            ]
-            self.df = self.df.dropna(subset=["email"])
-            self.df = self.df.drop_duplicates(subset=["email"])
-            
-            # Capturing the exception cases with reason
-            mask = (~self.copy_df["id"].isin(self.df["id"])) & (self.copy_df['reason'] == "")
-            self.copy_df.loc[mask, "reason"] += self.copy_df.loc[mask, "reason"].astype(str) + "Invalid or Duplicated Email"
-            return json.loads(self.df.to_json(orient="records"))
+            count = 0
+            with self._shared_pool():
+                for chunk in self._timed_reads(chunks):
+                    count += 1
+                    self._set_frame(self._extracted(chunk))
+                    self._staged("transform", self._run_transform)
+                    if not self.load_all():
+                        raise Exception(f"Chunk {count} was not loaded successfully.")
+                    print(f"# Chunk {count} processed ({len(chunk)} rows)")
+            self._finish_chunks(count)
+            return True
         except Exception as e:
             print("Exception ---->", e)
-            return None
+            return False
 
-    def remove_nega_sal(self) -> list | None:
-        """Fetches only numbers from salary field, also removes negative or 0 salary
+    def run_chunked(self, chunksize: int = DEFAULT_CHUNKSIZE, pipelined: bool = False) -> bool:
+        """Streams the raw table in chunks through transform and load
+
+        Args:
+            chunksize (int, optional): Rows per chunk. Defaults to DEFAULT_CHUNKSIZE.
+            pipelined (bool, optional): Overlap the stages, see process_chunks_pipelined. Defaults to False.
+
+        Returns:
+            bool: true if success, else false
+        """
+        return self._run_source(RAW_SOURCE, lambda: self.read_data_chunks(chunksize), pipelined)
+
+    def run_file(self, path: str, chunksize: int = DEFAULT_CHUNKSIZE, pipelined: bool = False) -> bool:
+        """Streams a dump file in chunks through transform and load, instead
+        of the raw table
+
+        Args:
+            path (str): .json, .ndjson, .jsonl or .csv file
+            chunksize (int, optional): Rows per chunk. Defaults to DEFAULT_CHUNKSIZE.
+            pipelined (bool, optional): Overlap the stages, see process_chunks_pipelined. Defaults to False.
 
         Returns:
-            list | None: Table data in json or None if error
+            bool: true if success, else false
         """
-        def clean_sal(x: str|None) -> int:
-            """Cleaning the salary string by extracting just the number
+        return self._run_source("file:" + os.path.abspath(path), lambda: self.read_file_chunks(path, chunksize), pipelined)
 
-            Args:
-                x (str): string which needs cleaning
+    def _run_source(self, source: str, chunks: Callable[[], Iterable[pd.DataFrame]], pipelined: bool) -> bool:
+        """Processes the chunks of a source, unless its named run already completed
 
-            Returns:
-                int: salary if there's a number, or 0
-            """
-            if x:
-                return int(re.sub(r"[^\d]+", "", x) or "0")
-            return 0
-        
+        Args:
+            source (str): what the run reads
+            chunks (Callable[[], Iterable[pd.DataFrame]]): opens the chunks of the source
+            pipelined (bool): overlap the stages
+
+        Returns:
+            bool: true if success, else false
+        """
         try:
-            clean_sal_vectorize = np.vectorize(clean_sal)
-            self.df.salary = clean_sal_vectorize(self.df.salary)
-            self.df = self.df[self.df.salary > 0]
-            self.df = self.df.dropna(subset=["salary"])
+            if self._start_run(source):
+                return True
+        except Exception as e:
+            print("Exception ---->", e)
+            return False
+        if pipelined:
+            return self.process_chunks_pipelined(chunks())
+        return self.process_chunks(chunks())
 
-            # Capturing the exception cases with reason
-            mask = (~self.copy_df["id"].isin(self.df["id"])) & (self.copy_df['reason'] == "")
-            self.copy_df.loc[mask, "reason"] += self.copy_df.loc[mask, "reason"].astype(str) + "Invalid Salary or less than 0 value"
-            return json.loads(self.df.to_json(orient="records"))
+    def _start_run(self, source: str) -> bool:
+        """Reads the committed offset of a named run
+
+        Args:
+            source (str): what the run reads
+
+        Returns:
+            bool: true if the run already completed, nothing is left to do
+        """
+        self.run_source = source
+        self.run_offset = None
+        if self.run_id is None:
+            return False
+        self.run_offset = self._handler().get_chunk_offset(self.run_id, source)
+        if self.run_offset is None:
+            return False
+        if self.run_offset["completed"]:
+            print(f"# Run {self.run_id} already completed")
+            return True
+        print(f"# Run {self.run_id} resumed after {self.run_offset['chunks']} chunks ({self.run_offset['rows']} rows)")
+        return False
+
+    def run_pushdown(self) -> bool:
+        """Validates and loads the raw table inside PostgreSQL, without
+        pulling the rows, see pushdown.pushdown_statement
+
+        The rules run as one INSERT ... SELECT into both tables, in a single
+        transaction, and give the same processed and outlier rows as the
+        pandas path over the table read in partition_column order. Nothing
+        is kept in df, the counts of the rules are measured in the pushdown
+        stage. Incremental, named run and upsert modes and the email index
+        need the rows in pandas and fail here.
+
+        Returns:
+            bool: true if success, else false
+        """
+        try:
+            if self.watermark_column is not None or self.run_id is not None or self.email_index is not None \
+                    or self.load_method == "upsert":
+                raise ValueError("Pushdown appends the whole raw table, without a watermark, run id, email index or upsert")
+            with self.metrics.stage("pushdown") as stage:
+                columns = self._handler().table_columns("tmp", RAW_SOURCE)
+                if not columns:
+                    raise Exception(f"Table tmp.{RAW_SOURCE} not found")
+                statement, params = pushdown_statement(columns, order_column=self.partition_column)
+                counts = self._handler().execute([(RECTIFY_DATE_DDL, None), (statement, params)])
+                rows = np.zeros(len(RULES) + 1, dtype=np.int64)
+                filled = np.zeros(len(RULES) + 1, dtype=np.int64)
+                for code, count, not_empty in counts:
+                    rows[code], filled[code] = count, not_empty
+                stage["rows_in"] = int(rows.sum())
+                stage["rows_out"] = int(rows[0])
+                stage["rejected"] = {rule.name: int(count) for rule, count in zip(RULES, rows[1:])}
+            self.invalid_dates = int(filled[RULES.index(DATE_RULE) + 1])
+            if self.invalid_dates:
+                print(f"# {self.invalid_dates} join dates could not be rectified")
+            print(f"# Data pushed down, {rows[0]} rows processed and {rows[1:].sum()} outliers")
+            return True
         except Exception as e:
             print("Exception ---->", e)
-            return None
+            return False
 
-    def remove_invalid_date(self) -> list | None:
-        """Removes invalid date using the function
+    def _apply_rule(self, rule: Rule) -> Records | None:
+        """Removes the rows failing one validation rule
+
+        Args:
+            rule (Rule): Rule to be applied
 
         Returns:
-            list | None: Table data in json or None if error
-        """
-
-        def rectify_date(d: str | None) -> datetime.datetime | None:
-            """This function converts any format of datetime consisting of yyyy, mm, dd into proper universal yyyy-mm-dd
-
-            Args:
-                d (str): the string which needs to be rectify
-
-            Returns:
-                datetime.datetime | None: Datetime parsed object or None if error
-            """
-            if not d:
-                return None
-            sep = re.findall(r"[^0-9]", d)
-            if sep:
-                t = d.split(sep[0])
-                y = 0
-                m = 0
-                dd = 0
-                for i in t:
-                    if len(i) == 4 and y == 0:
-                        y = int(i)
-                    elif int(i) < 13 and m == 0:
-                        m = int(i)
-                    else:
-                        dd = int(i)
-                # print(y,m,dd)
-                try:
-                    return datetime.datetime(y, m, dd)
-                except Exception as e:
-                    print(f"Exception for the data {d}---->", e)
-                    return None
-                
+            Records | None: Table data in json or None if error
+        """
         try:
-            rectify_date_vector_fun = np.vectorize(rectify_date)
-            self.df.join_date = rectify_date_vector_fun(self.df.join_date)
-            self.df = self.df.dropna(subset=["join_date"])
+            self._staged(f"rule:{rule.name}", lambda: self._run_rule(rule))
+            return Records(self.df)
+        except Exception as e:
+            print("Exception ---->", e)
+            return None
+
+    def _run_rule(self, rule: Rule):
+        """Body of _apply_rule, raises on failure"""
+        with self.metrics.stage(f"rule:{rule.name}", rows_in=len(self.df)) as stage:
+            index = self.email_index if rule.unique else None
+            mask, values = rule.evaluate(self.df[rule.column], np.ones(len(self.df), dtype=bool), index)
+            if index is not None:
+                self.new_emails = self.df[rule.column][mask]
+            if values is not None:
+                self.df = self._cast_cleaned(self.df.assign(**{rule.column: values}), [rule.column])
+            self.df = self.df[mask]
 
             # Capturing the exception cases with reason
-            mask = (~self.copy_df["id"].isin(self.df["id"])) & (self.copy_df['reason'] == "")
-            self.copy_df.loc[mask, "reason"] += self.copy_df.loc[mask, "reason"].astype(str) + "Invalid Date format"
+            self._reject(~mask, RULES.index(rule) + 1)
+            stage["rows_out"] = len(self.df)
+            stage["rejected"] = {rule.name: stage["rows_in"] - len(self.df)}
+
+    @staticmethod
+    def _took_email(codes: np.ndarray) -> np.ndarray:
+        """Mask of the rows which passed the email rule, whatever came after
+
+        Args:
+            codes (np.ndarray): per row the code of the first failed rule or 0
+
+        Returns:
+            np.ndarray: mask of the rows whose email is now taken
+        """
+        return (codes == 0) | (codes > RULES.index(EMAIL_RULE) + 1)
+
+    def _commit_emails(self):
+        """Adds the emails of the loaded frame to the email index"""
+        if self.email_index is None or self.new_emails is None:
+            return
+        self.email_index.add(self.new_emails)
+        self.email_index.commit()
+        self.new_emails = None
+
+    def seed_email_index(self, chunksize: int = DEFAULT_CHUNKSIZE) -> bool:
+        """Fills the email index with the emails of the target tables, once
+        when the index is new
+
+        Args:
+            chunksize (int, optional): Emails fetched per round trip. Defaults to DEFAULT_CHUNKSIZE.
+
+        Returns:
+            bool: true if success, else false
+        """
+        try:
+            reasons = [rule.reason for rule in RULES[RULES.index(EMAIL_RULE) + 1:]]
+            db = self._handler()
+            self.email_index.seed(db.query_chunks(SEED_EMAILS_QUERY, chunksize, (reasons,)))
+            print(f"# Email index seeded with {len(self.email_index)} emails")
+            return True
+        except Exception as e:
+            print("Exception ---->", e)
+            return False
 
-            return json.loads(self.df.to_json(orient="records"))
+    def _count_invalid_dates(self, dates: pd.Series, invalid: np.ndarray):
+        """Counts the non empty dates which could not be rectified
+
+        Args:
+            dates (pd.Series): Raw join dates
+            invalid (np.ndarray): Mask of the rows rejected by the date rule
+        """
+        self.invalid_dates = int((invalid & dates.notna().to_numpy() & (dates != "").to_numpy()).sum())
+        if self.invalid_dates:
+            print(f"# {self.invalid_dates} join dates could not be rectified")
+
+    def remove_empty_name(self) -> Records | None:
+        """Removes empty name
+
+        Returns:
+            Records | None: Table data in json or None if error
+        """
+        return self._apply_rule(NAME_RULE)
+
+    def remove_invalid_email(self) -> Records | None:
+        """Remove invalid email and duplicate emails
+
+        Returns:
+            Records | None: Table data in json or None if error
+        """
+        return self._apply_rule(EMAIL_RULE)
+
+    def remove_nega_sal(self) -> Records | None:
+        """Fetches only numbers from salary field, also removes negative or 0 salary
+
+        Returns:
+            Records | None: Table data in json or None if error
+        """
+        return self._apply_rule(SALARY_RULE)
+
+    def remove_invalid_date(self) -> Records | None:
+        """Removes invalid date using the function
+
+        The number of non empty dates which could not be rectified is kept
+        in invalid_dates.
+
+        Returns:
+            Records | None: Table data in json or None if error
+        """
+        try:
+            dates = self.df["join_date"]
+            records = self._apply_rule(DATE_RULE)
+            if records is not None:
+                self._count_invalid_dates(dates, ~dates.index.isin(self.df.index))
+            return records
         except Exception as e:
             print("Exception ---->", e)
             return None
 
     def transform_data(self):
-        self.remove_empty_name()
-        self.remove_invalid_email()
-        self.remove_nega_sal()
-        self.remove_invalid_date()        
+        """Runs every validation rule in a single pass over the frame
+
+        Each row keeps the code of the first rule it fails, which gives the
+        same processed and outlier data as running the remove_* stages one
+        after the other.
+        """
+        try:
+            self._staged("transform", self._run_transform)
+        except Exception as e:
+            print("Exception ---->", e)
+
+    def _run_transform(self):
+        """Body of transform_data, raises on failure"""
+        with self.metrics.stage("transform", rows_in=len(self.df)) as stage:
+            source = self.df
+            if self.transform_workers and self.transform_workers > 1:
+                cleaned, codes = evaluate_rules_parallel(source, self.transform_workers, index=self.email_index,
+                                                         pool=self.__pool)
+            else:
+                cleaned, codes = evaluate_rules(source, index=self.email_index)
+            self.reason_codes = codes
+            if self.email_index is not None and EMAIL_RULE.column in source:
+                self.new_emails = source[EMAIL_RULE.column][self._took_email(codes)]
+            cleaned = self._cast_cleaned(cleaned, [rule.column for rule in RULES])
+            self.df = cleaned[codes == 0]
+            rejected = codes != 0
+            self._reject(rejected, codes[rejected])
+            if "join_date" in cleaned:
+                self._count_invalid_dates(source["join_date"], codes == RULES.index(DATE_RULE) + 1)
+            stage["rows_out"] = len(self.df)
+            counts = np.bincount(codes, minlength=len(RULES) + 1)
+            stage["rejected"] = {rule.name: int(count) for rule, count in zip(RULES, counts[1:])}
+
+    def _load(self, data: pd.DataFrame, table_name: str, label: str):
+        """Pushes one frame to its table on its own handler
+
+        Args:
+            data (pd.DataFrame): frame which needs to be pushed
+            table_name (str): table in the tmp schema
+            label (str): name of the data in the messages
+
+        Raises:
+            Exception: if the data was not pushed
+        """
+        with self.metrics.stage(f"load:{table_name}", rows_in=len(data)) as stage:
+            db = self._handler()
+            key = self.upsert_keys.get(table_name) if self.load_method == "upsert" else None
+            if not db.df_to_sql(data, table_name, "tmp", method=self.load_method, key=key):
+                raise Exception(f"{label} was not pushed successfully.")
+            stage["rows_out"] = len(data)
+        print(f"# Data pushed {label}")
+
+    def _sinks(self) -> list[tuple[pd.DataFrame, str, str]]:
+        """Frames to be loaded with their table and label
+
+        Returns:
+            list[tuple[pd.DataFrame, str, str]]: processed and outlier sinks
+        """
+        return [
+            (self.df, "employees_processed", "Transformed data"),
+            (self.outliers(), "employees_unprocessed", "Outlier data"),
+        ]
+
+    def _check_single_load(self):
+        """Refuses loading one table on its own in incremental mode, the mark
+        only moves with both tables, see load_all
+
+        Raises:
+            ValueError: in incremental mode
+        """
+        if self.watermark_column is not None:
+            raise ValueError("Incremental loads move the watermark with both tables, use load_all")
 
     def load_data(self) -> bool:
-        """Inserts data while also comparing for duplicacy
+        """Inserts data while also comparing for duplicacy, the kept emails
+        join the email index once the rows are in
 
         Returns:
             bool: true if success, else false
         """
         try:
+            self._check_single_load()
             # To make sure we are not pushing with same email again
-            db = DatabaseHandler()
-            out = db.df_to_sql(self.df, "employees_processed", "tmp")
-            if out:
-                print("# Data pushed Transformed data")
-            else:
-                raise Exception("Data was not pushed successfully.")
+            self._load(self.df, "employees_processed", "Transformed data")
+            self._commit_emails()
+            return True
         except Exception as e:
             print("Exception ---->", e)
             return False
@@ -216,14 +1197,117 @@ class ETLProcessor:
             bool: true if success, else false
         """
         try:
-            # To make sure we are not pushing with same email again
-            # data = self.copy_df[~self.copy_df["id"].isin(self.df["id"])]
-            db = DatabaseHandler()
-            out = db.df_to_sql(self.copy_df[self.copy_df["reason"]!=""], "employees_unprocessed", "tmp")
-            if out:
-                print("# Data pushed Outlier data")
-            else:
-                raise Exception("Data was not pushed successfully.")
+            self._check_single_load()
+            self._load(self.outliers(), "employees_unprocessed", "Outlier data")
+            return True
+        except Exception as e:
+            print("Exception ---->", e)
+            return False
+
+    def _load_incremental(self, sinks: list[tuple[pd.DataFrame, str, str]]) -> bool:
+        """Pushes the sinks and moves the high-water mark atomically
+
+        Args:
+            sinks (list[tuple[pd.DataFrame, str, str]]): see _sinks
+
+        Returns:
+            bool: true if success, else false
+        """
+        rows = sum(len(data) for data, _, _ in sinks)
+        with self.metrics.stage("load:incremental", rows_in=rows) as stage:
+            db = self._handler()
+            value = _mark_text(self.high_water)
+            out = db.load_with_watermark(
+                [(data, table_name) for data, table_name, _ in sinks],
+                "tmp",
+                RAW_SOURCE,
+                self.watermark_column,
+                value,
+                keys=self.upsert_keys if self.load_method == "upsert" else None,
+                tie=None if self.high_water_tie is None else _mark_text(self.high_water_tie),
+            )
+            stage["rows_out"] = rows if out else 0
+        if out:
+            print(f"# Data pushed, {self.watermark_column} watermark moved to {value}")
+        return out
+
+    def _load_offset(self, sinks: list[tuple[pd.DataFrame, str, str]]) -> bool:
+        """Pushes the sinks of a chunk and records the offset of the run atomically
+
+        Args:
+            sinks (list[tuple[pd.DataFrame, str, str]]): see _sinks
+
+        Returns:
+            bool: true if success, else false
+        """
+        rows = sum(len(data) for data, _, _ in sinks)
+        column, value, tie = None, None, None
+        if self.run_source == RAW_SOURCE and not self.raw.empty:
+            # The last row read, the chunks come in the order of _order_columns
+            column, last = self.partition_column, self.raw.iloc[-1]
+            if not pd.isna(last[column]):
+                value = _mark_text(last[column])
+            if self._offset_tie_column() is not None:
+                tie = _mark_text(last[RAW_KEY])
+            elif value is None:
+                raise ValueError(f"{column} is NULL in the last row, a run can't resume after it")
+        with self.metrics.stage("load:offset", rows_in=rows) as stage:
+            out = self._handler().load_with_offset(
+                [(data, table_name) for data, table_name, _ in sinks],
+                "tmp",
+                self.run_id,
+                self.run_source,
+                column,
+                value,
+                len(self.raw),
+                keys=self.upsert_keys if self.load_method == "upsert" else None,
+                tie=tie,
+            )
+            stage["rows_out"] = rows if out else 0
+        if out:
+            print(f"# Data pushed, run {self.run_id} committed up to {value if value is not None else 'this chunk'}")
+        return out
+
+    def load_all(self) -> bool:
+        """Loads the processed and the outlier data at the same time
+
+        The two tables are disjoint, so each one is pushed from its own
+        thread on its own connection, pooled when the processor has an
+        engine. Both loads always run to the end, every failure is reported.
+
+        In incremental mode both are pushed in one transaction with the move
+        of the high-water mark instead, so a failed run is fully retried, and
+        in a named run with the offset of the run.
+
+        The emails of the frame go to the email index once both are loaded.
+        An empty frame in incremental mode has nothing new to load.
+
+        Returns:
+            bool: true if both were loaded, else false
+        """
+        if self.watermark_column is not None and (self.raw is None or self.raw.empty):
+            print(f"# Nothing new past the {self.watermark_column} watermark")
+            return True
+        try:
+            sinks = self._sinks()
+            if self.watermark_column is not None and self.high_water is not None:
+                out = self._load_incremental(sinks)
+                if out:
+                    self._commit_emails()
+                return out
+            if self.run_id is not None:
+                out = self._load_offset(sinks)
+                if out:
+                    self._commit_emails()
+                return out
         except Exception as e:
             print("Exception ---->", e)
-            return False
\ No newline at end of file
+            return False
+        with ThreadPoolExecutor(max_workers=len(sinks), thread_name_prefix="etl_load") as pool:
+            futures = [pool.submit(self._load, *sink) for sink in sinks]
+        errors = [future.exception() for future in futures if future.exception() is not None]
+        for e in errors:
+            print("Exception ---->", e)
+        if not errors:
+            self._commit_emails()
+        return not errors
@@ -0,0 +1,225 @@
+import codecs
+import collections
+import json
+import mmap
+import os
+import re
+from typing import Iterable, Iterator
+
+import pandas as pd
+
+# Bytes parsed at a time, cut on a line end for NDJSON. A block is decoded
+# into Python objects at once, which take several times its size
+BLOCK_SIZE = 4 << 20
+# Text columns of a csv dump are kept as they are written, the id is a number
+CSV_DTYPES = collections.defaultdict(lambda: str, id="Int64")
+# Whitespace and the commas between the objects of an array
+_SEPARATORS = re.compile(r"[\s,]*")
+# Characters before the end of the window a decode error of a value cut by
+# the window can be reported at, the longest being a cut \uXXXX escape
+_CUT_SLACK = 6
+
+
+def _rechunk(frames: Iterable[pd.DataFrame], chunksize: int) -> Iterator[pd.DataFrame]:
+    """Cuts frames of any length into chunks of chunksize rows, the last one shorter
+
+    Args:
+        frames (Iterable[pd.DataFrame]): parsed frames
+        chunksize (int): rows per chunk
+
+    Yields:
+        pd.DataFrame: chunk indexed from 0
+    """
+    pending, rows = [], 0
+    for frame in frames:
+        pending.append(frame)
+        rows += len(frame)
+        if rows < chunksize:
+            continue
+        data = pd.concat(pending, ignore_index=True) if len(pending) > 1 else frame.reset_index(drop=True)
+        start = 0
+        while len(data) - start >= chunksize:
+            yield data.iloc[start:start + chunksize].reset_index(drop=True)
+            start += chunksize
+        pending = [data.iloc[start:]] if start < len(data) else []
+        rows = len(data) - start
+    if rows:
+        yield pd.concat(pending, ignore_index=True)
+
+
+def _records_frame(records: list[dict]) -> pd.DataFrame:
+    """Frame of decoded objects, normalized like ETLProcessor(data=list)
+
+    json_normalize walks every object, flat objects skip it and give the same frame.
+    """
+    frame = pd.DataFrame(records)
+    for _, column in frame.items():
+        if column.dtype == object and pd.api.types.infer_dtype(column, skipna=True) not in ("string", "empty"):
+            if any(isinstance(value, dict) for value in column):
+                return pd.json_normalize(records)
+    return frame
+
+
+def _mapped(f) -> mmap.mmap | None:
+    """Read only map of an open file, None for an empty one which can't be mapped"""
+    if os.fstat(f.fileno()).st_size == 0:
+        return None
+    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _cut_by_window(error: json.JSONDecodeError, buffer: str) -> bool:
+    """Whether a decode error comes from a value cut at the end of the
+    window rather than from invalid json
+
+    An unterminated string is reported at its start, the other cut values
+    a few characters before the end at most.
+    """
+    return error.msg.startswith("Unterminated string") or error.pos >= len(buffer) - _CUT_SLACK
+
+
+def read_ndjson(path: str, chunksize: int, block_size: int = BLOCK_SIZE) -> Iterator[pd.DataFrame]:
+    """Streams a file of one json object per line
+
+    The file is memory mapped, the lines of a block are joined into one
+    array decoded in a single call.
+
+    Args:
+        path (str): NDJSON file
+        chunksize (int): rows per chunk
+        block_size (int, optional): bytes parsed at a time. Defaults to BLOCK_SIZE.
+
+    Yields:
+        pd.DataFrame: chunk of at most chunksize rows
+    """
+    def blocks() -> Iterator[pd.DataFrame]:
+        with open(path, "rb") as f:
+            mapped = _mapped(f)
+            if mapped is None:
+                return
+            with mapped:
+                start, size = 0, len(mapped)
+                while start < size:
+                    end = mapped.find(b"\n", min(start + block_size, size))
+                    end = size if end == -1 else end + 1
+                    lines = [line for line in mapped[start:end].splitlines() if line.strip()]
+                    start = end
+                    if lines:
+                        yield _records_frame(json.loads(b"[" + b",".join(lines) + b"]"))
+
+    yield from _rechunk(blocks(), chunksize)
+
+
+def read_json_array(path: str, chunksize: int, block_size: int = BLOCK_SIZE) -> Iterator[pd.DataFrame]:
+    """Streams a file holding one json array of objects, such as test.json
+
+    The objects are decoded one by one from a window of the memory mapped
+    file and normalized a chunk at a time, like ETLProcessor(data=list).
+
+    Args:
+        path (str): json file
+        chunksize (int): rows per chunk
+        block_size (int, optional): bytes decoded at a time. Defaults to BLOCK_SIZE.
+
+    Raises:
+        ValueError: if the file is not valid json or not an array of objects
+
+    Yields:
+        pd.DataFrame: chunk of at most chunksize rows
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "rb") as f:
+        mapped = _mapped(f)
+        if mapped is None:
+            return
+        with mapped:
+            text = codecs.getincrementaldecoder("utf-8-sig")()
+            buffer, pos, offset, size = "", 0, 0, len(mapped)
+            # Byte offset of the start of the buffer, for the errors
+            start = len(codecs.BOM_UTF8) if mapped[:len(codecs.BOM_UTF8)] == codecs.BOM_UTF8 else 0
+            started = False
+            records = []
+            while True:
+                pos = _SEPARATORS.match(buffer, pos).end()
+                if pos < len(buffer):
+                    if not started:
+                        if buffer[pos] != "[":
+                            raise ValueError("Not a json array")
+                        started = True
+                        pos += 1
+                        continue
+                    if buffer[pos] == "]":
+                        break
+                    try:
+                        record, end = decoder.raw_decode(buffer, pos)
+                    except json.JSONDecodeError as e:
+                        # An object cut at the end of the window is decoded again with the next block
+                        if offset >= size or not _cut_by_window(e, buffer):
+                            at = start + len(buffer[:e.pos].encode("utf-8"))
+                            raise ValueError(f"Invalid json at byte {at}: {e.msg}") from e
+                    else:
+                        if not isinstance(record, dict):
+                            raise ValueError("Not a json array of objects")
+                        records.append(record)
+                        pos = end
+                        if len(records) == chunksize:
+                            yield _records_frame(records)
+                            records = []
+                        continue
+                if offset >= size:
+                    raise ValueError("Unterminated json array")
+                block = mapped[offset:offset + block_size]
+                offset += len(block)
+                start += len(buffer[:pos].encode("utf-8"))
+                buffer = buffer[pos:] + text.decode(block, final=offset >= size)
+                pos = 0
+            if records:
+                yield _records_frame(records)
+
+
+def read_csv(path: str, chunksize: int, dtype: dict = CSV_DTYPES) -> Iterator[pd.DataFrame]:
+    """Streams a csv file with a header line
+
+    Args:
+        path (str): csv file
+        chunksize (int): rows per chunk
+        dtype (dict, optional): dtype per column. Defaults to CSV_DTYPES.
+
+    Yields:
+        pd.DataFrame: chunk of at most chunksize rows
+    """
+    with pd.read_csv(path, chunksize=chunksize, dtype=dtype, memory_map=True) as reader:
+        for chunk in reader:
+            yield chunk.reset_index(drop=True)
+
+
+def _first_byte(path: str) -> bytes:
+    """First byte of the file which is not whitespace or a byte order mark"""
+    with open(path, "rb") as f:
+        head = f.read(4096).lstrip(codecs.BOM_UTF8).lstrip()
+    return head[:1]
+
+
+def file_chunks(path: str, chunksize: int) -> Iterator[pd.DataFrame]:
+    """Streams a dump in the format of its extension: .csv, .ndjson or .jsonl,
+    and .json holding either an array or one object per line
+
+    Args:
+        path (str): dump file
+        chunksize (int): rows per chunk
+
+    Raises:
+        ValueError: if the format is not known
+
+    Returns:
+        Iterator[pd.DataFrame]: chunks of at most chunksize rows
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        return read_csv(path, chunksize)
+    if extension in (".ndjson", ".jsonl"):
+        return read_ndjson(path, chunksize)
+    if extension == ".json":
+        if _first_byte(path) == b"[":
+            return read_json_array(path, chunksize)
+        return read_ndjson(path, chunksize)
+    raise ValueError(f"Unknown file format {extension!r}")
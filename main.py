@@ -1,24 +1,191 @@
-from etl_processor import ETLProcessor
+import argparse
+import os
+import sys
 import time
 
+# Steps which run on their own from the last checkpoint, see --step
+STEPS = {
+    "read": "read_data",
+    "transform": "transform_data",
+    "name": "remove_empty_name",
+    "email": "remove_invalid_email",
+    "salary": "remove_nega_sal",
+    "date": "remove_invalid_date",
+    "load": "load_all",
+}
+
 if __name__ == "__main__":
     """Running the ETL
     """
+    parser = argparse.ArgumentParser(description="Runs the employees ETL job")
+    parser.add_argument(
+        "--chunksize",
+        type=int,
+        default=None,
+        help="stream the raw table in chunks of this many rows",
+    )
+    parser.add_argument(
+        "--incremental",
+        metavar="COLUMN",
+        default=None,
+        help="only extract the rows past the high-water mark of this column, such as id or updated_at, ties are read in id order",
+    )
+    parser.add_argument(
+        "--load-method",
+        choices=["copy", "insert", "upsert"],
+        default="copy",
+        help="upsert merges on email/id so that reruns don't duplicate rows",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="spread the transform over this many processes",
+    )
+    parser.add_argument(
+        "--read-connections",
+        type=int,
+        default=None,
+        help="read the raw table in ranges over this many connections",
+    )
+    parser.add_argument(
+        "--partition-column",
+        default="id",
+        help="indexed column the read ranges are taken on",
+    )
+    parser.add_argument(
+        "--metrics",
+        metavar="PATH",
+        default=None,
+        help="write the per stage metrics of the run to this json file",
+    )
+    parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="also record the peak memory allocated in every stage with tracemalloc, slower, "
+             "and not right for stages that overlap, such as the loads or the --pipelined steps",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="DIR",
+        default=None,
+        help="dump a cProfile of every stage to this directory",
+    )
+    parser.add_argument(
+        "--plain-dtypes",
+        action="store_true",
+        help="keep the extracted frames in the dtypes the driver returns",
+    )
+    parser.add_argument(
+        "--arrow",
+        action="store_true",
+        help="keep the frames Arrow backed from the read to the COPY",
+    )
+    parser.add_argument(
+        "--input",
+        metavar="PATH",
+        default=None,
+        help="process a .json, .ndjson, .jsonl or .csv dump instead of the raw table, in chunks",
+    )
+    parser.add_argument(
+        "--email-index",
+        metavar="PATH",
+        default=None,
+        help="sqlite file of the emails already loaded, rejects duplicates across chunks and runs",
+    )
+    parser.add_argument(
+        "--email-bloom",
+        type=int,
+        metavar="N",
+        default=None,
+        help="put a Bloom filter sized for N emails in front of the email index",
+    )
+    parser.add_argument(
+        "--pipelined",
+        action="store_true",
+        help="read, transform and load the chunks at the same time, in their own threads",
+    )
+    parser.add_argument(
+        "--pushdown",
+        action="store_true",
+        help="validate and load the raw table inside PostgreSQL with INSERT ... SELECT, no row is pulled",
+    )
+    parser.add_argument(
+        "--run-id",
+        metavar="NAME",
+        default=None,
+        help="commit the offset of every chunk under this name, a rerun with it resumes after the last loaded chunk",
+    )
+    parser.add_argument(
+        "--checkpoints",
+        metavar="DIR",
+        default=None,
+        help="save the output of every stage here, unchanged stages are restored on rerun",
+    )
+    parser.add_argument(
+        "--step",
+        choices=list(STEPS),
+        default=None,
+        help="run only this step, from the last checkpoint unless it is read",
+    )
+    args = parser.parse_args()
+    if args.step and not args.checkpoints:
+        parser.error("--step needs --checkpoints")
+    if args.pushdown and (args.step or args.input or args.chunksize or args.pipelined):
+        parser.error("--pushdown runs on the whole raw table, without --step, --input, --chunksize or --pipelined")
+
+    # After the arguments, so --help and usage errors don't wait for pandas
+    from checkpoint import CheckpointStore
+    from database_handler import DatabaseHandler
+    from email_index import EmailIndex
+    from etl_processor import DEFAULT_CHUNKSIZE, ETLProcessor
+    from metrics import Metrics, cprofile_hook
+
     start = time.time()
-    e = ETLProcessor()
-    e.read_data()
-    print("\n# Read data")
-    print(e.df, "\n")
-    job1 = time.time()
-    print("\n# Time to complete Extraction ---->", job1-start, "\n")
-    e.transform_data()
-    print("\n# Transformed data")
-    print(e.df)
-    job2 = time.time()
-    print("\n# Time to complete Transform ---->", job2-job1, "\n")
-    e.load_data()
-    e.load_outlier_data()
-    job3 = time.time()
-    print("\n# Time to complete Load ---->", job3-job2, "\n")
+    metrics = Metrics(trace_memory=args.trace_memory)
+    if args.profile:
+        metrics.add_hook(cprofile_hook(args.profile))
+    e = ETLProcessor(engine=DatabaseHandler.shared_engine(), watermark_column=args.incremental,
+                     load_method=args.load_method, transform_workers=args.workers,
+                     read_connections=args.read_connections, partition_column=args.partition_column,
+                     metrics=metrics, compact=not args.plain_dtypes, arrow=args.arrow,
+                     checkpoints=CheckpointStore(args.checkpoints) if args.checkpoints else None,
+                     run_id=args.run_id)
+    if args.email_index:
+        seed = not os.path.exists(args.email_index)
+        e.email_index = EmailIndex(args.email_index, bloom_capacity=args.email_bloom)
+        if seed and not e.seed_email_index():
+            # An unseeded index would let the loaded emails in again on the next run
+            e.email_index.close()
+            os.remove(args.email_index)
+            sys.exit(1)
+    if args.step:
+        if args.step != "read" and not e.restore_checkpoint():
+            sys.exit(1)
+        getattr(e, STEPS[args.step])()
+        print(e.df)
+    elif args.pushdown:
+        e.run_pushdown()
+    elif args.input:
+        e.run_file(args.input, args.chunksize or DEFAULT_CHUNKSIZE, pipelined=args.pipelined)
+    elif args.chunksize or args.pipelined:
+        e.run_chunked(args.chunksize or DEFAULT_CHUNKSIZE, pipelined=args.pipelined)
+    else:
+        e.read_data()
+        print("\n# Read data")
+        print(e.df, "\n")
+        job1 = time.time()
+        print("\n# Time to complete Extraction ---->", job1-start, "\n")
+        e.transform_data()
+        print("\n# Transformed data")
+        print(e.df)
+        job2 = time.time()
+        print("\n# Time to complete Transform ---->", job2-job1, "\n")
+        e.load_all()
+        job3 = time.time()
+        print("\n# Time to complete Load ---->", job3-job2, "\n")
     print("\nTime to finish up ETL job ---->", time.time()-start, "\n")
-
+    if e.email_index is not None:
+        e.email_index.close()
+    if args.metrics:
+        metrics.to_json(args.metrics)
@@ -0,0 +1,238 @@
+import contextlib
+import cProfile
+import json
+import marshal
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from typing import Callable, ContextManager, Iterator
+
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    resource = None
+
+# A hook gets the stage name and returns a context manager entered around the stage
+Hook = Callable[[str], ContextManager]
+
+
+def rss_mb() -> float | None:
+    """Resident memory of the process right now
+
+    Returns:
+        float | None: memory in MB, None where it can't be read
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1 << 20)
+    except OSError:  # pragma: no cover
+        pass
+    try:  # pragma: no cover
+        # Only off Linux, it would double the import time of the module
+        import psutil
+    except ImportError:  # pragma: no cover
+        return None
+    return psutil.Process().memory_info().rss / (1 << 20)  # pragma: no cover
+
+
+def process_peak_rss_mb() -> float | None:
+    """High-water mark of the process resident memory
+
+    It is the peak of the whole run so far, not of a stage: once a big stage
+    ran, every later one reports at least as much.
+
+    Returns:
+        float | None: peak memory in MB, None where it can't be read
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, KiB elsewhere
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / 1024
+
+
+class _SharedProfiler:
+    """The one cProfile of the process, shared by the stages running at once
+
+    From Python 3.12 only one profiler can be enabled per process, so stages
+    overlapping on threads, such as the two loads of load_all or the steps of
+    the pipelined runner, can't each enable their own. The first stage in
+    enables it, the last one out disables it.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.profiler = None
+        self.users = 0
+
+    def enter(self):
+        with self.lock:
+            if self.users == 0:
+                self.profiler = cProfile.Profile()
+                self.profiler.enable()
+            self.users += 1
+
+    def exit(self, path: str):
+        with self.lock:
+            self.users -= 1
+            if self.users == 0:
+                self.profiler.disable()
+            # dump_stats would disable the profiler under the stages still running
+            self.profiler.snapshot_stats()
+            with open(path, "wb") as f:
+                marshal.dump(self.profiler.stats, f)
+            if self.users == 0:
+                self.profiler = None
+
+
+_shared_profiler = _SharedProfiler()
+
+
+def cprofile_hook(dirname: str) -> Hook:
+    """Hook profiling every stage with cProfile
+
+    Stages running at the same time share the process profiler, so the dump of
+    a stage holds everything profiled since the first of them started, the
+    overlapping stages included. Before Python 3.12 cProfile only follows the
+    thread that enabled it.
+
+    Args:
+        dirname (str): directory the <stage>.<n>.prof stats are dumped to
+
+    Returns:
+        Hook: hook to be passed to Metrics.add_hook
+    """
+    os.makedirs(dirname, exist_ok=True)
+    counter = iter(range(1 << 62))
+
+    @contextlib.contextmanager
+    def hook(name: str) -> Iterator[None]:
+        _shared_profiler.enter()
+        try:
+            yield
+        finally:
+            filename = "%s.%d.prof" % (name.replace(":", "_"), next(counter))
+            _shared_profiler.exit(os.path.join(dirname, filename))
+
+    return hook
+
+
+class Metrics:
+    """Records wall time, rows and memory of every stage of a run
+
+    Every stage is a dict, see stage, exported with the totals per stage
+    name by to_json.
+    """
+    def __init__(self, trace_memory: bool = False):
+        """Sets an empty run
+
+        Args:
+            trace_memory (bool, optional): Also record the peak of the memory
+                allocated during each stage with tracemalloc, which slows the
+                run down. The peak is reset when a stage starts, so it is only
+                right for stages that don't overlap others. Defaults to False.
+        """
+        self.stages = []
+        self.hooks = []
+        self.trace_memory = trace_memory
+        self.__lock = threading.Lock()
+
+    def add_hook(self, hook: Hook):
+        """Adds a hook, such as a profiler, entered around every stage
+
+        Args:
+            hook (Hook): gets the stage name, returns a context manager
+        """
+        self.hooks.append(hook)
+
+    @contextlib.contextmanager
+    def stage(self, name: str, rows_in: int | None = None) -> Iterator[dict]:
+        """Measures one stage
+
+        The stage sets rows_out and rejected, rejected rows per rule, on the
+        yielded dict. An exception raised by the stage is recorded in error
+        and raised again. The resident memory of the process is recorded when
+        the stage starts and ends, its peak is the one of the whole process so
+        far; peak_traced_mb, with trace_memory, is the one of the stage.
+
+        Args:
+            name (str): stage name
+            rows_in (int | None, optional): rows going into the stage. Defaults to None.
+
+        Yields:
+            dict: the stage record
+        """
+        record = {"stage": name, "rows_in": rows_in, "rows_out": None, "rejected": {}, "rss_start_mb": rss_mb()}
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            with contextlib.ExitStack() as stack:
+                for hook in self.hooks:
+                    stack.enter_context(hook(name))
+                yield record
+        except Exception as e:
+            record["error"] = str(e)
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            record["seconds"] = seconds
+            rows = record["rows_in"] if record["rows_in"] is not None else record["rows_out"]
+            record["rows_per_sec"] = rows / seconds if rows is not None and seconds > 0 else None
+            record["rss_end_mb"] = rss_mb()
+            peak = process_peak_rss_mb()
+            # Linux folds the rss counters into the high-water mark lazily, it
+            # can trail the current rss by a few pages
+            if peak is not None and record["rss_end_mb"] is not None:
+                peak = max(peak, record["rss_end_mb"])
+            record["process_peak_rss_mb"] = peak
+            if self.trace_memory:
+                record["peak_traced_mb"] = tracemalloc.get_traced_memory()[1] / (1 << 20)
+            with self.__lock:
+                self.stages.append(record)
+
+    def summary(self) -> dict:
+        """Totals of every stage name, in the order they first ran
+
+        Returns:
+            dict: per stage name its runs, seconds, rows, rejected rows and peak memory,
+                the traced one only with trace_memory
+        """
+        totals = {}
+        for record in self.stages:
+            total = totals.setdefault(record["stage"], {
+                "runs": 0, "seconds": 0.0, "rows_in": 0, "rows_out": 0, "rejected": {}, "errors": 0,
+                "process_peak_rss_mb": None, "peak_traced_mb": None,
+            })
+            total["runs"] += 1
+            total["seconds"] += record["seconds"]
+            total["rows_in"] += record["rows_in"] or 0
+            total["rows_out"] += record["rows_out"] or 0
+            for rule, count in record["rejected"].items():
+                total["rejected"][rule] = total["rejected"].get(rule, 0) + count
+            total["errors"] += "error" in record
+            for key in ("process_peak_rss_mb", "peak_traced_mb"):
+                if record.get(key) is not None:
+                    total[key] = max(total[key] or 0, record[key])
+        for total in totals.values():
+            rows = total["rows_in"] or total["rows_out"]
+            total["rows_per_sec"] = rows / total["seconds"] if total["seconds"] > 0 else None
+        return totals
+
+    def to_json(self, path: str | None = None) -> str:
+        """Exports the run
+
+        Args:
+            path (str | None, optional): file the json is also written to. Defaults to None.
+
+        Returns:
+            str: json with the stages and the summary
+        """
+        data = json.dumps({"stages": self.stages, "summary": self.summary()}, indent=2, default=str)
+        if path is not None:
+            with open(path, "w") as f:
+                f.write(data)
+        return data
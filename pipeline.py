@@ -0,0 +1,135 @@
+import queue
+import threading
+from typing import Any, Callable, Iterable
+
+# Marks the end of the stream in the queues
+_DONE = object()
+# Seconds a blocked thread waits before checking whether the run failed
+_POLL = 0.1
+
+
+class PipelineError(Exception):
+    """Failure of a pipeline stage, with the stage and the position of the item"""
+    def __init__(self, stage: str, position: int, error: BaseException):
+        super().__init__(f"{stage} failed on item {position}: {error}")
+        self.stage = stage
+        self.position = position
+        self.error = error
+
+
+class Pipeline:
+    """Runs stages over a stream, every stage in its own thread
+
+    The source is consumed in a reader thread and the stages are connected
+    by queues of queue_size items, so item N+1 is read while item N goes
+    through the first stage and item N-1 through the second one, and a slow
+    stage blocks the ones before it once its queue is full. At most
+    queue_size items wait between two stages, plus one in every stage.
+
+    Every stage handles the items one at a time in the order of the source.
+    The first failure stops the run: the other threads stop at their next
+    item, the source is closed and run raises a PipelineError. Items after
+    the failed one never reach the later stages, items before it went
+    through every stage.
+    """
+    def __init__(self, stages: list[tuple[str, Callable[[Any], Any]]], queue_size: int = 2):
+        """Sets the stages
+
+        Args:
+            stages (list[tuple[str, Callable[[Any], Any]]]): name and function of every stage,
+                each one gets the result of the one before it
+            queue_size (int, optional): items waiting between two stages. Defaults to 2.
+        """
+        self.stages = stages
+        self.queue_size = queue_size
+        self.__failed = threading.Event()
+        self.__error = None
+        self.__lock = threading.Lock()
+
+    def __fail(self, stage: str, position: int, error: BaseException):
+        with self.__lock:
+            if self.__error is None:
+                self.__error = PipelineError(stage, position, error)
+        self.__failed.set()
+
+    def __put(self, out: queue.Queue, item) -> bool:
+        """Waits for room in the queue, false once the run failed"""
+        while not self.__failed.is_set():
+            try:
+                out.put(item, timeout=_POLL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def __get(self, source: queue.Queue):
+        """Waits for the next item, _DONE once the run failed"""
+        while not self.__failed.is_set():
+            try:
+                return source.get(timeout=_POLL)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def __read(self, items: Iterable, out: queue.Queue):
+        iterator = iter(items)
+        position = 0
+        try:
+            for item in iterator:
+                if not self.__put(out, (position, item)):
+                    return
+                position += 1
+            self.__put(out, _DONE)
+        except BaseException as e:
+            self.__fail("read", position, e)
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+
+    def __work(self, name: str, function: Callable[[Any], Any], source: queue.Queue, out: queue.Queue | None):
+        while True:
+            entry = self.__get(source)
+            if entry is _DONE:
+                if out is not None:
+                    self.__put(out, _DONE)
+                return
+            position, item = entry
+            try:
+                result = function(item)
+            except BaseException as e:
+                self.__fail(name, position, e)
+                return
+            if out is not None and not self.__put(out, (position, result)):
+                return
+            if out is None:
+                with self.__lock:
+                    self.done += 1
+
+    def run(self, items: Iterable) -> int:
+        """Runs the stages over every item
+
+        Args:
+            items (Iterable): source, read in its own thread
+
+        Raises:
+            PipelineError: the first failure of the source or a stage
+
+        Returns:
+            int: items which went through every stage
+        """
+        self.done = 0
+        self.__error = None
+        self.__failed.clear()
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        threads = [threading.Thread(target=self.__read, args=(items, queues[0]), name="pipeline_read")]
+        for i, (name, function) in enumerate(self.stages):
+            out = queues[i + 1] if i + 1 < len(queues) else None
+            threads.append(threading.Thread(target=self.__work, args=(name, function, queues[i], out), name=f"pipeline_{name}"))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if self.__error is not None:
+            raise self.__error
+        return self.done
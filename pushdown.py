@@ -0,0 +1,200 @@
+from typing import Callable, NamedTuple
+
+from psycopg2 import sql
+
+from validation import EMAIL_REGEX, RULES, Rule
+
+# EMAIL_REGEX as a PostgreSQL regex over the whole value, \y is the word
+# boundary of PostgreSQL
+SQL_EMAIL_REGEX = "^(?:" + EMAIL_REGEX.pattern.replace(r"\b", r"\y") + ")$"
+
+# Same as validation.rectify_date: the value is split on its first non
+# digit, every part is read like int(), the first 4 characters long part is
+# the year, the first one below 13 the month and the last other one the day.
+# Dates out of the datetime64[ns] range are invalid as in rectify_dates.
+RECTIFY_DATE_DDL = r"""
+create or replace function tmp.etl_rectify_date(d text) returns date
+language plpgsql immutable strict parallel safe as $$
+declare
+    sep text := substring(d from '[^0-9]');
+    part text;
+    n numeric;
+    y numeric := 0;
+    m numeric := 0;
+    dd numeric := 0;
+    first date;
+begin
+    if sep is null then
+        return null;
+    end if;
+    foreach part in array string_to_array(d, sep) loop
+        n := null;
+        -- int() takes surrounding whitespace, a sign and _ between digits
+        if btrim(part, E' \t\n\r\x0b\x0c\x1c\x1d\x1e\x1f') ~ '^[+-]?[0-9]+(_[0-9]+)*$' then
+            n := replace(btrim(part, E' \t\n\r\x0b\x0c\x1c\x1d\x1e\x1f'), '_', '')::numeric;
+        end if;
+        if n is null then
+            return null;
+        elsif length(part) = 4 and y = 0 then
+            y := n;
+        elsif n < 13 and m = 0 then
+            m := n;
+        else
+            dd := n;
+        end if;
+    end loop;
+    if y not between 1677 and 2262 or m not between 1 and 12 or dd < 1 then
+        return null;
+    end if;
+    first := make_date(y::int, m::int, 1);
+    if dd > extract(day from first + interval '1 month' - interval '1 day') then
+        return null;
+    end if;
+    first := first + (dd::int - 1);
+    if first not between date '1677-09-22' and date '2262-04-11' then
+        return null;
+    end if;
+    return first;
+end
+$$
+"""
+
+
+class SqlCheck(NamedTuple):
+    """SQL form of the check of a rule
+
+    cleaned builds the cleaned column from the raw one, None when the column
+    is kept as it is. condition builds the condition of the rows passing the
+    rule from the cleaned column, or the raw one, it must never be null. A
+    distinct check cleans every distinct value once, like rectify_dates.
+    """
+    condition: Callable[[sql.Composable], sql.Composable]
+    cleaned: Callable[[sql.Composable], sql.Composable] | None = None
+    distinct: bool = False
+
+
+# SQL form of every rule of validation.RULES, by rule name
+SQL_CHECKS = {
+    "name": SqlCheck(lambda value: sql.SQL("coalesce({} <> '', false)").format(value)),
+    "email": SqlCheck(lambda value: sql.SQL("coalesce({} ~ {}, false)").format(value, sql.Placeholder("email_regex"))),
+    "salary": SqlCheck(
+        lambda value: sql.SQL("{} > 0").format(value),
+        lambda column: sql.SQL("coalesce(nullif(regexp_replace({}::text, '[^0-9]+', '', 'g'), '')::bigint, 0)").format(column),
+    ),
+    "date": SqlCheck(
+        lambda value: sql.SQL("{} is not null").format(value),
+        lambda column: sql.SQL("tmp.etl_rectify_date({})").format(column),
+        distinct=True,
+    ),
+}
+
+
+def _table(name: tuple[str, str]) -> sql.Composed:
+    return sql.SQL(".").join(sql.Identifier(part) for part in name)
+
+
+def pushdown_statement(columns: list[str], source: tuple[str, str] = ("tmp", "employees_raw"),
+                       processed: tuple[str, str] = ("tmp", "employees_processed"),
+                       unprocessed: tuple[str, str] = ("tmp", "employees_unprocessed"),
+                       order_column: str = "id", rules: tuple[Rule, ...] = RULES) -> tuple[sql.Composed, dict]:
+    """Compiles the rules into one statement validating the source table
+    inside PostgreSQL and inserting the kept rows and the outliers with
+    their reason, the same way evaluate_rules splits a frame
+
+    Rules whose column is missing are skipped. The first row of a unique
+    rule value in the order of order_column wins, which must then be unique
+    and not null. Digits are ascii only, the pandas rules also read other
+    Unicode digits in salaries and dates. The statement needs
+    tmp.etl_rectify_date, see RECTIFY_DATE_DDL, and returns per rule code
+    the number of rows and of rows whose value of the rule column is not
+    empty.
+
+    Args:
+        columns (list[str]): columns of the source table, in order
+        source (tuple[str, str], optional): schema and raw table. Defaults to tmp.employees_raw.
+        processed (tuple[str, str], optional): table of the kept rows. Defaults to tmp.employees_processed.
+        unprocessed (tuple[str, str], optional): table of the outliers. Defaults to tmp.employees_unprocessed.
+        order_column (str, optional): column deciding which duplicate is kept. Defaults to "id".
+        rules (tuple[Rule, ...], optional): Rules in order. Defaults to RULES.
+
+    Raises:
+        ValueError: if a rule has no SQL form
+
+    Returns:
+        tuple[sql.Composed, dict]: statement and its parameters
+    """
+    cleaned, checks, codes, counted, lookups, joins = {}, [], [], [], [], []
+    for code, rule in enumerate(rules, start=1):
+        if rule.column not in columns:
+            continue
+        if rule.name not in SQL_CHECKS:
+            raise ValueError(f"Rule {rule.name} has no SQL form")
+        check = SQL_CHECKS[rule.name]
+        column = sql.Identifier(rule.column)
+        if check.cleaned is not None:
+            cleaned[rule.column] = sql.Identifier(f"etl_clean_{code}")
+            if check.distinct:
+                lookup = sql.Identifier(f"etl_distinct_{code}")
+                lookups.append(sql.SQL(
+                    "{lookup} as (select etl_value, {cleaned} as {alias} from (select distinct {column}::text as etl_value from {source}) d), "
+                ).format(lookup=lookup, cleaned=check.cleaned(sql.Identifier("etl_value")), alias=cleaned[rule.column],
+                         column=column, source=_table(source)))
+                joins.append(sql.SQL(" left join {lookup} on {lookup}.etl_value = r.{column}::text").format(lookup=lookup, column=column))
+                checks.append(sql.SQL("{}.{}").format(lookup, cleaned[rule.column]))
+            else:
+                checks.append(sql.SQL("{} as {}").format(check.cleaned(sql.SQL("r.") + column), cleaned[rule.column]))
+        ok = sql.Identifier(f"etl_ok_{code}")
+        codes.append((code, ok, rule))
+        counted.append(sql.SQL("when {} then {}::text").format(sql.SQL(str(code)), column))
+    if not codes:
+        raise ValueError("No rule column in the source table")
+
+    conditions, passed, firsts, first_joins = [], [], [], []
+    order = sql.Identifier(order_column)
+    for code, ok, rule in codes:
+        failed = sql.SQL("not {}").format(ok)
+        if rule.unique:
+            # Hashed on the value, the rows are never sorted
+            first = sql.Identifier(f"etl_first_{code}")
+            column = sql.Identifier(rule.column)
+            firsts.append(sql.SQL(
+                "{first} as (select {column}, min({order}) as etl_first from etl_checked where {candidates} group by {column}), "
+            ).format(first=first, column=column, order=order, candidates=sql.SQL(" and ").join(passed + [ok])))
+            first_joins.append(sql.SQL(" left join {first} on {first}.{column} = c.{column}").format(first=first, column=column))
+            failed = sql.SQL("not {ok} or c.{order} > {first}.etl_first").format(ok=ok, order=order, first=first)
+        conditions.append(sql.SQL("when {} then {}").format(failed, sql.SQL(str(code))))
+        passed.append(ok)
+
+    names = sql.SQL(", ").join(sql.Identifier(column) for column in columns)
+    kept = sql.SQL(", ").join(cleaned.get(column, sql.Identifier(column)) for column in columns)
+    statement = sql.SQL(
+        "with {lookups}etl_cleaned as (select {raw}{cleaned} from {source} r{joins}), "
+        "etl_checked as (select *, {oks} from etl_cleaned), "
+        "{firsts}etl_coded as (select c.*, case {conditions} else 0 end as etl_code from etl_checked c{first_joins}), "
+        "etl_processed as (insert into {processed} ({names}) select {kept} from etl_coded where etl_code = 0), "
+        "etl_unprocessed as (insert into {unprocessed} ({names}, reason) "
+        "select {names}, ({reasons}::text[])[etl_code] from etl_coded where etl_code <> 0) "
+        "select etl_code, count(*), count(nullif(case etl_code {counted} end, '')) "
+        "from etl_coded group by etl_code order by etl_code"
+    ).format(
+        names=names,
+        lookups=sql.SQL("").join(lookups),
+        raw=sql.SQL(", ").join(sql.SQL("r.") + sql.Identifier(column) for column in columns),
+        joins=sql.SQL("").join(joins),
+        cleaned=sql.SQL("").join(sql.SQL(", ") + check for check in checks),
+        source=_table(source),
+        oks=sql.SQL(", ").join(
+            sql.SQL("{} as {}").format(SQL_CHECKS[rule.name].condition(cleaned.get(rule.column, sql.Identifier(rule.column))), ok)
+            for _, ok, rule in codes
+        ),
+        conditions=sql.SQL(" ").join(conditions),
+        firsts=sql.SQL("").join(firsts),
+        first_joins=sql.SQL("").join(first_joins),
+        processed=_table(processed),
+        kept=kept,
+        unprocessed=_table(unprocessed),
+        reasons=sql.Placeholder("reasons"),
+        counted=sql.SQL(" ").join(counted),
+    )
+    params = {"email_regex": SQL_EMAIL_REGEX, "reasons": [rule.reason for rule in rules]}
+    return statement, params
@@ -0,0 +1,67 @@
+from checkpoint import LAST, CheckpointStore, frame_key, stage_key
+import numpy as np
+import os
+import pandas as pd
+import pytest
+
+
+@pytest.fixture
+def df():
+    return pd.read_json("test.json", dtype=False)
+
+
+class TestMain():
+
+    def test_frame_key(self, df):
+        assert frame_key(df) == frame_key(df.copy())
+        changed = df.copy()
+        changed.loc[0, "salary"] = "1"
+        assert frame_key(changed) != frame_key(df)
+        assert frame_key(df.iloc[1:]) != frame_key(df.iloc[1:].reset_index(drop=True))
+        assert frame_key(df.astype({"id": "Int64"})) != frame_key(df)
+        assert stage_key("a", "transform", 1) != stage_key("a", "transform", 2)
+
+    def test_save_load(self, tmp_path, df):
+        store = CheckpointStore(str(tmp_path))
+        raw_key = store.save_raw(df)
+        assert store.save_raw(df) == raw_key
+        assert store.load_raw(raw_key).equals(df)
+        assert store.latest() is None
+        assert store.load("missing") is None
+
+        kept = df.iloc[[2, 4, 5]].astype({"department": "category"})
+        store.save("k1", "rule:name", raw_key, kept,
+                   {"rejected_positions": np.array([0, 1]), "rejected_codes": np.array([1, 1], dtype=np.uint8), "kept": None},
+                   {"invalid_dates": 2, "high_water": pd.Timestamp("2022-01-01")})
+        state = store.load("k1")
+        assert (state["key"], state["stage"], state["raw_key"]) == ("k1", "rule:name", raw_key)
+        assert state["df"].equals(kept)
+        assert state["df"].index.tolist() == [2, 4, 5]
+        assert state["arrays"]["rejected_positions"].tolist() == [0, 1]
+        assert "kept" not in state["arrays"]
+        assert state["scalars"] == {"invalid_dates": 2, "high_water": pd.Timestamp("2022-01-01")}
+        assert store.latest("rule:name") == store.latest(LAST) == "k1"
+        assert os.path.exists(tmp_path / "states" / "k1" / "df.parquet")
+
+        # CASE 2: Testing a state whose frame is the raw frame
+        store.save(raw_key, "read", raw_key, None, {}, {})
+        assert store.load(raw_key)["df"] is None
+        assert store.latest() == raw_key
+        assert store.latest("rule:name") == "k1"
+        assert not [name for name in os.listdir(tmp_path / "states") if name.startswith(".tmp_")]
+
+    def test_arrow_dtypes(self, tmp_path, df):
+        store = CheckpointStore(str(tmp_path))
+        arrow = df.convert_dtypes(dtype_backend="pyarrow")
+        key = store.save_raw(arrow)
+        loaded = store.load_raw(key)
+        assert loaded.equals(arrow)
+        assert all(isinstance(dtype, pd.ArrowDtype) for dtype in loaded.dtypes)
+
+    def test_pickle_fallback(self, tmp_path):
+        store = CheckpointStore(str(tmp_path))
+        # Parquet can't type a column mixing numbers and strings
+        mixed = pd.DataFrame({"salary": ["100", 200, None]})
+        key = store.save_raw(mixed)
+        assert os.path.exists(tmp_path / "raw" / (key + ".pkl"))
+        assert store.load_raw(key).equals(mixed)
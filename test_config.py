@@ -0,0 +1,25 @@
+from config import DatabaseConfig, load_config
+import os
+
+
+class TestMain():
+
+    def test_from_env(self, tmp_path, monkeypatch):
+        env_file = tmp_path / ".env"
+        env_file.write_text("DATABASE=etl\nHOST=db.local\nPORT=5433\nPOOL_SIZE=9\n")
+        monkeypatch.setenv("HOST", "override")
+        monkeypatch.delenv("DATABASE", raising=False)
+        monkeypatch.delenv("POOL_SIZE", raising=False)
+        config = DatabaseConfig.from_env(str(env_file))
+        assert (config.database, config.host, config.port, config.pool_size) == ("etl", "override", "5433", 9)
+        # The environment is not changed by the .env file
+        assert "DATABASE" not in os.environ
+
+        # CASE 2: Testing the defaults without a .env file
+        config = DatabaseConfig.from_env(str(tmp_path / "missing.env"))
+        assert (config.database, config.pool_size) == (None, 5)
+
+        # CASE 3: Testing the settings of the process are read once
+        load_config.cache_clear()
+        assert load_config() is load_config()
+        load_config.cache_clear()
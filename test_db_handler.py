@@ -1,5 +1,7 @@
 import os
-from database_handler import DatabaseHandler
+from database_handler import OFFSETS_DDL, WATERMARK_DDL, DatabaseHandler, arrow_table, copy_frame, is_arrow_frame
+from psycopg2 import sql
+import numpy as np
 from dotenv import load_dotenv
 import pandas as pd
 import pytest
@@ -87,6 +89,28 @@ class TestMain():
                 ANY
             )
 
+    def test_query_chunks_mock(self, mocker):
+        mocker.patch.object(DatabaseHandler, "__init__", return_value=None)
+        db = DatabaseHandler()
+        mock_db_engine = mocker.Mock()
+        mock_db_conn = mocker.MagicMock()
+        mock_cursor = mock_db_conn.cursor.return_value.__enter__.return_value
+        mock_cursor.description = [("id",), ("name",)]
+        mock_cursor.fetchmany.side_effect = [
+            [(1, "a"), (2, "b")],
+            [(3, "c")],
+            [],
+        ]
+        db._DatabaseHandler__conn = mock_db_conn
+        db._DatabaseHandler__db_engine = mock_db_engine
+        chunks = list(db.query_chunks("SELECT * from tmp.employees_raw", 2))
+        mock_db_conn.cursor.assert_called_once_with(name=ANY)
+        mock_cursor.execute.assert_called_once_with("SELECT * from tmp.employees_raw")
+        assert [len(c) for c in chunks] == [2, 1]
+        assert list(chunks[0].columns) == ["id", "name"]
+        mock_db_conn.close.assert_called_once()
+        mock_db_engine.dispose.assert_called_once()
+
     def test_write_mock(self, mocker):
         mock_file = mocker.mock_open()
         mocker.patch.object(DatabaseHandler, "__init__", return_value=None)
@@ -129,3 +153,288 @@ class TestMain():
                 if_exists="append",
                 index=False,
             )
+
+    def test_copy_frame(self):
+        data = pd.DataFrame({
+            "id": [1.0, np.nan],
+            "ratio": [0.5, 1.0],
+            "join_date": pd.to_datetime(["2022-02-20", None]),
+            "name": ["", None],
+        })
+        out = copy_frame(data)
+        assert str(out["id"].dtype) == "Int64"
+        assert out["ratio"].dtype == np.float64
+        assert out["join_date"].tolist()[0] == "2022-02-20"
+        assert pd.isna(out["join_date"].tolist()[1])
+
+        # CASE 2: Testing a value which would be read as NULL
+        with pytest.raises(ValueError):
+            copy_frame(pd.DataFrame({"name": ["\\N"]}))
+
+    def test_write_copy_mock(self, mocker):
+        mocker.patch.object(DatabaseHandler, "__init__", return_value=None)
+        mocker.patch.object(sql.Composed, "as_string", return_value="COPY statement")
+        to_sql = mocker.patch('pandas.DataFrame.to_sql')
+        db = DatabaseHandler()
+        mock_db_engine = mocker.Mock()
+        mock_db_conn = mocker.MagicMock()
+        mock_cursor = mock_db_conn.cursor.return_value.__enter__.return_value
+        db._DatabaseHandler__conn = mock_db_conn
+        db._DatabaseHandler__db_engine = mock_db_engine
+        data = pd.DataFrame({"name": ["a", "", None]})
+        assert db.df_to_sql(data, "test_table", "test_schema", method="copy")
+        statement, buffer = mock_cursor.copy_expert.call_args[0]
+        assert statement == "COPY statement"
+        assert buffer.getvalue() == 'a\n""\n\\N\n'
+        mock_db_conn.commit.assert_called_once()
+        to_sql.assert_not_called()
+        mock_db_conn.close.assert_called_once()
+        mock_db_engine.dispose.assert_called_once()
+
+        # CASE 2: Testing the fallback to insert when COPY fails
+        mock_cursor.copy_expert.side_effect = Exception("COPY failed")
+        assert db.df_to_sql(data, "test_table", "test_schema", method="copy")
+        mock_db_conn.rollback.assert_called_once()
+        to_sql.assert_called_once_with(
+            "test_table",
+            ANY,
+            schema = "test_schema",
+            if_exists="append",
+            index=False,
+        )
+
+    def test_pooled_session_mock(self, mocker):
+        connect = mocker.patch('psycopg2.connect')
+        mock_engine = mocker.Mock()
+        mock_proxy = mock_engine.raw_connection.return_value
+        mock_db_conn = mock_proxy.dbapi_connection
+        db = DatabaseHandler(mock_engine)
+        connect.assert_not_called()
+        with db.session() as conn:
+            assert conn is mock_db_conn
+        mock_db_conn.commit.assert_called_once()
+        mock_proxy.close.assert_called_once()
+
+        # CASE 2: Testing the rollback, the connection still goes back to the pool
+        with pytest.raises(ValueError):
+            with db.session():
+                raise ValueError("failed")
+        mock_db_conn.rollback.assert_called_once()
+        assert mock_proxy.close.call_count == 2
+
+        # CASE 3: Testing the handler is reusable, the pool is never disposed
+        mocker.patch('pandas.read_sql', return_value=pd.DataFrame({"id": [1]}))
+        with db:
+            assert len(db.query("SELECT * from tmp.employees_raw")) == 1
+            assert len(db.query("SELECT * from tmp.employees_raw")) == 1
+        assert mock_engine.raw_connection.call_count == 4
+        mock_engine.dispose.assert_not_called()
+
+    def test_shared_engine_mock(self, mocker):
+        mocker.patch('urllib.parse.quote_plus')
+        create_engine = mocker.patch('sqlalchemy.create_engine')
+        mocker.patch.object(DatabaseHandler, "_DatabaseHandler__shared_engine", None)
+        engine = DatabaseHandler.shared_engine()
+        assert DatabaseHandler.shared_engine() is engine
+        assert DatabaseHandler.pooled()._DatabaseHandler__db_engine is engine
+        create_engine.assert_called_once_with(ANY, pool_size=ANY, pool_pre_ping=True)
+
+    def test_watermark_mock(self, mocker):
+        mocker.patch.object(DatabaseHandler, "__init__", return_value=None)
+        mocker.patch.object(sql.Composed, "as_string", return_value="COPY statement")
+        db = DatabaseHandler()
+        mock_db_engine = mocker.Mock()
+        mock_db_conn = mocker.MagicMock()
+        mock_cursor = mock_db_conn.cursor.return_value.__enter__.return_value
+        mock_cursor.fetchone.return_value = ("42",)
+        db._DatabaseHandler__conn = mock_db_conn
+        db._DatabaseHandler__db_engine = mock_db_engine
+        assert db.get_watermark("employees_raw", "id") == "42"
+        assert mock_cursor.execute.call_args.args[1] == ("employees_raw", "id")
+        # The table is created once, committed before any load
+        assert mock_cursor.execute.call_args_list[0].args == (WATERMARK_DDL,)
+        assert "alter table" not in WATERMARK_DDL
+
+        # CASE 2: Testing the mark moves in the transaction of the load
+        mock_cursor.reset_mock()
+        data = pd.DataFrame({"name": ["a"]})
+        assert db.load_with_watermark([(data, "t1"), (data, "t2")], "tmp", "employees_raw", "id", "43")
+        assert mock_cursor.copy_expert.call_count == 2
+        assert mock_cursor.execute.call_args.args[1] == ("employees_raw", "id", "43", None)
+        assert mock_cursor.execute.call_count == 1
+        assert mock_db_conn.commit.call_count == 3
+
+        # CASE 3: Testing the tie value of a mark column with duplicates
+        mock_cursor.reset_mock()
+        assert db.load_with_watermark([(data, "t1")], "tmp", "employees_raw", "updated_at", "2022-01-01", tie="15")
+        assert mock_cursor.execute.call_args.args[1] == ("employees_raw", "updated_at", "2022-01-01", "15")
+        assert "tie = excluded.tie" in mock_cursor.execute.call_args.args[0]
+        mock_cursor.fetchone.return_value = ("2022-01-01", "15")
+        assert db.get_watermark_keyset("employees_raw", "updated_at") == ("2022-01-01", "15")
+        mock_cursor.fetchone.return_value = None
+        assert db.get_watermark_keyset("employees_raw", "updated_at") is None
+
+        # CASE 4: Testing a failed load leaves the mark where it was
+        mock_cursor.reset_mock()
+        mock_cursor.copy_expert.side_effect = Exception("COPY failed")
+        assert not db.load_with_watermark([(data, "t1")], "tmp", "employees_raw", "id", "44")
+        mock_cursor.execute.assert_not_called()
+        mock_db_conn.rollback.assert_called_once()
+
+    def test_chunk_offset_mock(self, mocker):
+        mocker.patch.object(DatabaseHandler, "__init__", return_value=None)
+        mocker.patch.object(sql.Composed, "as_string", return_value="COPY statement")
+        db = DatabaseHandler()
+        mock_db_conn = mocker.MagicMock()
+        mock_cursor = mock_db_conn.cursor.return_value.__enter__.return_value
+        mock_cursor.fetchone.return_value = ("20", None, 2, 20, False)
+        db._DatabaseHandler__conn = mock_db_conn
+        db._DatabaseHandler__db_engine = mocker.Mock()
+        assert db.get_chunk_offset("nightly", "employees_raw") == {"value": "20", "tie": None, "chunks": 2, "rows": 20, "completed": False}
+        assert mock_cursor.execute.call_args.args[1] == ("nightly", "employees_raw")
+        # The table is created once, committed before any load
+        assert mock_cursor.execute.call_args_list[0].args == (OFFSETS_DDL,)
+        assert "alter table" not in OFFSETS_DDL
+        mock_cursor.fetchone.return_value = None
+        assert db.get_chunk_offset("other", "employees_raw") is None
+
+        # CASE 2: Testing the offset is recorded in the transaction of the load
+        mock_cursor.reset_mock()
+        mock_db_conn.reset_mock()
+        data = pd.DataFrame({"name": ["a"]})
+        assert db.load_with_offset([(data, "t1"), (data, "t2")], "tmp", "nightly", "employees_raw", "id", "30", 10)
+        assert mock_cursor.copy_expert.call_count == 2
+        offset = mock_cursor.execute.call_args
+        assert offset.args[0].startswith("insert into tmp.etl_chunk_offsets")
+        assert "chunks = o.chunks + 1" in offset.args[0]
+        assert offset.args[1] == ("nightly", "employees_raw", "id", "30", 10, None)
+        assert db.load_with_offset([(data, "t1")], "tmp", "nightly", "employees_raw", "department", "HR", 10, tie="30")
+        assert "tie = excluded.tie" in mock_cursor.execute.call_args.args[0]
+        assert mock_cursor.execute.call_args.args[1] == ("nightly", "employees_raw", "department", "HR", 10, "30")
+        # No DDL inside the load transactions, only the two offsets
+        assert mock_cursor.execute.call_count == 2
+        assert mock_db_conn.commit.call_count == 2
+
+        # CASE 3: Testing a failed load records no offset
+        mock_cursor.reset_mock()
+        mock_cursor.copy_expert.side_effect = Exception("COPY failed")
+        assert not db.load_with_offset([(data, "t1")], "tmp", "nightly", "employees_raw", "id", "40", 10)
+        mock_cursor.execute.assert_not_called()
+        mock_db_conn.rollback.assert_called_once()
+
+        # CASE 4: Testing a run is marked completed
+        mock_cursor.reset_mock()
+        assert db.complete_chunk_offset("nightly", "employees_raw")
+        assert "completed = true" in mock_cursor.execute.call_args.args[0]
+        mock_cursor.execute.side_effect = Exception("no table")
+        assert not db.complete_chunk_offset("nightly", "employees_raw")
+
+    def test_write_upsert_mock(self, mocker):
+        mocker.patch.object(DatabaseHandler, "__init__", return_value=None)
+        mocker.patch('psycopg2.extensions.quote_ident', side_effect=lambda name, conn: '"%s"' % name)
+        mocker.patch.object(sql.Literal, "as_string", return_value="'\\N'")
+        to_sql = mocker.patch('pandas.DataFrame.to_sql')
+        db = DatabaseHandler()
+        mock_db_engine = mocker.Mock()
+        mock_db_conn = mocker.MagicMock()
+        mock_cursor = mock_db_conn.cursor.return_value.__enter__.return_value
+        db._DatabaseHandler__conn = mock_db_conn
+        db._DatabaseHandler__db_engine = mock_db_engine
+        data = pd.DataFrame({"email": ["a@b.com"], "salary": [1]})
+        assert db.df_to_sql(data, "test_table", "test_schema", method="upsert", key=("email",))
+        create, merge = [call.args[0] for call in mock_cursor.execute.call_args_list]
+        assert create == (
+            'create temp table "test_table_stage" (like "test_schema"."test_table" including defaults, '
+            'etl_row bigserial) on commit drop'
+        )
+        assert mock_cursor.copy_expert.call_args.args[0].startswith('COPY "pg_temp"."test_table_stage" ("email", "salary")')
+        assert merge == (
+            'insert into "test_schema"."test_table" ("email", "salary") select distinct on ("email") "email", "salary" '
+            'from pg_temp."test_table_stage" order by "email", etl_row desc on conflict ("email") '
+            'do update set "salary" = excluded."salary"'
+        )
+        mock_db_conn.commit.assert_called_once()
+        to_sql.assert_not_called()
+
+        # CASE 2: Testing a key made of every column
+        mock_cursor.reset_mock()
+        assert db.df_to_sql(data, "test_table", "test_schema", method="upsert", key=("email", "salary"))
+        assert mock_cursor.execute.call_args.args[0].endswith('on conflict ("email", "salary") do nothing')
+
+        # CASE 3: Testing a failed merge is rolled back and not appended
+        mock_cursor.execute.side_effect = Exception("no unique constraint")
+        assert not db.df_to_sql(data, "test_table", "test_schema", method="upsert", key=("email",))
+        mock_db_conn.rollback.assert_called_once()
+        to_sql.assert_not_called()
+
+        # CASE 4: Testing a missing key
+        assert not db.df_to_sql(data, "test_table", "test_schema", method="upsert")
+
+    def test_arrow_table(self):
+        data = pd.DataFrame({
+            "id": pd.array([1, None], dtype="int64[pyarrow]"),
+            "department": pd.Series(["HR", None], dtype="category"),
+            "join_date": pd.Series(pd.to_datetime(["2022-02-20", None])).astype("timestamp[ns][pyarrow]"),
+            "at": pd.to_datetime(["2022-02-20 10:00", None]),
+            "salary": [1.0, np.nan],
+        })
+        table = arrow_table(data)
+        assert [str(field.type) for field in table.schema] == ["int64", "string", "date32[day]", "timestamp[ns]", "int64"]
+        assert table.column("department").to_pylist() == ["HR", None]
+        assert table.column("join_date").to_pylist()[0].isoformat() == "2022-02-20"
+
+    def test_write_copy_arrow_mock(self, mocker):
+        mocker.patch.object(DatabaseHandler, "__init__", return_value=None)
+        mocker.patch('psycopg2.extensions.quote_ident', side_effect=lambda name, conn: '"%s"' % name)
+        db = DatabaseHandler()
+        mock_db_engine = mocker.Mock()
+        mock_db_conn = mocker.MagicMock()
+        mock_cursor = mock_db_conn.cursor.return_value.__enter__.return_value
+        db._DatabaseHandler__conn = mock_db_conn
+        db._DatabaseHandler__db_engine = mock_db_engine
+        data = pd.DataFrame({"name": ["a", "", None, "\\N"], "id": [1, 2, 3, 4]}).convert_dtypes(dtype_backend="pyarrow")
+        assert is_arrow_frame(data)
+        assert db.df_to_sql(data, "test_table", "test_schema", method="copy")
+        statement, buffer = mock_cursor.copy_expert.call_args[0]
+        assert statement == 'COPY "test_schema"."test_table" ("name", "id") FROM STDIN WITH (FORMAT csv)'
+        # Empty strings are quoted, NULLs are not, a \N is an ordinary string
+        assert buffer.getvalue() == b'"a",1\n"",2\n,3\n"\\N",4\n'
+        mock_db_conn.commit.assert_called_once()
+
+    def test_query_arrow_mock(self, mocker):
+        read_sql = mocker.patch('pandas.read_sql')
+        mocker.patch.object(DatabaseHandler, "__init__", return_value=None)
+        db = DatabaseHandler()
+        db._DatabaseHandler__conn = mocker.MagicMock()
+        db._DatabaseHandler__db_engine = mocker.Mock()
+        db.query("SELECT * from tmp.employees_raw", dtype_backend="pyarrow")
+        read_sql.assert_called_once_with("SELECT * from tmp.employees_raw", ANY, dtype_backend="pyarrow")
+
+    def test_execute_mock(self, mocker):
+        mocker.patch.object(DatabaseHandler, "__init__", return_value=None)
+        mocker.patch.object(sql.Composed, "as_string", return_value="insert statement")
+        db = DatabaseHandler()
+        mock_db_conn = mocker.MagicMock()
+        mock_cursor = mock_db_conn.cursor.return_value.__enter__.return_value
+        mock_cursor.fetchall.return_value = [("id",), ("name",)]
+        db._DatabaseHandler__conn = mock_db_conn
+        db._DatabaseHandler__db_engine = mocker.Mock()
+        assert db.table_columns("tmp", "employees_raw") == ["id", "name"]
+        assert mock_cursor.execute.call_args.args[1] == ("tmp", "employees_raw")
+
+        # CASE 2: Testing the statements run in one transaction
+        mock_cursor.reset_mock()
+        mock_db_conn.reset_mock()
+        mock_cursor.fetchall.return_value = [(0, 8, 8)]
+        statement = sql.SQL("select {}").format(sql.Identifier("a"))
+        assert db.execute([("create function", None), (statement, {"a": 1})]) == [(0, 8, 8)]
+        assert [call.args for call in mock_cursor.execute.call_args_list] == [("create function", None), ("insert statement", {"a": 1})]
+        mock_db_conn.commit.assert_called_once()
+        mock_cursor.description = None
+        assert db.execute([("create function", None)]) == []
+
+        # CASE 3: Testing a failed statement rolls the transaction back
+        mock_cursor.execute.side_effect = Exception("syntax error")
+        with pytest.raises(Exception):
+            db.execute([("create function", None)])
+        mock_db_conn.rollback.assert_called_once()
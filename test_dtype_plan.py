@@ -0,0 +1,64 @@
+from dtype_plan import apply_dtype_plan, arrow_frame, as_category, compact_int, plain_frame, reason_column
+from validation import REASONS
+import pandas as pd
+import numpy as np
+
+
+class TestMain():
+
+    def test_compact_int(self):
+        assert str(compact_int(pd.Series([1, 2, 100])).dtype) == "Int8"
+        assert str(compact_int(pd.Series([1, 40000])).dtype) == "Int32"
+        assert str(compact_int(pd.Series([-1, 2 ** 40])).dtype) == "Int64"
+
+        # CASE 2: Testing integers which got a NaN
+        compact = compact_int(pd.Series([1.0, np.nan, 300.0]))
+        assert str(compact.dtype) == "Int16"
+        assert compact.isna().tolist() == [False, True, False]
+
+        # CASE 3: Testing columns which can't be cast are kept
+        text = pd.Series(["1", "2"])
+        assert compact_int(text) is text
+        ratio = pd.Series([0.5, 1.0])
+        assert compact_int(ratio) is ratio
+
+    def test_apply_dtype_plan(self):
+        df = pd.read_json("test.json", dtype=False)
+        compact = apply_dtype_plan(df)
+        assert str(compact["id"].dtype) == "Int8"
+        assert isinstance(compact["department"].dtype, pd.CategoricalDtype)
+        assert compact["salary"].equals(df["salary"])
+        assert compact["department"].tolist() == df["department"].tolist()
+
+        # CASE 2: Testing missing columns
+        compact = apply_dtype_plan(df[["name"]])
+        assert compact.equals(df[["name"]])
+
+    def test_reason_column(self):
+        reasons = reason_column(np.array([0, 2, 1, 0], dtype=np.uint8), REASONS)
+        assert reasons.tolist() == ["", REASONS[2], REASONS[1], ""]
+        assert (reasons != "").tolist() == [False, True, True, False]
+
+    def test_plain_frame(self):
+        df = pd.DataFrame({
+            "department": as_category(pd.Series(["HR", None, "IT"])),
+            "id": compact_int(pd.Series([1, 2, 3])),
+        })
+        plain = plain_frame(df)
+        assert plain["department"].dtype == object
+        assert plain["department"].tolist() == ["HR", None, "IT"]
+        assert str(plain["id"].dtype) == "Int8"
+
+        # CASE 2: Testing plain frames are kept
+        df = pd.DataFrame({"name": ["a"]})
+        assert plain_frame(df) is df
+
+    def test_arrow_frame(self):
+        df = pd.read_json("test.json", dtype=False)
+        df["department"] = as_category(df["department"])
+        arrow = arrow_frame(df)
+        assert str(arrow["name"].dtype) == "string[pyarrow]"
+        assert str(arrow["id"].dtype) == "int64[pyarrow]"
+        assert isinstance(arrow["department"].dtype, pd.CategoricalDtype)
+        assert arrow["salary"].isna().tolist() == df["salary"].isna().tolist()
+        assert arrow_frame(arrow) is arrow
@@ -0,0 +1,75 @@
+from email_index import BloomFilter, EmailIndex
+import numpy as np
+import os
+import pandas as pd
+
+
+class TestMain():
+
+    def test_contains(self, tmp_path):
+        with EmailIndex(str(tmp_path / "emails.sqlite")) as index:
+            assert index.contains(["a@x.com", "b@x.com"]).tolist() == [False, False]
+            index.add(["a@x.com"])
+            assert index.contains(pd.Series(["a@x.com", "b@x.com"])).tolist() == [True, False]
+            assert "a@x.com" in index
+            assert len(index) == 1
+
+    def test_spill(self, tmp_path):
+        emails = np.array([f"user{i}@x.com" for i in range(1000)], dtype=object)
+        with EmailIndex(str(tmp_path / "emails.sqlite"), memory_limit=100) as index:
+            for start in range(0, 1000, 30):
+                index.add(emails[start:start + 30])
+            # Only the emails added since the last spill are held in memory
+            assert len(index._memory) <= 100
+            assert index.contains(emails).all()
+            assert not index.contains(["other@x.com"]).any()
+            assert len(index) == 1000
+
+    def test_persistence(self, tmp_path):
+        path = str(tmp_path / "emails.sqlite")
+        index = EmailIndex(path)
+        index.add(["kept@x.com"])
+        index.commit()
+        index.add(["lost@x.com"])
+        # Closing commits the pending emails
+        index.close()
+        with EmailIndex(path) as index:
+            assert index.contains(["kept@x.com", "lost@x.com", "new@x.com"]).tolist() == [True, True, False]
+
+        # CASE 2: Testing emails which are not committed are not kept
+        index = EmailIndex(path, memory_limit=1)
+        index.add(["a@x.com"])
+        del index
+        with EmailIndex(path, memory_limit=1) as index:
+            assert index._spilled
+            assert index.contains(["kept@x.com", "new@x.com"]).tolist() == [True, False]
+
+        # CASE 3: Testing a temporary index is removed on close
+        index = EmailIndex()
+        assert os.path.exists(index.path)
+        index.close()
+        assert not os.path.exists(index.path)
+
+    def test_bloom(self, tmp_path):
+        bloom = BloomFilter(1000)
+        added = np.array([f"user{i}@x.com" for i in range(1000)], dtype=object)
+        others = np.array([f"other{i}@x.com" for i in range(10000)], dtype=object)
+        bloom.add(added)
+        assert bloom.might_contain(added).all()
+        assert bloom.might_contain(others).mean() < 0.03
+
+        # CASE 2: Testing the filter answers before the file and stays exact
+        path = str(tmp_path / "emails.sqlite")
+        with EmailIndex(path, memory_limit=10, bloom_capacity=1000) as index:
+            index.add(added)
+            assert index.contains(added).all()
+            assert not index.contains(others).any()
+        with EmailIndex(path, memory_limit=10, bloom_capacity=1000) as index:
+            assert index.bloom.might_contain(added).all()
+            assert index.contains(np.concatenate([added[:5], others[:5]])).tolist() == [True] * 5 + [False] * 5
+
+    def test_seed(self):
+        with EmailIndex() as index:
+            index.seed([pd.DataFrame({"email": ["a@x.com", None, "a@x.com"]}), pd.Series(["b@x.com"])])
+            assert len(index) == 2
+            assert index.contains(["a@x.com", "b@x.com"]).all()
@@ -1,8 +1,17 @@
 from datetime import datetime
-from etl_processor import ETLProcessor
+from checkpoint import CheckpointStore, frame_key
+from email_index import EmailIndex
+from etl_processor import SEED_EMAILS_QUERY, ETLProcessor, Records, _PendingEmails
+from pushdown import RECTIFY_DATE_DDL
+from validation import REASONS, evaluate_rules
+from unittest.mock import ANY
 import pandas as pd
 import numpy as np
 import pytest
+import json
+import math
+import os
+from psycopg2 import sql
 
 
 class TestMain():
@@ -47,6 +56,55 @@ class TestMain():
         e1.read_data()
 
 
+    def test_run_chunked(self, mocker):
+        df = pd.read_json("test.json", dtype=False)
+        mock_another_instance = mocker.Mock()
+        mock_another_instance.query_chunks.return_value = iter([df[:10], df[10:]])
+        mock_another_instance.df_to_sql.return_value = True
+        mocker.patch('etl_processor.DatabaseHandler', return_value=mock_another_instance)
+        e = ETLProcessor()
+        assert e.run_chunked(10)
+        mock_another_instance.query_chunks.assert_called_once_with(
+            "select * from tmp.employees_raw", 10
+        )
+        assert mock_another_instance.df_to_sql.call_count == 4
+
+        # CASE 2: Testing failed load stops the run
+        mock_another_instance = mocker.Mock()
+        mock_another_instance.query_chunks.return_value = iter([df[:10], df[10:]])
+        mock_another_instance.df_to_sql.return_value = False
+        mocker.patch('etl_processor.DatabaseHandler', return_value=mock_another_instance)
+        e = ETLProcessor()
+        assert not e.run_chunked(10)
+        # Both sinks of the first chunk are attempted, the second chunk is not
+        assert mock_another_instance.df_to_sql.call_count == 2
+
+        # CASE 3: Testing empty table
+        mock_another_instance = mocker.Mock()
+        mock_another_instance.query_chunks.return_value = iter([])
+        mocker.patch('etl_processor.DatabaseHandler', return_value=mock_another_instance)
+        e = ETLProcessor()
+        assert not e.run_chunked(10)
+
+        # CASE 4: Testing every stage and chunk uses the shared engine
+        mock_engine = mocker.Mock()
+        mock_another_instance = mocker.Mock()
+        mock_another_instance.query_chunks.return_value = iter([df[:10], df[10:]])
+        mock_another_instance.df_to_sql.return_value = True
+        handler = mocker.patch('etl_processor.DatabaseHandler', return_value=mock_another_instance)
+        e = ETLProcessor(engine=mock_engine)
+        assert e.run_chunked(10)
+        assert handler.call_count == 5
+        assert all(call.args == (mock_engine,) for call in handler.call_args_list)
+
+        # CASE 5: Testing a failed transform stops the run before the chunk is loaded
+        mock_another_instance = mocker.Mock()
+        mock_another_instance.query_chunks.return_value = iter([df[:10], df[10:]])
+        mocker.patch('etl_processor.DatabaseHandler', return_value=mock_another_instance)
+        mocker.patch('etl_processor.evaluate_rules', side_effect=ValueError("rules failed"))
+        assert not ETLProcessor().run_chunked(10)
+        mock_another_instance.df_to_sql.assert_not_called()
+
     def test_check_name(self):
         # CASE 1: Testing one valid
         test = [
@@ -219,6 +277,14 @@ class TestMain():
         e.remove_nega_sal()
         assert e.df.empty
 
+    def test_remove_invalid_salary_reason(self):
+        df = pd.read_json("test.json", dtype=False)
+        e = ETLProcessor(df)
+        e.remove_nega_sal()
+        rejected = e.copy_df[e.copy_df["reason"] != ""]
+        assert rejected["id"].tolist() == [10, 13, 20]
+        assert (rejected["reason"] == "Invalid Salary or less than 0 value").all()
+
     def test_check_date(self):
         # CASE 1: checking Correct values
         test = [
@@ -303,6 +369,11 @@ class TestMain():
         e = ETLProcessor(testdf)
         e.remove_invalid_date()
         assert e.df.empty
+        assert e.invalid_dates == 1
+
+        # CASE 5: Testing a processor without data or dates
+        assert ETLProcessor().remove_invalid_date() is None
+        assert ETLProcessor(pd.DataFrame({"id": [1]})).remove_invalid_date() is None
     
     def test_transform_data(self):
         test = [
@@ -327,6 +398,67 @@ class TestMain():
         e.transform_data()
         assert e.df.empty
 
+    def test_transform_data_parallel(self, mocker):
+        parallel = mocker.patch("etl_processor.evaluate_rules_parallel", side_effect=lambda df, workers, index, pool: evaluate_rules(df, index=index))
+        df = pd.read_json("test.json", dtype=False)
+        e = ETLProcessor(df, transform_workers=4)
+        e.transform_data()
+        parallel.assert_called_once_with(ANY, 4, index=None, pool=None)
+        assert e.df["id"].tolist() == [3, 5, 6, 7, 11, 14, 17, 18]
+
+        # CASE 2: Testing the chunks of a run share one pool
+        mocker.patch("os.cpu_count", return_value=8)
+        pool = mocker.patch("etl_processor.transform_pool")
+        mock_another_instance = mocker.Mock()
+        mock_another_instance.query_chunks.side_effect = lambda *args, **kwargs: iter([df[:7], df[7:14], df[14:]])
+        mock_another_instance.df_to_sql.return_value = True
+        mocker.patch('etl_processor.DatabaseHandler', return_value=mock_another_instance)
+        for pipelined in (False, True):
+            pool.reset_mock()
+            parallel.reset_mock()
+            e = ETLProcessor(transform_workers=4)
+            assert e.run_chunked(7, pipelined=pipelined)
+            pool.assert_called_once_with(4)
+            assert [call.kwargs["pool"] for call in parallel.call_args_list] == [pool.return_value] * 3
+            pool.return_value.shutdown.assert_called_once()
+            assert e._ETLProcessor__pool is None
+
+        # CASE 3: Testing no pool is started on a single core
+        mocker.patch("os.cpu_count", return_value=1)
+        pool.reset_mock()
+        assert ETLProcessor(transform_workers=4).run_chunked(7)
+        pool.assert_not_called()
+
+    def test_transform_data_matches_stages(self):
+        df = pd.read_json("test.json", dtype=False)
+        fused = ETLProcessor(df.copy())
+        fused.transform_data()
+        staged = ETLProcessor(df.copy())
+        staged.remove_empty_name()
+        staged.remove_invalid_email()
+        staged.remove_nega_sal()
+        staged.remove_invalid_date()
+        assert fused.df.equals(staged.df)
+        assert fused.copy_df.equals(staged.copy_df)
+        assert fused.df["id"].tolist() == [3, 5, 6, 7, 11, 14, 17, 18]
+        assert fused.invalid_dates == staged.invalid_dates == 1
+
+    def test_records_are_lazy(self, mocker):
+        df = pd.read_json("test.json", dtype=False)
+        to_json = mocker.spy(pd.DataFrame, "to_json")
+        e = ETLProcessor(df)
+        e.transform_data()
+        records = e.remove_empty_name()
+        assert isinstance(records, Records)
+        to_json.assert_not_called()
+
+        # Records are serialized once, when they are read
+        assert len(records) == 8
+        assert records[0]["id"] == 3
+        assert records == json.loads(e.df.to_json(orient="records"))
+        assert list(records) == records.materialize()
+        assert to_json.call_count == 2
+
     def test_load_data(self,mocker):
         test = [
             {
@@ -367,4 +499,658 @@ class TestMain():
         mocker.patch('etl_processor.DatabaseHandler', return_value=mock_another_instance)
         e = ETLProcessor(test)
         e.load_outlier_data()
-        mock_another_instance.df_to_sql.assert_called_once()
\ No newline at end of file
+        mock_another_instance.df_to_sql.assert_called_once()
+
+    def test_load_all(self, mocker):
+        df = pd.read_json("test.json", dtype=False)
+        mock_another_instance = mocker.Mock()
+        mock_another_instance.df_to_sql.return_value = True
+        mocker.patch('etl_processor.DatabaseHandler', return_value=mock_another_instance)
+        e = ETLProcessor(df)
+        e.transform_data()
+        assert e.load_all()
+        tables = sorted(call.args[1] for call in mock_another_instance.df_to_sql.call_args_list)
+        assert tables == ["employees_processed", "employees_unprocessed"]
+
+        # CASE 2: Testing a failed sink doesn't stop the other one
+        mock_another_instance = mocker.Mock()
+        mock_another_instance.df_to_sql.side_effect = lambda data, table, *args, **kwargs: table == "employees_processed"
+        mocker.patch('etl_processor.DatabaseHandler', return_value=mock_another_instance)
+        assert not e.load_all()
+        assert mock_another_instance.df_to_sql.call_count == 2
+
+        # CASE 3: Testing both sinks failing
+        mock_another_instance = mocker.Mock()
+        mock_another_instance.df_to_sql.side_effect = Exception("connection lost")
+        mocker.patch('etl_processor.DatabaseHandler', return_value=mock_another_instance)
+        assert not e.load_all()
+        assert mock_another_instance.df_to_sql.call_count == 2
+
+    def test_incremental(self, mocker):
+        df = pd.read_json("test.json", dtype=False)
+        mock_another_instance = mocker.Mock()
+        mock_another_instance.get_watermark.return_value = "4"
+        mock_another_instance.query.return_value = df[df["id"] > 4]
+        mock_another_instance.load_with_watermark.return_value = True
+        mocker.patch('etl_processor.DatabaseHandler', return_value=mock_another_instance)
+        e = ETLProcessor(watermark_column="id")
+        e.read_data()
+        mock_another_instance.get_watermark.assert_called_once_with("employees_raw", "id")
+        query, params = mock_another_instance.query.call_args.args
+        assert isinstance(query, sql.Composed)
+        assert params == ("4",)
+        e.transform_data()
+        assert e.load_all()
+        frames, schema, source, column, value = mock_another_instance.load_with_watermark.call_args.args
+        assert [table for _, table in frames] == ["employees_processed", "employees_unprocessed"]
+        assert (source, column, value) == ("employees_raw", "id", str(df["id"].max()))
+        mock_another_instance.df_to_sql.assert_not_called()
+
+        # CASE 2: Testing the first run reads the whole table
+        mock_another_instance.get_watermark.return_value = None
+        mock_another_instance.query.return_value = df
+        e = ETLProcessor(watermark_column="id")
+        e.read_data()
+        assert len(mock_another_instance.query.call_args.args) == 1
+
+        # CASE 3: Testing a failed load reports failure
+        mock_another_instance.load_with_watermark.return_value = False
+        e.transform_data()
+        assert not e.load_all()
+
+        # CASE 4: Testing the mark moves with every chunk
+        mock_another_instance = mocker.Mock()
+        mock_another_instance.get_watermark.return_value = None
+        mock_another_instance.query_chunks.return_value = iter([df[:10], df[10:]])
+        mock_another_instance.load_with_watermark.return_value = True
+        mocker.patch('etl_processor.DatabaseHandler', return_value=mock_another_instance)
+        e = ETLProcessor(watermark_column="id")
+        assert e.run_chunked(10)
+        values = [call.args[4] for call in mock_another_instance.load_with_watermark.call_args_list]
+        assert values == [str(df["id"][:10].max()), str(df["id"].max())]
+
+        # CASE 5: Testing a rerun with nothing past the mark succeeds, chunked or not
+        mock_another_instance.reset_mock()
+        mock_another_instance.get_watermark.return_value = str(df["id"].max())
+        mock_another_instance.query_chunks.return_value = iter([])
+        assert ETLProcessor(watermark_column="id").run_chunked(10)
+        mock_another_instance.query.return_value = df[:0]
+        e = ETLProcessor(watermark_column="id")
+        assert e.read_data() is not None
+        e.transform_data()
+        assert e.load_all()
+        mock_another_instance.load_with_watermark.assert_not_called()
+        mock_another_instance.df_to_sql.assert_not_called()
+
+        # CASE 6: Testing a single table is not loaded without the mark
+        e = ETLProcessor(df, watermark_column="id")
+        e.transform_data()
+        assert not e.load_data()
+        assert not e.load_outlier_data()
+        mock_another_instance.df_to_sql.assert_not_called()
+
+    def test_incremental_ties(self, mocker):
+        mocker.patch('psycopg2.extensions.quote_ident', side_effect=lambda name, conn: '"%s"' % name)
+        df = pd.read_json("test.json", dtype=False)
+        df["updated_at"] = pd.Timestamp("2022-01-01")
+        df.loc[df["id"] > 15, "updated_at"] = pd.Timestamp("2022-01-02")
+        marks = {}
+        loaded = []
+        queries = []
+        calls = []
+
+        def query_chunks(statement, chunksize, params=None, **kwargs):
+            queries.append(statement.as_string(None) if isinstance(statement, sql.Composable) else statement)
+            rows = df.sort_values(["updated_at", "id"])
+            if params is not None:
+                mark, tie = pd.Timestamp(params[0]), int(params[1])
+                rows = rows[(rows["updated_at"] > mark) | ((rows["updated_at"] == mark) & (rows["id"] > tie))]
+            return iter([rows[i:i + chunksize] for i in range(0, len(rows), chunksize)])
+
+        def load_with_watermark(frames, schema, source, column, value, keys=None, tie=None):
+            calls.append(value)
+            if len(calls) == 3:
+                return False
+            loaded.extend(i for data, _ in frames for i in data["id"])
+            marks["keyset"] = (value, tie)
+            return True
+
+        mock_another_instance = mocker.Mock()
+        mock_another_instance.get_watermark_keyset.side_effect = lambda source, column: marks.get("keyset")
+        mock_another_instance.query_chunks.side_effect = query_chunks
+        mock_another_instance.load_with_watermark.side_effect = load_with_watermark
+        mocker.patch('etl_processor.DatabaseHandler', return_value=mock_another_instance)
+        assert not ETLProcessor(watermark_column="updated_at").run_chunked(5)
+        assert marks["keyset"] == ("2022-01-01T00:00:00", "10")
+        assert ETLProcessor(watermark_column="updated_at").run_chunked(5)
+        assert '("updated_at", "id") > (%s, %s) order by "updated_at", "id"' in queries[-1]
+        assert sorted(loaded) == df["id"].tolist()
+        assert marks["keyset"] == ("2022-01-02T00:00:00", "20")
+        mock_another_instance.get_watermark.assert_not_called()
+
+    def test_load_upsert(self, mocker):
+        df = pd.read_json("test.json", dtype=False)
+        mock_another_instance = mocker.Mock()
+        mock_another_instance.df_to_sql.return_value = True
+        mocker.patch('etl_processor.DatabaseHandler', return_value=mock_another_instance)
+        e = ETLProcessor(df, load_method="upsert")
+        e.transform_data()
+        assert e.load_all()
+        keys = {call.args[1]: call.kwargs for call in mock_another_instance.df_to_sql.call_args_list}
+        assert keys["employees_processed"] == {"method": "upsert", "key": ("email",)}
+        assert keys["employees_unprocessed"] == {"method": "upsert", "key": ("id",)}
+
+        # CASE 2: Testing configured keys in incremental mode
+        mock_another_instance.load_with_watermark.return_value = True
+        e = ETLProcessor(df, load_method="upsert", watermark_column="id", upsert_keys={"employees_processed": ("id",)})
+        e.transform_data()
+        assert e.load_all()
+        assert mock_another_instance.load_with_watermark.call_args.kwargs == {"keys": {"employees_processed": ("id",)}, "tie": None}
+
+    def test_read_partitions(self, mocker):
+        mocker.patch('psycopg2.extensions.quote_ident', side_effect=lambda name, conn: '"%s"' % name)
+        df = pd.read_json("test.json", dtype=False)
+        queries = []
+
+        def query(statement, params=None):
+            statement = statement.as_string(None)
+            if statement.startswith("select count"):
+                return pd.DataFrame({"partition_rows": [len(df)]})
+            if statement.startswith("select percentile_disc"):
+                # The value at the fraction of the sorted column, as PostgreSQL takes it
+                ids = df["id"].sort_values().tolist()
+                return pd.DataFrame({"cuts": [[ids[math.ceil(f * len(ids)) - 1] for f in params[0]]]})
+            queries.append((statement, params))
+            if '"id" >= %s and "id" < %s' in statement:
+                return df[(df["id"] >= params[-2]) & (df["id"] < params[-1])]
+            if '"id" >= %s' in statement:
+                return df[df["id"] >= params[-1]]
+            return df[df["id"] < params[-1]]
+
+        mock_another_instance = mocker.Mock()
+        mock_another_instance.query.side_effect = query
+        mocker.patch('etl_processor.DatabaseHandler', return_value=mock_another_instance)
+        e = ETLProcessor(read_connections=3)
+        e.read_data()
+        assert e.df["id"].tolist() == df["id"].tolist()
+        assert len(queries) == 3
+        assert sorted(params for _, params in queries) == [(7,), (7, 14), (14,)]
+
+        # CASE 2: Testing ranges of about chunksize rows feed the chunked run
+        queries.clear()
+        mock_another_instance.df_to_sql.return_value = True
+        e = ETLProcessor(read_connections=2)
+        assert e.run_chunked(5)
+        assert len(queries) == 4
+        mock_another_instance.query_chunks.assert_not_called()
+        assert mock_another_instance.df_to_sql.call_count == 8
+
+        # CASE 3: Testing a failed range fails the read
+        mock_another_instance.query.side_effect = lambda statement, params=None: (
+            pd.DataFrame({"cuts": [[7, 14]]}) if statement.as_string(None).startswith("select percentile_disc") else None
+        )
+        e = ETLProcessor(read_connections=3)
+        assert e.read_data() is None
+
+        # CASE 4: Testing incremental chunks partitioned on another column
+        e = ETLProcessor(read_connections=3, watermark_column="updated_at")
+        with pytest.raises(ValueError):
+            next(e.read_data_chunks(5))
+
+        # CASE 5: Testing a sparse key is cut by its row count, on exact values
+        big = 2 ** 62 + 1
+        cuts = [[big, big, big * 2 - 1, None]]
+        mock_another_instance.query.side_effect = lambda statement, params=None: (
+            pd.DataFrame({"cuts": cuts}) if statement.as_string(None).startswith("select percentile_disc")
+            else pd.DataFrame({"partition_rows": [20]})
+        )
+        queries = list(ETLProcessor(read_connections=2)._partition_queries(5))
+        fractions = mock_another_instance.query.call_args.args[1][0]
+        assert fractions == [0.25, 0.5, 0.75]
+        assert [query[1] for query in queries] == [(big,), (big, big * 2 - 1), (big * 2 - 1,)]
+
+        # CASE 6: Testing a column with no value is read in one range
+        cuts = [None]
+        e = ETLProcessor(read_connections=2, partition_column="email")
+        assert len(list(e._partition_queries(5))) == 1
+        assert '"email" is not null' in mock_another_instance.query.call_args.args[0].as_string(None)
+
+    def test_metrics(self, mocker):
+        df = pd.read_json("test.json", dtype=False)
+        mock_another_instance = mocker.Mock()
+        mock_another_instance.query.return_value = df
+        mock_another_instance.df_to_sql.return_value = True
+        mocker.patch('etl_processor.DatabaseHandler', return_value=mock_another_instance)
+        e = ETLProcessor()
+        e.read_data()
+        e.transform_data()
+        e.load_all()
+        summary = e.metrics.summary()
+        # The two loads run at the same time, either can be recorded first
+        assert list(summary)[:2] == ["read", "transform"]
+        assert sorted(list(summary)[2:]) == ["load:employees_processed", "load:employees_unprocessed"]
+        assert summary["read"]["rows_out"] == 20
+        assert summary["transform"]["rows_out"] == 8
+        assert summary["transform"]["rejected"] == {"name": 4, "email": 6, "salary": 1, "date": 1}
+        assert summary["load:employees_unprocessed"]["rows_in"] == 12
+
+        # CASE 2: Testing every remove_* stage is measured
+        e = ETLProcessor(df)
+        e.remove_empty_name()
+        e.remove_invalid_email()
+        assert [record["stage"] for record in e.metrics.stages] == ["rule:name", "rule:email"]
+        assert e.metrics.stages[0]["rejected"] == {"name": 4}
+
+    def test_compact(self, mocker):
+        df = pd.read_json("test.json", dtype=False)
+        mock_another_instance = mocker.Mock()
+        mock_another_instance.query.return_value = df
+        mock_another_instance.df_to_sql.return_value = True
+        mocker.patch('etl_processor.DatabaseHandler', return_value=mock_another_instance)
+        e = ETLProcessor(compact=True)
+        e.read_data()
+        assert isinstance(e.df["department"].dtype, pd.CategoricalDtype)
+        e.transform_data()
+        assert str(e.df["salary"].dtype) == "Int32"
+        assert isinstance(e.copy_df["reason"].dtype, pd.CategoricalDtype)
+        plain = ETLProcessor(df)
+        plain.transform_data()
+        assert e.df["id"].tolist() == plain.df["id"].tolist()
+        assert e.copy_df["reason"].tolist() == plain.copy_df["reason"].tolist()
+        assert e.load_all()
+
+        # CASE 2: Testing the remove_* stages
+        e = ETLProcessor(compact=True)
+        e.read_data()
+        e.remove_empty_name()
+        e.remove_nega_sal()
+        assert str(e.df["salary"].dtype) == "Int32"
+        counts = e.copy_df["reason"].value_counts()
+        assert counts[counts > 0].to_dict() == {"": 14, "Empty Name": 4, "Invalid Salary or less than 0 value": 2}
+
+    def test_rejection_log(self, mocker):
+        df = pd.read_json("test.json", dtype=False)
+        e = ETLProcessor(df)
+        e.transform_data()
+        # Only the rejected rows are logged, the original frame is not copied
+        assert len(e.rejected_positions) == len(e.rejected_codes) == 12
+        assert e.raw is df
+        outliers = e.outliers()
+        assert outliers["id"].tolist() == [1, 2, 4, 8, 9, 10, 12, 13, 15, 16, 19, 20]
+        assert outliers["salary"].tolist() == df["salary"][outliers.index].tolist()
+        assert outliers["reason"].tolist() == e.copy_df["reason"][outliers.index].tolist()
+
+        # CASE 2: Testing the staged rules log in the order of the frame
+        staged = ETLProcessor(df)
+        staged.remove_empty_name()
+        staged.remove_invalid_email()
+        staged.remove_nega_sal()
+        staged.remove_invalid_date()
+        assert staged.outliers().equals(outliers)
+
+        # CASE 3: Testing the outliers are built when loaded
+        mock_another_instance = mocker.Mock()
+        mock_another_instance.df_to_sql.return_value = True
+        mocker.patch('etl_processor.DatabaseHandler', return_value=mock_another_instance)
+        build = mocker.spy(e, "outliers")
+        e.load_data()
+        build.assert_not_called()
+        e.load_outlier_data()
+        build.assert_called_once()
+        assert mock_another_instance.df_to_sql.call_args.args[0].equals(outliers)
+
+    def test_arrow(self, mocker):
+        df = pd.read_json("test.json", dtype=False)
+        e = ETLProcessor(df, arrow=True)
+        assert all(isinstance(dtype, pd.ArrowDtype) for dtype in e.df.dtypes)
+        e.transform_data()
+        assert str(e.df["salary"].dtype) == "int64[pyarrow]"
+        assert str(e.df["email"].dtype) == "string[pyarrow]"
+        plain = ETLProcessor(df)
+        plain.transform_data()
+        assert e.df["id"].tolist() == plain.df["id"].tolist()
+        assert e.outliers()["reason"].tolist() == plain.outliers()["reason"].tolist()
+
+        # CASE 2: Testing the raw table is read Arrow backed
+        mock_another_instance = mocker.Mock()
+        mock_another_instance.query.return_value = df.convert_dtypes(dtype_backend="pyarrow")
+        mocker.patch('etl_processor.DatabaseHandler', return_value=mock_another_instance)
+        e = ETLProcessor(arrow=True, compact=True)
+        e.read_data()
+        mock_another_instance.query.assert_called_once_with("select * from tmp.employees_raw", dtype_backend="pyarrow")
+        assert str(e.df["id"].dtype) == "int8[pyarrow]"
+        assert isinstance(e.df["department"].dtype, pd.CategoricalDtype)
+
+    def test_email_index(self, mocker):
+        df = pd.read_json("test.json", dtype=False)
+        whole = ETLProcessor(df)
+        whole.transform_data()
+        loaded = []
+        mock_another_instance = mocker.Mock()
+        mock_another_instance.query_chunks.return_value = iter([df[:10], df[10:]])
+        mock_another_instance.df_to_sql.side_effect = lambda data, table, *args, **kwargs: loaded.append((table, data)) or True
+        mocker.patch('etl_processor.DatabaseHandler', return_value=mock_another_instance)
+        with EmailIndex() as index:
+            e = ETLProcessor(email_index=index)
+            assert e.run_chunked(10)
+            processed = pd.concat([data for table, data in loaded if table == "employees_processed"])
+            outliers = pd.concat([data for table, data in loaded if table == "employees_unprocessed"])
+            # Chunks give the same split as the whole frame
+            assert processed["id"].tolist() == whole.df["id"].tolist()
+            assert outliers.sort_values("id")["reason"].tolist() == whole.outliers().sort_values("id")["reason"].tolist()
+            assert index.contains(whole.df["email"]).all()
+
+        # CASE 2: Testing the emails of a failed load are not taken
+        with EmailIndex() as index:
+            mock_another_instance.df_to_sql.side_effect = None
+            mock_another_instance.df_to_sql.return_value = False
+            e = ETLProcessor(df, email_index=index)
+            e.transform_data()
+            assert not e.load_all()
+            assert len(index) == 0
+            mock_another_instance.df_to_sql.return_value = True
+            assert e.load_all()
+            assert len(index) == 10
+            e = ETLProcessor(df, email_index=index)
+            e.transform_data()
+            assert e.df.empty
+
+        # CASE 3: Testing the stage by stage email rule uses the index
+        with EmailIndex() as index:
+            index.add(["john.doe@example.com"])
+            e = ETLProcessor(df, email_index=index)
+            e.remove_empty_name()
+            e.remove_invalid_email()
+            assert "john.doe@example.com" not in e.df["email"].tolist()
+            assert e.new_emails.tolist() == e.df["email"].tolist()
+
+        # CASE 4: Testing the single table loader takes the emails once the rows are in
+        with EmailIndex() as index:
+            mock_another_instance.df_to_sql.return_value = False
+            e = ETLProcessor(df, email_index=index)
+            e.transform_data()
+            assert not e.load_data()
+            assert len(index) == 0
+            mock_another_instance.df_to_sql.return_value = True
+            assert e.load_data()
+            assert len(index) == 10
+
+    def test_seed_email_index(self, mocker):
+        mock_another_instance = mocker.Mock()
+        mock_another_instance.query_chunks.return_value = iter([pd.DataFrame({"email": ["a@x.com", "b@x.com"]})])
+        mocker.patch('etl_processor.DatabaseHandler', return_value=mock_another_instance)
+        with EmailIndex() as index:
+            e = ETLProcessor(email_index=index)
+            assert e.seed_email_index(500)
+            mock_another_instance.query_chunks.assert_called_once_with(
+                SEED_EMAILS_QUERY, 500, (["Invalid Salary or less than 0 value", "Invalid Date format"],)
+            )
+            assert len(index) == 2
+
+        # CASE 2: Testing a failed seed
+        mock_another_instance.query_chunks.side_effect = Exception("no table")
+        with EmailIndex() as index:
+            assert not ETLProcessor(email_index=index).seed_email_index()
+
+    def test_run_file(self, mocker, tmp_path):
+        mock_another_instance = mocker.Mock()
+        mock_another_instance.df_to_sql.return_value = True
+        mocker.patch('etl_processor.DatabaseHandler', return_value=mock_another_instance)
+        e = ETLProcessor()
+        assert e.run_file("test.json", 10)
+        assert mock_another_instance.df_to_sql.call_count == 4
+        processed = [call.args[0] for call in mock_another_instance.df_to_sql.call_args_list if call.args[1] == "employees_processed"]
+        assert sum(len(data) for data in processed) == 8
+
+        # CASE 2: Testing a watermark is refused for files
+        e = ETLProcessor(watermark_column="id")
+        assert not e.run_file("test.json", 10)
+
+        # CASE 3: Testing a missing file
+        assert not ETLProcessor().run_file(str(tmp_path / "missing.ndjson"))
+
+    def test_checkpoints(self, mocker, tmp_path):
+        df = pd.read_json("test.json", dtype=False)
+        mock_another_instance = mocker.Mock()
+        mock_another_instance.query.return_value = df
+        mocker.patch('etl_processor.DatabaseHandler', return_value=mock_another_instance)
+        store = CheckpointStore(str(tmp_path))
+        e = ETLProcessor(checkpoints=store)
+        e.read_data()
+        e.transform_data()
+        expected = ETLProcessor(df)
+        expected.transform_data()
+        assert e.df.equals(expected.df)
+        assert store.latest("read") == frame_key(df)
+        assert store.latest() == store.latest("transform")
+
+        # CASE 2: Testing a rerun on the same data restores the transform
+        evaluate = mocker.patch("etl_processor.evaluate_rules", side_effect=evaluate_rules)
+        e = ETLProcessor(checkpoints=store)
+        e.read_data()
+        e.transform_data()
+        evaluate.assert_not_called()
+        assert e.df.equals(expected.df)
+        assert e.outliers().equals(expected.outliers())
+        assert e.invalid_dates == expected.invalid_dates == 1
+
+        # CASE 3: Testing each stage runs on its own in a new processor
+        e = ETLProcessor(checkpoints=store)
+        assert e.restore_checkpoint("read")
+        for stage in ("remove_empty_name", "remove_invalid_email", "remove_nega_sal", "remove_invalid_date"):
+            e = ETLProcessor(checkpoints=store)
+            assert e.restore_checkpoint()
+            getattr(e, stage)()
+        assert store.latest() == store.latest("rule:date")
+        assert e.df.equals(expected.df)
+        assert e.outliers().equals(expected.outliers())
+
+        # CASE 4: Testing changed rules or data miss the checkpoints
+        mocker.patch("etl_processor.RULE_VERSION", 2)
+        e = ETLProcessor(df, checkpoints=store)
+        e.transform_data()
+        assert evaluate.call_count == 1
+        mocker.patch("etl_processor.RULE_VERSION", 1)
+        e = ETLProcessor(df.iloc[1:], checkpoints=store)
+        e.transform_data()
+        assert evaluate.call_count == 2
+
+        # CASE 5: Testing stages with an email index are never cached
+        with EmailIndex() as index:
+            e = ETLProcessor(df, checkpoints=store, email_index=index)
+            e.transform_data()
+        assert evaluate.call_count == 3
+
+        # CASE 6: Testing a missing checkpoint
+        assert not ETLProcessor(checkpoints=CheckpointStore(str(tmp_path / "empty"))).restore_checkpoint()
+
+    def test_run_id(self, mocker, tmp_path):
+        mocker.patch('psycopg2.extensions.quote_ident', side_effect=lambda name, conn: '"%s"' % name)
+        df = pd.read_json("test.json", dtype=False)
+        mock_another_instance = mocker.Mock()
+        mock_another_instance.get_chunk_offset.return_value = None
+        mock_another_instance.query_chunks.return_value = iter([df[:10], df[10:]])
+        mock_another_instance.load_with_offset.return_value = True
+        mocker.patch('etl_processor.DatabaseHandler', return_value=mock_another_instance)
+        e = ETLProcessor(run_id="nightly")
+        assert e.run_chunked(10)
+        query = mock_another_instance.query_chunks.call_args.args[0]
+        assert query.as_string(None) == 'select * from tmp.employees_raw order by "id"'
+        offsets = [call.args[2:7] for call in mock_another_instance.load_with_offset.call_args_list]
+        assert offsets == [("nightly", "employees_raw", "id", "10", 10), ("nightly", "employees_raw", "id", "20", 10)]
+        mock_another_instance.df_to_sql.assert_not_called()
+        mock_another_instance.complete_chunk_offset.assert_called_once_with("nightly", "employees_raw")
+
+        # CASE 2: Testing a restarted run reads after the last loaded chunk
+        mock_another_instance.reset_mock()
+        mock_another_instance.get_chunk_offset.return_value = {"value": "10", "chunks": 1, "rows": 10, "completed": False}
+        mock_another_instance.query_chunks.return_value = iter([df[10:]])
+        e = ETLProcessor(run_id="nightly")
+        assert e.run_chunked(10)
+        query, chunksize, params = mock_another_instance.query_chunks.call_args.args
+        assert query.as_string(None) == 'select * from tmp.employees_raw where ("id" > %s or "id" is null) order by "id"'
+        assert params == ("10",)
+        assert mock_another_instance.load_with_offset.call_count == 1
+
+        # CASE 3: Testing a restarted run with nothing left is completed
+        mock_another_instance.reset_mock()
+        mock_another_instance.query_chunks.return_value = iter([])
+        assert ETLProcessor(run_id="nightly").run_chunked(10)
+        mock_another_instance.complete_chunk_offset.assert_called_once()
+
+        # CASE 4: Testing a completed run does nothing
+        mock_another_instance.reset_mock()
+        mock_another_instance.get_chunk_offset.return_value = {"value": "20", "chunks": 2, "rows": 20, "completed": True}
+        assert ETLProcessor(run_id="nightly").run_chunked(10)
+        mock_another_instance.query_chunks.assert_not_called()
+
+        # CASE 5: Testing a failed chunk stops the run before it is completed
+        mock_another_instance.reset_mock()
+        mock_another_instance.get_chunk_offset.return_value = None
+        mock_another_instance.query_chunks.return_value = iter([df[:10], df[10:]])
+        mock_another_instance.load_with_offset.return_value = False
+        assert not ETLProcessor(run_id="nightly").run_chunked(10)
+        assert mock_another_instance.load_with_offset.call_count == 1
+        mock_another_instance.complete_chunk_offset.assert_not_called()
+
+        # CASE 6: Testing a run id is refused in incremental mode
+        mock_another_instance.reset_mock()
+        mock_another_instance.load_with_offset.return_value = True
+        assert not ETLProcessor(run_id="nightly", watermark_column="id").run_chunked(10)
+
+        # CASE 7: Testing a column with duplicates and NULLs is read in (column, id) order, NULLs last
+        mock_another_instance.reset_mock()
+        mock_another_instance.get_chunk_offset.return_value = None
+        ordered = df.assign(department=["HR"] * 5 + ["IT"] * 10 + [None] * 5).sort_values(["department", "id"])
+        mock_another_instance.query_chunks.return_value = iter([ordered[:10], ordered[10:17], ordered[17:]])
+        assert ETLProcessor(run_id="nightly", partition_column="department").run_chunked(10)
+        query = mock_another_instance.query_chunks.call_args.args[0]
+        assert query.as_string(None) == 'select * from tmp.employees_raw order by "department", "id"'
+        offsets = [(call.args[5], call.kwargs["tie"]) for call in mock_another_instance.load_with_offset.call_args_list]
+        assert offsets == [("IT", "10"), (None, "17"), (None, "20")]
+
+        # CASE 8: Testing a run resumed inside a value or inside the NULLs
+        for offset, condition, params in (
+            ({"value": "IT", "tie": "10"}, '(("department", "id") > (%s, %s) or "department" is null)', ("IT", "10")),
+            ({"value": None, "tie": "17"}, '"department" is null and "id" > %s', ("17",)),
+        ):
+            mock_another_instance.reset_mock()
+            mock_another_instance.get_chunk_offset.return_value = {**offset, "chunks": 1, "rows": 10, "completed": False}
+            mock_another_instance.query_chunks.return_value = iter([])
+            assert ETLProcessor(run_id="nightly", partition_column="department").run_chunked(10)
+            query, chunksize, query_params = mock_another_instance.query_chunks.call_args.args
+            assert query.as_string(None) == f'select * from tmp.employees_raw where {condition} order by "department", "id"'
+            assert query_params == params
+
+        # CASE 9: Testing a chunk ending on a NULL key fails instead of losing the rest
+        mock_another_instance.reset_mock()
+        mock_another_instance.get_chunk_offset.return_value = None
+        mock_another_instance.query_chunks.return_value = iter([df.assign(id=df["id"].astype(float).where(df["id"] < 15))])
+        assert not ETLProcessor(run_id="nightly").run_chunked(20)
+        mock_another_instance.load_with_offset.assert_not_called()
+
+    def test_run_id_file(self, mocker):
+        mock_another_instance = mocker.Mock()
+        mock_another_instance.get_chunk_offset.return_value = {"value": None, "chunks": 1, "rows": 6, "completed": False}
+        mock_another_instance.load_with_offset.return_value = True
+        mocker.patch('etl_processor.DatabaseHandler', return_value=mock_another_instance)
+        e = ETLProcessor(run_id="dump")
+        assert e.run_file("test.json", 10)
+        source = "file:" + os.path.abspath("test.json")
+        mock_another_instance.get_chunk_offset.assert_called_once_with("dump", source)
+        # The 6 loaded rows are skipped, whatever the chunk size was
+        offsets = [call.args[2:7] for call in mock_another_instance.load_with_offset.call_args_list]
+        assert offsets == [("dump", source, None, None, 4), ("dump", source, None, None, 10)]
+        assert mock_another_instance.load_with_offset.call_args_list[0].args[0][0][0]["id"].min() > 6
+
+    def test_pipelined(self, mocker):
+        df = pd.read_json("test.json", dtype=False)
+        loaded = []
+        mock_another_instance = mocker.Mock()
+        mock_another_instance.query_chunks.side_effect = lambda *args, **kwargs: iter([df[:7], df[7:14], df[14:]])
+        mock_another_instance.df_to_sql.side_effect = lambda data, table, *args, **kwargs: loaded.append((table, data)) or True
+        mocker.patch('etl_processor.DatabaseHandler', return_value=mock_another_instance)
+        assert ETLProcessor().run_chunked(7)
+        sequential, loaded[:] = list(loaded), []
+        e = ETLProcessor()
+        assert e.run_chunked(7, pipelined=True)
+        # Same loads, chunk after chunk; load_all pushes the two tables of a chunk in any order
+        def by_chunk(loads):
+            return [load for i in range(0, len(loads), 2) for load in sorted(loads[i:i + 2], key=lambda load: load[0])]
+        loaded, sequential = by_chunk(loaded), by_chunk(sequential)
+        assert [table for table, data in loaded] == [table for table, data in sequential]
+        for (_, data), (_, expected) in zip(loaded, sequential):
+            assert data.reset_index(drop=True).equals(expected.reset_index(drop=True))
+        reads = [record["rows_out"] for record in e.metrics.stages if record["stage"] == "read"]
+        assert reads == [7, 7, 6, 0]
+
+        # CASE 2: Testing the email index sees the emails of the chunks not loaded yet
+        whole = ETLProcessor(df)
+        whole.transform_data()
+        with EmailIndex() as index:
+            assert ETLProcessor(email_index=index).run_chunked(7)
+            taken = len(index)
+        loaded[:] = []
+        with EmailIndex() as index:
+            assert ETLProcessor(email_index=index).run_chunked(7, pipelined=True)
+            processed = pd.concat([data for table, data in loaded if table == "employees_processed"])
+            assert processed["id"].tolist() == whole.df["id"].tolist()
+            assert len(index) == taken
+
+        # CASE 3: Testing a failed load stops the run
+        mock_another_instance.df_to_sql.side_effect = None
+        mock_another_instance.df_to_sql.reset_mock()
+        mock_another_instance.df_to_sql.return_value = False
+        assert not ETLProcessor().run_chunked(7, pipelined=True)
+        # Only the first chunk was loaded
+        calls = [(call.args[1], len(call.args[0])) for call in mock_another_instance.df_to_sql.call_args_list]
+        assert calls == [("employees_processed", 4), ("employees_unprocessed", 3)]
+
+        # CASE 4: Testing an empty table
+        mock_another_instance.query_chunks.side_effect = lambda *args, **kwargs: iter([])
+        assert not ETLProcessor().run_chunked(7, pipelined=True)
+
+        # CASE 5: Testing an email loaded and released while it is looked up is still found
+        with EmailIndex() as index:
+            emails = _PendingEmails(index)
+            emails.hold("chunk", pd.Series(["a@b.co"]))
+            lookup = index.contains
+
+            def contains_then_load(values):
+                found = lookup(values)
+                index.add(["a@b.co"])
+                index.commit()
+                emails.release("chunk")
+                return found
+
+            mocker.patch.object(index, "contains", side_effect=contains_then_load)
+            assert emails.contains(np.array(["a@b.co", "c@d.co"], dtype=object)).tolist() == [True, False]
+
+    def test_pushdown(self, mocker):
+        mock_another_instance = mocker.Mock()
+        mock_another_instance.table_columns.return_value = ["id", "name", "email", "salary", "department", "join_date"]
+        mock_another_instance.execute.return_value = [(0, 8, 8), (1, 4, 0), (2, 6, 5), (3, 1, 1), (4, 1, 1)]
+        mocker.patch('etl_processor.DatabaseHandler', return_value=mock_another_instance)
+        e = ETLProcessor()
+        assert e.run_pushdown()
+        mock_another_instance.table_columns.assert_called_once_with("tmp", "employees_raw")
+        statements = mock_another_instance.execute.call_args.args[0]
+        assert statements[0] == (RECTIFY_DATE_DDL, None)
+        assert statements[1][1]["reasons"] == list(REASONS[1:])
+        assert e.invalid_dates == 1
+        assert e.df is None
+        summary = e.metrics.summary()["pushdown"]
+        assert (summary["rows_in"], summary["rows_out"]) == (20, 8)
+        assert summary["rejected"] == {"name": 4, "email": 6, "salary": 1, "date": 1}
+
+        # CASE 2: Testing the modes which need the rows in pandas
+        assert not ETLProcessor(watermark_column="id").run_pushdown()
+        assert not ETLProcessor(load_method="upsert").run_pushdown()
+        assert mock_another_instance.execute.call_count == 1
+
+        # CASE 3: Testing a missing table and a failed statement
+        mock_another_instance.table_columns.return_value = []
+        assert not ETLProcessor().run_pushdown()
+        mock_another_instance.table_columns.return_value = ["id", "name"]
+        mock_another_instance.execute.side_effect = Exception("permission denied")
+        assert not ETLProcessor().run_pushdown()
@@ -0,0 +1,103 @@
+from file_sources import _rechunk, file_chunks, read_csv, read_json_array, read_ndjson
+import json
+import pandas as pd
+import pytest
+
+
+@pytest.fixture
+def records():
+    with open("test.json") as f:
+        return json.load(f)
+
+
+class TestMain():
+
+    def test_read_json_array(self, records):
+        expected = pd.json_normalize(records)
+        # Windows smaller than an object cut every object at least once
+        for block_size in (1, 7, 1 << 20):
+            chunks = list(read_json_array("test.json", 8, block_size))
+            assert [len(chunk) for chunk in chunks] == [8, 8, 4]
+            assert pd.concat(chunks, ignore_index=True).equals(expected)
+
+    def test_read_json_array_errors(self, tmp_path):
+        path = tmp_path / "dump.json"
+        path.write_text('{"id": 1}')
+        with pytest.raises(ValueError):
+            list(read_json_array(str(path), 10))
+
+        # CASE 2: Testing a cut file
+        path.write_text('[{"id": 1}, {"id": 2}')
+        with pytest.raises(ValueError):
+            list(read_json_array(str(path), 10))
+
+        # CASE 3: Testing an array of values which are not objects
+        path.write_text('[1, 2]')
+        with pytest.raises(ValueError):
+            list(read_json_array(str(path), 10))
+
+        # CASE 4: Testing empty files and arrays
+        path.write_text('')
+        assert list(read_json_array(str(path), 10)) == []
+        path.write_text(' [ ] ')
+        assert list(read_json_array(str(path), 10)) == []
+
+        # CASE 5: Testing invalid json stops the read at once, at its byte offset
+        text = '\ufeff[{"name": "Zoë"}, {"id": 3, x}, ' + '{"id": 4}, ' * 10000 + '{"id": 5}]'
+        path.write_bytes(text.encode("utf-8"))
+        reads = read_json_array(str(path), 10, block_size=16)
+        with pytest.raises(ValueError, match=f"at byte {text.encode('utf-8').index(b'x}')}"):
+            list(reads)
+
+    def test_read_json_array_cuts(self, tmp_path):
+        path = tmp_path / "dump.json"
+        records = [{"name": "Zo\u00eb \U0001f600", "quote": 'a"b\\c', "salary": -1.5e3, "ok": True, "none": None},
+                   {"name": "x" * 40, "ok": False, "id": 12345}]
+        path.write_text(json.dumps(records * 3))
+        expected = pd.json_normalize(records * 3)
+        # Every value is cut by some window
+        for block_size in range(1, 48):
+            assert next(read_json_array(str(path), 10, block_size)).equals(expected)
+
+    def test_nested(self, tmp_path):
+        path = tmp_path / "dump.json"
+        records = [{"id": 1, "address": {"city": "Pune"}}, {"id": 2, "address": None}]
+        path.write_text(json.dumps(records))
+        assert next(read_json_array(str(path), 10)).equals(pd.json_normalize(records))
+
+    def test_read_ndjson(self, tmp_path, records):
+        path = tmp_path / "dump.ndjson"
+        path.write_text("\n".join(json.dumps(record) for record in records) + "\n\n")
+        expected = pd.json_normalize(records)
+        for block_size in (1, 50, 1 << 20):
+            chunks = list(read_ndjson(str(path), 6, block_size))
+            assert [len(chunk) for chunk in chunks] == [6, 6, 6, 2]
+            assert [chunk.index[0] for chunk in chunks] == [0, 0, 0, 0]
+            assert pd.concat(chunks, ignore_index=True).equals(expected)
+
+    def test_read_csv(self, tmp_path):
+        path = tmp_path / "dump.csv"
+        pd.read_json("test.json", dtype=False).to_csv(path, index=False)
+        chunks = list(read_csv(str(path), 15))
+        assert [len(chunk) for chunk in chunks] == [15, 5]
+        data = pd.concat(chunks, ignore_index=True)
+        assert str(data["id"].dtype) == "Int64"
+        # Salaries stay text for their rule, even those written as numbers
+        assert data["salary"].dropna().map(type).eq(str).all()
+
+    def test_file_chunks(self, tmp_path, records):
+        ndjson = tmp_path / "dump.json"
+        ndjson.write_text("\n".join(json.dumps(record) for record in records))
+        assert sum(len(chunk) for chunk in file_chunks(str(ndjson), 7)) == 20
+        assert sum(len(chunk) for chunk in file_chunks("test.json", 7)) == 20
+        jsonl = tmp_path / "dump.jsonl"
+        jsonl.write_text(ndjson.read_text())
+        assert sum(len(chunk) for chunk in file_chunks(str(jsonl), 7)) == 20
+        with pytest.raises(ValueError):
+            file_chunks(str(tmp_path / "dump.xml"), 7)
+
+    def test_rechunk(self):
+        frames = [pd.DataFrame({"a": range(n)}) for n in (3, 0, 10, 1)]
+        chunks = list(_rechunk(frames, 4))
+        assert [len(chunk) for chunk in chunks] == [4, 4, 4, 2]
+        assert pd.concat(chunks)["a"].tolist() == [0, 1, 2] + list(range(10)) + [0]
@@ -0,0 +1,43 @@
+import os
+import subprocess
+import sys
+
+# Packages left to the code paths using them, import etl_processor must not
+# load them on top of what pandas loads itself (pandas 2.2 imports pyarrow
+# when it is installed)
+DEFERRED = ("pyarrow", "sqlalchemy", "dotenv", "psutil")
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def run(code: str, *args: str) -> subprocess.CompletedProcess:
+    """Runs python in a fresh process from another directory"""
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    return subprocess.run([sys.executable, *args, "-c", code], capture_output=True, text=True, check=True,
+                          cwd=os.path.dirname(ROOT), env=env)
+
+
+def imported_modules(module: str) -> list[str]:
+    """Modules an import of module loads on top of pandas, in a fresh process"""
+    code = f"import sys, pandas; before = set(sys.modules); import {module}; print(*sorted(set(sys.modules) - before))"
+    return run(code).stdout.split()
+
+
+class TestMain():
+
+    def test_no_side_effects(self):
+        out = run(
+            "import os, sys; cwd = os.getcwd(); environ = dict(os.environ); import etl_processor, main; "
+            "print(os.getcwd() == cwd, dict(os.environ) == environ, "
+            "[name for name in ('sqlalchemy', 'dotenv') if name in sys.modules])"
+        )
+        assert out.stdout.split() == ["True", "True", "[]"]
+
+        # CASE 2: Testing the cli parses its arguments before the heavy imports
+        out = subprocess.run([sys.executable, "-X", "importtime", os.path.join(ROOT, "main.py"), "--help"],
+                             capture_output=True, text=True, check=True)
+        assert "pandas" not in out.stderr
+
+    def test_deferred_imports(self):
+        modules = imported_modules("etl_processor")
+        assert "etl_processor" in modules
+        assert [name for name in modules if name.split(".")[0] in DEFERRED] == []
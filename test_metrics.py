@@ -0,0 +1,92 @@
+from metrics import Metrics, cprofile_hook
+import contextlib
+import json
+import os
+import pstats
+import pytest
+import threading
+
+
+class TestMain():
+
+    def test_stage(self):
+        metrics = Metrics()
+        with metrics.stage("transform", rows_in=10) as stage:
+            stage["rows_out"] = 7
+            stage["rejected"] = {"email": 3}
+        record = metrics.stages[0]
+        assert record["stage"] == "transform"
+        assert (record["rows_in"], record["rows_out"], record["rejected"]) == (10, 7, {"email": 3})
+        assert record["seconds"] > 0
+        assert record["rows_per_sec"] == 10 / record["seconds"]
+        assert record["rss_start_mb"] > 0 and record["rss_end_mb"] > 0
+        assert record["process_peak_rss_mb"] >= record["rss_end_mb"]
+
+        # CASE 2: Testing a failed stage is recorded and raised again
+        with pytest.raises(ValueError):
+            with metrics.stage("load"):
+                raise ValueError("failed")
+        assert metrics.stages[1]["error"] == "failed"
+
+    def test_trace_memory(self):
+        metrics = Metrics(trace_memory=True)
+        with metrics.stage("read"):
+            data = bytearray(8 << 20)
+        del data
+        assert metrics.stages[0]["peak_traced_mb"] >= 8
+
+    def test_hooks(self, tmp_path):
+        calls = []
+
+        @contextlib.contextmanager
+        def hook(name):
+            calls.append(("enter", name))
+            yield
+            calls.append(("exit", name))
+
+        metrics = Metrics()
+        metrics.add_hook(hook)
+        metrics.add_hook(cprofile_hook(str(tmp_path)))
+        with metrics.stage("rule:email"):
+            calls.append(("run", "rule:email"))
+        assert calls == [("enter", "rule:email"), ("run", "rule:email"), ("exit", "rule:email")]
+        assert os.listdir(tmp_path) == ["rule_email.0.prof"]
+
+    def test_overlapping_profiles(self, tmp_path):
+        # Two stages on threads at once, as the loads of load_all, share the profiler
+        metrics = Metrics()
+        metrics.add_hook(cprofile_hook(str(tmp_path)))
+        barrier = threading.Barrier(2)
+
+        def load(name):
+            with metrics.stage(name):
+                barrier.wait(timeout=5)
+                sum(range(1000))
+                barrier.wait(timeout=5)
+
+        threads = [threading.Thread(target=load, args=(f"load:{table}",)) for table in ("processed", "outliers")]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert not any("error" in record for record in metrics.stages)
+        files = sorted(os.listdir(tmp_path))
+        assert [name.split(".")[0] for name in files] == ["load_outliers", "load_processed"]
+        for name in files:
+            assert pstats.Stats(str(tmp_path / name)).total_calls > 0
+
+    def test_to_json(self, tmp_path):
+        metrics = Metrics()
+        for rows in (10, 20):
+            with metrics.stage("transform", rows_in=rows) as stage:
+                stage["rows_out"] = rows - 1
+                stage["rejected"] = {"name": 1}
+        path = str(tmp_path / "metrics.json")
+        data = json.loads(metrics.to_json(path))
+        with open(path) as f:
+            assert json.load(f) == data
+        assert len(data["stages"]) == 2
+        summary = data["summary"]["transform"]
+        assert (summary["runs"], summary["rows_in"], summary["rows_out"]) == (2, 30, 28)
+        assert summary["rejected"] == {"name": 2}
+        assert summary["errors"] == 0
@@ -0,0 +1,94 @@
+from pipeline import Pipeline, PipelineError
+import pytest
+import threading
+
+
+class TestMain():
+
+    def test_run(self):
+        results = []
+        pipeline = Pipeline([("double", lambda x: x * 2), ("collect", results.append)])
+        assert pipeline.run(range(10)) == 10
+        assert results == [x * 2 for x in range(10)]
+
+        # CASE 2: Testing an empty source and a second run
+        assert pipeline.run([]) == 0
+        assert pipeline.run(iter([1])) == 1
+        assert results[-1] == 2
+
+    def test_bounded(self):
+        read = []
+        release = threading.Event()
+
+        def source():
+            for i in range(20):
+                read.append(i)
+                yield i
+
+        def slow(x):
+            release.wait(5)
+
+        pipeline = Pipeline([("first", lambda x: x), ("slow", slow)], queue_size=1)
+        thread = threading.Thread(target=pipeline.run, args=(source(),))
+        thread.start()
+        try:
+            # The reader waits on the full queues: one item per queue and stage, plus the one it holds
+            for _ in range(50):
+                if len(read) >= 5:
+                    break
+                threading.Event().wait(0.02)
+            threading.Event().wait(0.2)
+            assert len(read) == 5
+        finally:
+            release.set()
+            thread.join()
+        assert len(read) == 20
+
+    def test_stage_error(self):
+        closed = []
+        loaded = []
+
+        def source():
+            try:
+                for i in range(100):
+                    yield i
+            finally:
+                closed.append(True)
+
+        def transform(x):
+            if x == 3:
+                raise ValueError("bad item")
+            return x
+
+        with pytest.raises(PipelineError) as error:
+            Pipeline([("transform", transform), ("load", loaded.append)]).run(source())
+        assert (error.value.stage, error.value.position) == ("transform", 3)
+        assert isinstance(error.value.error, ValueError)
+        assert loaded == [0, 1, 2]
+        assert closed == [True]
+
+        # CASE 2: Testing a failure of the last stage
+        loaded = []
+
+        def load(x):
+            if x == 5:
+                raise ValueError("not loaded")
+            loaded.append(x)
+
+        with pytest.raises(PipelineError) as error:
+            Pipeline([("transform", lambda x: x), ("load", load)]).run(range(10))
+        assert (error.value.stage, error.value.position) == ("load", 5)
+        assert loaded == [0, 1, 2, 3, 4]
+
+    def test_read_error(self):
+        loaded = []
+
+        def source():
+            yield 0
+            yield 1
+            raise OSError("disk")
+
+        with pytest.raises(PipelineError) as error:
+            Pipeline([("load", loaded.append)]).run(source())
+        assert (error.value.stage, error.value.position) == ("read", 2)
+        assert "read failed on item 2" in str(error.value)
@@ -0,0 +1,100 @@
+from etl_processor import ETLProcessor
+from pushdown import RECTIFY_DATE_DDL, SQL_EMAIL_REGEX, pushdown_statement
+from validation import RULES, Rule
+import numpy as np
+import pandas as pd
+import pytest
+
+COLUMNS = ["id", "name", "email", "salary", "department", "join_date"]
+# Raw tables of the parity test, every column is text as in the dump
+PARITY_DDL = """
+drop schema if exists tmp cascade;
+create schema tmp;
+create table tmp.employees_raw (id bigint, name text, email text, salary text, department text, join_date text);
+create table tmp.employees_processed (id bigint, name text, email text, salary bigint, department text, join_date date);
+create table tmp.employees_unprocessed (id bigint, name text, email text, salary text, department text, join_date text, reason text);
+"""
+
+
+@pytest.fixture
+def render(mocker):
+    mocker.patch('psycopg2.extensions.quote_ident', side_effect=lambda name, conn: '"%s"' % name)
+    return lambda statement: statement.as_string(None)
+
+
+def dirty_frame(rows: int) -> pd.DataFrame:
+    """Raw rows mixing the edge cases of every rule"""
+    rng = np.random.default_rng(7)
+    names = np.array(["", None, "A", " ", "Bob"], dtype=object)
+    emails = np.array(["a@b.co", "A@B.CO", "a@b.c", ".a@b.co", "a.@b.co", "a@b.co|", "a@b.c|o", "a@-b.co", "a b@c.co",
+                       "", None, "_a@b.co", "a@b.co\n", "x%y@b.co", "ü@b.co", "z@y.abcdefg", "z@y.abcdefgh"]
+                      + [f"u{i}@d.com" for i in range(40)], dtype=object)
+    salaries = np.array(["5", "-5", "$1,000", "", None, "abc", "0", "1.5", "12e3", " 7 "], dtype=object)
+    dates = np.array(["2022-01-10", "10/01/2022", "2022/13/05", "2022--1-2", " 2022-1-2", "2022- 5- 1", "+5/06/2022",
+                      "1_0/06/2022", "2022-02-30", "2020-02-29", "1677-09-21", "1677-09-22", "2262-04-11", "2262-04-12",
+                      "12/12/12", "abc", "", None, "20220101", "5-6-2022-7", "2022-5", "2022-0-5", "13-05-2022",
+                      "2022-05-06T00", "2022/-1/5", "1900-02-29", "2022\t1\t2"], dtype=object)
+
+    def pick(values):
+        return values[rng.integers(0, len(values), rows)]
+
+    return pd.DataFrame({
+        "id": np.arange(1, rows + 1),
+        "name": pick(names),
+        "email": pick(emails),
+        "salary": pick(salaries),
+        "department": pick(np.array(["HR", "", None], dtype=object)),
+        "join_date": pick(dates),
+    })
+
+
+class TestMain():
+
+    def test_statement(self, render):
+        statement, params = pushdown_statement(COLUMNS)
+        query = render(statement)
+        assert query.startswith('with "etl_distinct_4" as (select etl_value, tmp.etl_rectify_date("etl_value")')
+        assert ('case when not "etl_ok_1" then 1 when not "etl_ok_2" or c."id" > "etl_first_2".etl_first then 2 '
+                'when not "etl_ok_3" then 3 when not "etl_ok_4" then 4 else 0 end') in query
+        assert 'min("id") as etl_first from etl_checked where "etl_ok_1" and "etl_ok_2" group by "email"' in query
+        assert ('insert into "tmp"."employees_processed" ("id", "name", "email", "salary", "department", "join_date") '
+                'select "id", "name", "email", "etl_clean_3", "department", "etl_clean_4" from etl_coded where etl_code = 0') in query
+        assert '(%(reasons)s::text[])[etl_code] from etl_coded where etl_code <> 0' in query
+        assert params == {"email_regex": SQL_EMAIL_REGEX, "reasons": [rule.reason for rule in RULES]}
+        assert SQL_EMAIL_REGEX == r"^(?:\y[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,7}\y)$"
+        assert "tmp.etl_rectify_date(d text)" in RECTIFY_DATE_DDL
+
+        # CASE 2: Testing missing columns are skipped, the codes stay the ones of RULES
+        query = render(pushdown_statement(["id", "name", "join_date"], order_column="id")[0])
+        assert "etl_ok_2" not in query and "etl_clean_3" not in query
+        assert 'case when not "etl_ok_1" then 1 when not "etl_ok_4" then 4 else 0 end' in query
+
+        # CASE 3: Testing rules without an SQL form
+        with pytest.raises(ValueError):
+            pushdown_statement(COLUMNS, rules=(Rule("other", "name", "Other", lambda values: (None, None)),))
+        with pytest.raises(ValueError):
+            pushdown_statement(["id", "department"])
+
+    def test_parity(self, tmp_path):
+        # Needs a PostgreSQL server, pgserver runs one from the test
+        pgserver = pytest.importorskip("pgserver")
+        sqlalchemy = pytest.importorskip("sqlalchemy")
+        server = pgserver.get_server(str(tmp_path / "pgdata"), cleanup_mode="stop")
+        engine = sqlalchemy.create_engine("postgresql+psycopg2://postgres@/postgres?host=" + str(tmp_path / "pgdata"))
+        for df in (pd.read_json("test.json", dtype=False), dirty_frame(5000)):
+            with engine.begin() as conn:
+                conn.exec_driver_sql(PARITY_DDL)
+            df.to_sql("employees_raw", engine, schema="tmp", if_exists="append", index=False)
+            e = ETLProcessor(engine=engine)
+            assert e.run_pushdown()
+            expected = ETLProcessor(pd.read_sql("select * from tmp.employees_raw order by id", engine))
+            expected.transform_data()
+            processed = pd.read_sql("select * from tmp.employees_processed order by id", engine)
+            assert processed["id"].tolist() == expected.df["id"].tolist()
+            assert processed["salary"].tolist() == expected.df["salary"].tolist()
+            assert processed["join_date"].astype(str).tolist() == expected.df["join_date"].dt.strftime("%Y-%m-%d").tolist()
+            outliers = pd.read_sql("select id, reason from tmp.employees_unprocessed order by id", engine)
+            assert outliers.values.tolist() == expected.outliers()[["id", "reason"]].values.tolist()
+            assert e.invalid_dates == expected.invalid_dates
+        engine.dispose()
+        server.cleanup()
@@ -0,0 +1,167 @@
+from validation import REASONS, check_email, clean_sal, clean_salary, evaluate_rules, evaluate_rules_parallel, rectify_date, rectify_dates, transform_pool, valid_email_mask
+from datetime import datetime
+from email_index import EmailIndex
+import validation
+import pyarrow
+import pandas as pd
+import numpy as np
+
+
+class TestMain():
+
+    def test_valid_email_mask(self):
+        emails = [
+            "apple.me@gmail.com",
+            "apple.megmail.com",
+            "apple.me@gmail.",
+            "apple.me@gmailcom",
+            "@gmail.com",
+            "",
+            None,
+            ".apple@gmail.com",
+            "apple@gmail.c|m",
+            "apple@gmail.co|",
+            "apple@gmail.comcomcom",
+            "APPLE_1+x@sub.domain.org",
+            " apple@gmail.com",
+            "sarah.brown@webmail",
+        ]
+        mask = valid_email_mask(pd.Series(emails))
+        assert mask.tolist() == [check_email(x) for x in emails]
+
+        # CASE 2: Testing values which are not strings
+        mask = valid_email_mask(pd.Series([None, np.nan, 12, "a@b.com"]))
+        assert mask.tolist() == [False, False, False, True]
+
+        # CASE 3: Testing empty and non string columns
+        assert valid_email_mask(pd.Series([], dtype=object)).tolist() == []
+        assert valid_email_mask(pd.Series([np.nan, np.nan])).tolist() == [False, False]
+
+    def test_valid_email_mask_without_pyarrow(self, mocker):
+        mocker.patch.object(validation, "has_pyarrow", return_value=False)
+        emails = ["apple.me@gmail.com", "", None, 12, "@gmail.com", "a@b.c|m"]
+        mask = valid_email_mask(pd.Series(emails))
+        assert mask.tolist() == [True, False, False, False, False, True]
+
+    def test_clean_salary(self):
+        salaries = ["200", "-200000", "200UST", "UST100", "asdasd", None, "", "abc123", "007", "1,000.50", "\u0663\u0664"]
+        cleaned = clean_salary(pd.Series(salaries))
+        assert cleaned.dtype == np.int64
+        assert cleaned.tolist() == [clean_sal(x) for x in salaries]
+
+        # CASE 2: Testing empty column
+        assert clean_salary(pd.Series([], dtype=object)).tolist() == []
+
+    def test_clean_salary_without_pyarrow(self, mocker):
+        mocker.patch.object(validation, "has_pyarrow", return_value=False)
+        salaries = ["200", "-200000", "UST100", None, "", np.nan, "abc123"]
+        cleaned = clean_salary(pd.Series(salaries))
+        assert cleaned.dtype == np.int64
+        assert cleaned.tolist() == [200, 200000, 100, 0, 0, 0, 123]
+
+    def test_rectify_dates(self):
+        dates = [
+            "2022-02-20", "2022/02/20", "2022.02.20", "20-02-2022", "20/02/2022",
+            "02-20-2022", "2022-20-02", "2022-02-30", "2022-15-01", "12-30-2021",
+            "20220510", "2022-02", "2022-02/20", "2022-02-20T00", "", None,
+            "2022-02-20-05", "5-2022-20", "2022-02-20",
+        ]
+        rectified = rectify_dates(pd.Series(dates))
+        assert rectified.dtype == "datetime64[ns]"
+        expected = [rectify_date(x) for x in dates]
+        assert [None if pd.isna(x) else x.to_pydatetime() for x in rectified] == expected
+        assert rectified[0] == datetime(2022, 2, 20)
+        assert rectified[6] == datetime(2022, 2, 20)
+        assert pd.isna(rectified[7])
+
+        # CASE 2: Testing dates out of the datetime64 range and non strings
+        rectified = rectify_dates(pd.Series(["1500-01-01", datetime(2022, 2, 20)]))
+        assert pd.isna(rectified[0])
+        assert rectified[1] == datetime(2022, 2, 20)
+
+    def test_evaluate_rules(self):
+        df = pd.DataFrame({
+            "name": ["a", "", "b", "c", "d", "e", "f"],
+            "email": ["a@b.com", "x@y.com", "x@y.com", "a@b.com", "bad", "f@g.com", "h@i.com"],
+            "salary": ["10", "10", "-10", "10", "10", "abc", "10"],
+            "join_date": ["2022-01-01", "2022-01-01", "2022-01-01", "2022-01-01", "2022-01-01", "2022-01-01", "2022-02-30"],
+        })
+        cleaned, codes = evaluate_rules(df)
+        # The duplicated email of the empty name row doesn't count, first reason wins
+        assert codes.tolist() == [0, 1, 0, 2, 2, 3, 4]
+        assert REASONS[codes].tolist() == [
+            "", "Empty Name", "", "Invalid or Duplicated Email", "Invalid or Duplicated Email",
+            "Invalid Salary or less than 0 value", "Invalid Date format",
+        ]
+        assert cleaned["salary"].tolist() == [10, 10, 10, 10, 10, 0, 10]
+        assert cleaned["join_date"][0] == datetime(2022, 1, 1)
+
+        # CASE 2: Testing missing columns are skipped
+        cleaned, codes = evaluate_rules(df[["name"]])
+        assert codes.tolist() == [0, 1, 0, 0, 0, 0, 0]
+
+    def test_evaluate_rules_parallel(self, mocker):
+        mocker.patch("validation.PARALLEL_ROWS_MIN", 5)
+        mocker.patch("os.cpu_count", return_value=4)
+        df = pd.read_json("test.json", dtype=False)
+        df = pd.concat([df, df], ignore_index=True)
+        cleaned, codes = evaluate_rules(df)
+        parallel_cleaned, parallel_codes = evaluate_rules_parallel(df, 3)
+        assert parallel_codes.tolist() == codes.tolist()
+        assert parallel_cleaned.equals(cleaned)
+        # The second copy of every email is a duplicate, the first one is kept
+        assert (codes[len(df) // 2:] != 0).all()
+
+        # CASE 2: Testing small frames and single cores stay in process
+        pool = mocker.patch("validation.ProcessPoolExecutor")
+        evaluate_rules_parallel(df[:4], 3)
+        mocker.patch("os.cpu_count", return_value=1)
+        assert evaluate_rules_parallel(df, 3)[1].tolist() == codes.tolist()
+        pool.assert_not_called()
+        mocker.patch("os.cpu_count", return_value=4)
+
+        # CASE 3: Testing the rows are partitioned by email, each email in one partition
+        mocker.patch("validation.PARALLEL_ROWS_MIN", 15)
+        shared = mocker.Mock()
+        shared.map.side_effect = map
+        parallel_cleaned, parallel_codes = evaluate_rules_parallel(df, 3, pool=shared)
+        assert parallel_codes.tolist() == codes.tolist()
+        sent = shared.map.call_args.args[1]
+        assert sum(len(part) for part in sent) == len(df)
+        emails = [set(part["email"].dropna()) for part in sent]
+        assert sum(len(part) for part in emails) == len(set.union(*emails))
+        pool.assert_not_called()
+        # Only the rule columns are sent, the strings as Arrow strings
+        assert list(sent[0]) == ["name", "email", "salary", "join_date"]
+        assert (sent[0].dtypes == "string[pyarrow]").all()
+
+        # CASE 4: Testing the index is looked up for the emails kept by the workers
+        with EmailIndex() as index:
+            index.add(["john.doe@example.com"])
+            cleaned, codes = evaluate_rules(df, index=index)
+            assert evaluate_rules_parallel(df, 3, index=index, pool=shared)[1].tolist() == codes.tolist()
+
+        # CASE 5: Testing a pool started for several frames
+        mocker.stop(pool)
+        with transform_pool(2) as started:
+            for frame in (df, df[:20], df.assign(email=[12] + df["email"].tolist()[1:])):
+                assert evaluate_rules_parallel(frame, 2, pool=started)[1].tolist() == evaluate_rules(frame)[1].tolist()
+
+    def test_arrow_columns(self):
+        emails = pd.Series(["apple.me@gmail.com", "", None, "bad"], dtype="string[pyarrow]")
+        arrow_emails = emails.astype(pd.ArrowDtype(pyarrow.string()))
+        assert valid_email_mask(arrow_emails).tolist() == valid_email_mask(emails).tolist() == [True, False, False, False]
+        salaries = pd.Series(["200UST", None, "-10", "abc", "٣٠"], dtype=pd.ArrowDtype(pyarrow.string()))
+        assert clean_salary(salaries).tolist() == [200, 0, 10, 0, 30]
+
+    def test_evaluate_rules_index(self):
+        df = pd.read_json("test.json", dtype=False)
+        _, codes = evaluate_rules(df)
+        with EmailIndex() as index:
+            index.add(df["email"][codes == 0].iloc[:2])
+            _, indexed = evaluate_rules(df, index=index)
+        changed = np.flatnonzero(indexed != codes)
+        # Only the two emails already in the index turn into duplicates
+        assert len(changed) == 2
+        assert (indexed[changed] == 2).all()
+        assert REASONS[2] == "Invalid or Duplicated Email"
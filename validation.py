@@ -0,0 +1,544 @@
+import pandas as pd
+import numpy as np
+import datetime
+import functools
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, NamedTuple
+
+from dtype_plan import has_pyarrow
+from email_index import EmailIndex
+
+EMAIL_REGEX = re.compile(r"\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,7}\b")
+
+
+def check_email(x: str | None) -> bool:
+    """Checks a string if it is passing email logic using regex
+
+    Args:
+        x (str | None): Email to be tested
+
+    Returns:
+        bool: True if email, else False
+    """
+    if x:
+        return EMAIL_REGEX.fullmatch(x) is not None
+    return False
+
+
+def valid_email_mask(emails: pd.Series) -> np.ndarray:
+    """Vectorized version of check_email over a whole column
+
+    With pyarrow installed the column is matched by the Arrow regex kernel in
+    a single call, otherwise the precompiled regex is run over the values.
+    EMAIL_REGEX only uses ascii classes, so both engines agree with
+    check_email. None, NaN, empty strings and non string values are all
+    invalid.
+
+    Args:
+        emails (pd.Series): Emails to be tested
+
+    Returns:
+        np.ndarray: Boolean mask, True where the email is valid
+    """
+    n = len(emails)
+    if pd.api.types.is_string_dtype(emails.dtype) and not pd.api.types.is_object_dtype(emails.dtype):
+        strings = emails
+    else:
+        values = emails.to_numpy(dtype=object)
+        if pd.api.types.infer_dtype(values, skipna=True) not in ("string", "empty"):
+            is_str = np.fromiter((isinstance(x, str) for x in values), dtype=bool, count=n)
+            values = np.where(is_str, values, None)
+        strings = pd.Series(values, index=emails.index, dtype=object)
+    if not has_pyarrow():
+        return np.fromiter(
+            (check_email(x) if isinstance(x, str) else False for x in strings.to_numpy(dtype=object)),
+            dtype=bool,
+            count=n,
+        )
+    if not _is_arrow_string(strings.dtype):
+        strings = strings.astype("string[pyarrow]")
+    return strings.str.fullmatch(EMAIL_REGEX.pattern).to_numpy(dtype=bool, na_value=False)
+
+
+def _is_arrow_string(dtype) -> bool:
+    """Whether the dtype already holds Arrow strings, which the Arrow kernels take as they are"""
+    if isinstance(dtype, pd.ArrowDtype):
+        import pyarrow
+        return pyarrow.types.is_string(dtype.pyarrow_dtype) or pyarrow.types.is_large_string(dtype.pyarrow_dtype)
+    return dtype == "string[pyarrow]"
+
+
+def clean_sal(x: str | None) -> int:
+    """Cleaning the salary string by extracting just the number
+
+    Args:
+        x (str | None): string which needs cleaning
+
+    Returns:
+        int: salary if there's a number, or 0
+    """
+    if x:
+        return int(re.sub(r"[^\d]+", "", x) or "0")
+    return 0
+
+
+def clean_salary(salaries: pd.Series) -> np.ndarray:
+    """Vectorized version of clean_sal over a whole column
+
+    Non digits are stripped by one regex replace over the column and the
+    digits are cast to int64 in bulk. Missing values and values without any
+    digit become 0, other values are read through their string form. With
+    pyarrow the replace runs in the Arrow kernel, whose \\d is ascii only, so
+    the rare rows with non ascii characters go through clean_sal.
+
+    Args:
+        salaries (pd.Series): Salaries to be cleaned
+
+    Returns:
+        np.ndarray: int64 salaries
+    """
+    if salaries.empty:
+        return np.zeros(0, dtype=np.int64)
+    if not has_pyarrow():
+        strings = salaries.where(salaries.notna(), "").astype(str)
+        digits = strings.str.replace(r"[^\d]+", "", regex=True)
+        return digits.mask(digits == "", "0").astype(np.int64).to_numpy()
+    if not _is_arrow_string(salaries.dtype):
+        salaries = salaries.astype("string[pyarrow]")
+    strings = salaries.fillna("")
+    digits = strings.str.replace(r"[^0-9]+", "", regex=True)
+    cleaned = digits.mask(digits == "", "0").astype("int64[pyarrow]").to_numpy(dtype=np.int64, copy=True)
+    non_ascii = strings.str.contains(r"[^\x00-\x7f]", regex=True).to_numpy(dtype=bool)
+    if non_ascii.any():
+        cleaned[non_ascii] = [clean_sal(x) for x in strings[non_ascii]]
+    return cleaned
+
+
+DATE_CACHE_SIZE = 65536
+# Day, month and year on both sides of a single repeated separator. The two
+# short parts are read as month then day, unless the first one can't be a
+# month, the same way rectify_date does.
+_YEAR_FIRST = re.compile(r"^(?P<year>\d{4})(?P<sep>[^0-9])(?P<first>\d{1,2})(?P=sep)(?P<second>\d{1,2})$")
+_YEAR_LAST = re.compile(r"^(?P<first>\d{1,2})(?P<sep>[^0-9])(?P<second>\d{1,2})(?P=sep)(?P<year>\d{4})$")
+
+
+@functools.lru_cache(maxsize=DATE_CACHE_SIZE)
+def rectify_date(d: str | None) -> datetime.datetime | None:
+    """This function converts any format of datetime consisting of yyyy, mm, dd into proper universal yyyy-mm-dd
+
+    Results are memoized in a bounded cache, join dates repeat a lot.
+
+    Args:
+        d (str | None): the string which needs to be rectify
+
+    Returns:
+        datetime.datetime | None: Datetime parsed object or None if error
+    """
+    if not d:
+        return None
+    sep = re.findall(r"[^0-9]", d)
+    if not sep:
+        return None
+    y = 0
+    m = 0
+    dd = 0
+    try:
+        for i in d.split(sep[0]):
+            if len(i) == 4 and y == 0:
+                y = int(i)
+            elif int(i) < 13 and m == 0:
+                m = int(i)
+            else:
+                dd = int(i)
+        return datetime.datetime(y, m, dd)
+    except ValueError:
+        return None
+
+
+def _parse_known_formats(values: pd.Series) -> pd.Series:
+    """Parses the yyyy?mm?dd and mm?dd?yyyy like values in bulk
+
+    Args:
+        values (pd.Series): distinct raw dates as strings
+
+    Returns:
+        pd.Series: datetime64 dates, NaT where the format is not a known one
+    """
+    parsed = pd.Series(pd.NaT, index=values.index, dtype="datetime64[ns]")
+    for pattern in (_YEAR_FIRST, _YEAR_LAST):
+        parts = values.str.extract(pattern).dropna()
+        if parts.empty:
+            continue
+        first = parts["first"].astype(np.int64)
+        second = parts["second"].astype(np.int64)
+        month_first = first < 13
+        parsed[parts.index] = pd.to_datetime(
+            pd.DataFrame({
+                "year": parts["year"].astype(np.int64),
+                "month": first.where(month_first, second),
+                "day": second.where(month_first, first),
+            }),
+            errors="coerce",
+        )
+        values = values.drop(parts.index)
+    return parsed
+
+
+def rectify_dates(dates: pd.Series) -> pd.Series:
+    """Vectorized version of rectify_date over a whole column
+
+    Join dates have very few distinct values, so every distinct value is
+    parsed only once and mapped back to the rows. Values in the common
+    formats are parsed in bulk, the other ones go through the memoized
+    rectify_date. Dates and datetimes are kept as they are, other values
+    which are not strings are read through their string form. Dates out of
+    the datetime64 range are invalid.
+
+    Args:
+        dates (pd.Series): Raw dates to be rectified
+
+    Returns:
+        pd.Series: datetime64 dates, NaT where the date is invalid
+    """
+    codes, uniques = pd.factorize(dates)
+    uniques = pd.Series(
+        [
+            x if isinstance(x, str)
+            else x.strftime("%Y-%m-%d") if isinstance(x, datetime.date)
+            else str(x)
+            for x in uniques
+        ],
+        dtype=object,
+    )
+    parsed = _parse_known_formats(uniques)
+    rest = parsed.isna()
+    if rest.any():
+        parsed[rest] = pd.to_datetime(
+            [rectify_date(x) for x in uniques[rest]], errors="coerce"
+        )
+    values = parsed.to_numpy(dtype="datetime64[ns]")
+    result = np.full(len(codes), np.datetime64("NaT"), dtype="datetime64[ns]")
+    result[codes >= 0] = values[codes[codes >= 0]]
+    return pd.Series(result, index=dates.index)
+
+
+class Rule(NamedTuple):
+    """A validation rule of the employees table
+
+    check only looks at each row on its own, it returns the mask of the rows
+    passing the rule and the cleaned column, or None when the column is kept
+    as it is. A unique rule also rejects the values already seen among the
+    rows which passed every previous rule, the first one wins, and the
+    values already in the index of earlier chunks or runs when one is given.
+    """
+    name: str
+    column: str
+    reason: str
+    check: Callable[[pd.Series], tuple[np.ndarray, pd.Series | np.ndarray | None]]
+    unique: bool = False
+
+    def settle(self, values: pd.Series, mask: np.ndarray, passed: np.ndarray, index: EmailIndex | None = None) -> np.ndarray:
+        """Applies the uniqueness of the rule on top of the mask of check
+
+        Args:
+            values (pd.Series): rule column
+            mask (np.ndarray): mask returned by check
+            passed (np.ndarray): mask of the rows which passed every previous rule
+            index (EmailIndex | None, optional): values kept by earlier chunks or runs,
+                only looked up. Defaults to None.
+
+        Returns:
+            np.ndarray: mask of the rows passing the rule
+        """
+        if not self.unique:
+            return mask
+        candidates = passed & mask
+        duplicated = np.zeros(len(values), dtype=bool)
+        duplicated[candidates] = values[candidates].duplicated().to_numpy()
+        if index is not None:
+            firsts = np.flatnonzero(candidates & ~duplicated)
+            duplicated[firsts] = index.contains(values.iloc[firsts])
+        return mask & ~duplicated
+
+    def evaluate(self, values: pd.Series, passed: np.ndarray,
+                 index: EmailIndex | None = None) -> tuple[np.ndarray, pd.Series | np.ndarray | None]:
+        """Runs check and settle
+
+        Args:
+            values (pd.Series): rule column
+            passed (np.ndarray): mask of the rows which passed every previous rule
+            index (EmailIndex | None, optional): see settle. Defaults to None.
+
+        Returns:
+            tuple[np.ndarray, pd.Series | np.ndarray | None]: mask of the rows passing the rule and the cleaned column
+        """
+        mask, cleaned = self.check(values)
+        return self.settle(values, mask, passed, index), cleaned
+
+
+def _check_name(names: pd.Series) -> tuple[np.ndarray, None]:
+    """Name must not be empty"""
+    return (names.notna() & (names != "")).to_numpy(dtype=bool, na_value=False), None
+
+
+def _check_email(emails: pd.Series) -> tuple[np.ndarray, None]:
+    """Email must be valid"""
+    return valid_email_mask(emails), None
+
+
+def _check_salary(salaries: pd.Series) -> tuple[np.ndarray, np.ndarray]:
+    """Salary is cleaned to a number which must be positive"""
+    salary = clean_salary(salaries)
+    return salary > 0, salary
+
+
+def _check_date(dates: pd.Series) -> tuple[np.ndarray, pd.Series]:
+    """Join date must be rectified to a valid date"""
+    rectified = rectify_dates(dates)
+    return rectified.notna().to_numpy(), rectified
+
+
+NAME_RULE = Rule("name", "name", "Empty Name", _check_name)
+EMAIL_RULE = Rule("email", "email", "Invalid or Duplicated Email", _check_email, unique=True)
+SALARY_RULE = Rule("salary", "salary", "Invalid Salary or less than 0 value", _check_salary)
+DATE_RULE = Rule("date", "join_date", "Invalid Date format", _check_date)
+# In order, a row is rejected with the reason of the first rule it fails
+RULES = (NAME_RULE, EMAIL_RULE, SALARY_RULE, DATE_RULE)
+# Reason of every rule code, code 0 means the row passed every rule
+REASONS = np.array([""] + [rule.reason for rule in RULES], dtype=object)
+# Version of what the rules reject and clean, bump it with any change of a
+# rule so that the checkpoints of the older rules are not reused
+RULE_VERSION = 1
+# Smaller frames cost more in pickling than they gain in parallel
+PARALLEL_ROWS_MIN = 50_000
+
+
+def _codes(df: pd.DataFrame, rules: tuple[Rule, ...], checked: list,
+           index: EmailIndex | None = None) -> tuple[np.ndarray, dict]:
+    """Turns the per rule results of check into the codes of the first failed rule
+
+    Args:
+        df (pd.DataFrame): Raw frame
+        rules (tuple[Rule, ...]): Rules in order
+        checked (list): per rule the result of check, None if the column is missing
+        index (EmailIndex | None, optional): see Rule.settle. Defaults to None.
+
+    Returns:
+        tuple[np.ndarray, dict]: per row the 1 based index of the first failed
+            rule or 0, and the cleaned columns by name
+    """
+    codes = np.zeros(len(df), dtype=np.uint8)
+    cleaned = {}
+    for code, (rule, result) in enumerate(zip(rules, checked), start=1):
+        if result is None:
+            continue
+        mask, values = result
+        passed = codes == 0
+        mask = rule.settle(df[rule.column], mask, passed, index)
+        codes[passed & ~mask] = code
+        if values is not None:
+            cleaned[rule.column] = values
+    return codes, cleaned
+
+
+def _with_cleaned(df: pd.DataFrame, cleaned: dict) -> pd.DataFrame:
+    """Frame with the cleaned columns replaced, the others are shared with df
+    instead of copied as assign would
+    """
+    out = df.copy(deep=False)
+    for column, values in cleaned.items():
+        out[column] = values
+    return out
+
+
+def _rule_columns(df: pd.DataFrame, rules: tuple[Rule, ...]) -> pd.DataFrame:
+    """Columns of the frame the rules look at, the ones sent to the workers
+
+    Columns of plain strings are sent as Arrow strings, pickled as a few
+    buffers instead of one object per value, which the checks take as they
+    are.
+
+    Args:
+        df (pd.DataFrame): Raw frame
+        rules (tuple[Rule, ...]): Rules in order
+
+    Returns:
+        pd.DataFrame: the rule columns
+    """
+    columns = {}
+    for rule in rules:
+        if rule.column not in df or rule.column in columns:
+            continue
+        values = df[rule.column]
+        if (has_pyarrow() and pd.api.types.is_object_dtype(values.dtype)
+                and pd.api.types.infer_dtype(values, skipna=True) in ("string", "empty")):
+            values = values.astype("string[pyarrow]")
+        columns[rule.column] = values
+    return pd.DataFrame(columns, index=df.index)
+
+
+def _partition_keys(values: pd.Series, partitions: int) -> np.ndarray:
+    """Partition of every row, equal values always land in the same one
+
+    Arrow strings are hashed from their length and four of their bytes, read
+    straight from the Arrow buffers, which is about 20 times faster than
+    hashing every value. Other columns are factorized.
+
+    Args:
+        values (pd.Series): column of a unique rule
+        partitions (int): Number of partitions
+
+    Returns:
+        np.ndarray: partition of every row
+    """
+    if not _is_arrow_string(values.dtype):
+        return pd.factorize(values)[0] % partitions
+    import pyarrow
+    array = pyarrow.array(values.array)
+    if isinstance(array, pyarrow.ChunkedArray):
+        array = array.combine_chunks()
+    _, offsets, data = array.buffers()
+    width = np.int64 if pyarrow.types.is_large_string(array.type) else np.int32
+    offsets = np.frombuffer(offsets, dtype=width)[array.offset:array.offset + len(array) + 1]
+    data = np.frombuffer(data, dtype=np.uint8) if data is not None and data.size else np.zeros(1, dtype=np.uint8)
+    start = offsets[:-1]
+    length = offsets[1:] - start
+    key = length.astype(np.uint32)
+    for eighth in (1, 3, 5, 7):
+        at = np.minimum(start + length * eighth // 8, len(data) - 1)
+        key = key * np.uint32(16777619) ^ data[at]
+    return key % np.uint32(partitions)
+
+
+def _evaluate_partition(df: pd.DataFrame, rules: tuple[Rule, ...]) -> tuple[np.ndarray, dict]:
+    """Runs every rule over one partition, in a worker process
+
+    Every row of a value of the unique rules is in the partition, in the
+    order of the frame, so the first one kept is the first one of the frame.
+
+    Args:
+        df (pd.DataFrame): partition of the rule columns
+        rules (tuple[Rule, ...]): Rules in order
+
+    Returns:
+        tuple[np.ndarray, dict]: codes of the rows, see evaluate_rules, and the cleaned columns as numpy arrays
+    """
+    checked = [rule.check(df[rule.column]) if rule.column in df else None for rule in rules]
+    codes, cleaned = _codes(df, rules, checked)
+    return codes, {column: np.asarray(values) for column, values in cleaned.items()}
+
+
+def usable_workers(workers: int) -> int:
+    """Transform workers worth starting, at most one per core: on fewer cores
+    the partitions only add pickling to the same work
+
+    Args:
+        workers (int): Number of worker processes asked for
+
+    Returns:
+        int: Number of worker processes to start
+    """
+    return min(workers, os.cpu_count() or 1)
+
+
+def evaluate_rules(df: pd.DataFrame, rules: tuple[Rule, ...] = RULES,
+                   index: EmailIndex | None = None) -> tuple[pd.DataFrame, np.ndarray]:
+    """Runs every rule once over the whole frame
+
+    Rules whose column is missing are skipped.
+
+    Args:
+        df (pd.DataFrame): Raw frame
+        rules (tuple[Rule, ...], optional): Rules in order. Defaults to RULES.
+        index (EmailIndex | None, optional): values of the unique rules kept by earlier
+            chunks or runs, see email_index.EmailIndex. Defaults to None.
+
+    Returns:
+        tuple[pd.DataFrame, np.ndarray]: Frame with the cleaned columns, and
+            per row the 1 based index of the first failed rule or 0
+    """
+    checked = [rule.check(df[rule.column]) if rule.column in df else None for rule in rules]
+    codes, cleaned = _codes(df, rules, checked, index)
+    return _with_cleaned(df, cleaned), codes
+
+
+def transform_pool(workers: int) -> ProcessPoolExecutor:
+    """Process pool of evaluate_rules_parallel, to be reused across frames
+
+    The workers are started from a fork server, or spawned where there is
+    none, never forked from a caller which may be running other threads.
+
+    Args:
+        workers (int): Number of worker processes
+
+    Returns:
+        ProcessPoolExecutor: pool, shut down by the caller
+    """
+    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(method))
+
+
+def evaluate_rules_parallel(df: pd.DataFrame, workers: int, rules: tuple[Rule, ...] = RULES,
+                            index: EmailIndex | None = None,
+                            pool: ProcessPoolExecutor | None = None) -> tuple[pd.DataFrame, np.ndarray]:
+    """Same as evaluate_rules with the rules spread over a process pool
+
+    The rows are partitioned by a hash of the column of the unique rule, one
+    partition per worker, so every worker settles uniqueness for its own
+    values and sends back only the codes and the cleaned columns. Emails
+    kept by the workers are then looked up in the index in the caller.
+    Frames too small to be worth it, and machines with a single core, are
+    evaluated in process.
+
+    Scaling stays sublinear: converting object strings to Arrow, see
+    _rule_columns, partitioning and assembling the result stay in the
+    caller. At 10^6 rows that takes about 0.3s for a frame read with
+    arrow=True and 0.8s for object columns, against 0.8s and 1.25s for the
+    whole of evaluate_rules, so object frames only gain from about 8 cores.
+
+    Args:
+        df (pd.DataFrame): Raw frame
+        workers (int): Number of worker processes, at most one per core is used
+        rules (tuple[Rule, ...], optional): Rules in order. Defaults to RULES.
+        index (EmailIndex | None, optional): see evaluate_rules. Defaults to None.
+        pool (ProcessPoolExecutor | None, optional): pool of worker processes, see
+            transform_pool. Defaults to None, a pool for this frame only.
+
+    Returns:
+        tuple[pd.DataFrame, np.ndarray]: see evaluate_rules
+    """
+    partitions = min(usable_workers(workers), len(df))
+    columns = _rule_columns(df, rules)
+    unique = [rule.column for rule in rules if rule.unique and rule.column in columns]
+    # Partitioned by one column, the values of a second one may be split
+    if partitions < 2 or len(df) < PARALLEL_ROWS_MIN or len(unique) > 1:
+        return evaluate_rules(df, rules, index)
+    if unique:
+        keys = _partition_keys(columns[unique[0]], partitions)
+        positions = [np.flatnonzero(keys == i) for i in range(partitions)]
+    else:
+        positions = np.array_split(np.arange(len(df)), partitions)
+    positions = [rows for rows in positions if len(rows)]
+    parts = [columns.take(rows) for rows in positions]
+    if pool is None:
+        with transform_pool(len(parts)) as pool:
+            results = list(pool.map(_evaluate_partition, parts, [rules] * len(parts)))
+    else:
+        results = list(pool.map(_evaluate_partition, parts, [rules] * len(parts)))
+    codes = np.empty(len(df), dtype=np.uint8)
+    cleaned = {}
+    for rows, (part_codes, part_cleaned) in zip(positions, results):
+        codes[rows] = part_codes
+        for column, values in part_cleaned.items():
+            if column not in cleaned:
+                cleaned[column] = np.empty(len(df), dtype=values.dtype)
+            cleaned[column][rows] = values
+    if index is not None:
+        for code, rule in enumerate(rules, start=1):
+            if rule.column in unique:
+                kept = np.flatnonzero((codes == 0) | (codes > code))
+                codes[kept[index.contains(df[rule.column].iloc[kept])]] = code
+    return _with_cleaned(df, cleaned), codes